@@ -0,0 +1,134 @@
+"""
+Reading many datagrams per wakeup.
+
+On Linux ``recvmmsg`` fills a whole batch of buffers in one syscall, Python doesn't
+expose it so it's called through ctypes. Elsewhere the socket is drained with
+``recv_into`` until it's empty, still one wakeup for the whole batch.
+"""
+
+import ctypes
+import errno
+import socket
+import sys
+from typing import List
+
+
+MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0x40)
+
+
+class _iovec(ctypes.Structure):
+    _fields_ = [
+        ('iov_base', ctypes.c_void_p),
+        ('iov_len', ctypes.c_size_t),
+    ]
+
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p),
+        ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.POINTER(_iovec)),
+        ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p),
+        ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int),
+    ]
+
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_hdr', _msghdr),
+        ('msg_len', ctypes.c_uint),
+    ]
+
+
+def _load_recvmmsg():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        recvmmsg = libc.recvmmsg
+    except (OSError, AttributeError):
+        return None
+
+    recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    recvmmsg.restype = ctypes.c_int
+    return recvmmsg
+
+
+_recvmmsg = _load_recvmmsg()
+has_recvmmsg = _recvmmsg is not None
+
+
+class BatchReceiver:
+    """Owns ``count`` preallocated buffers and reads up to that many datagrams into them at once.
+
+    The views returned by :meth:`recv` point into those buffers, they are
+    overwritten by the next call so everything has to be done with them before that.
+    """
+
+    def __init__(self, count: int = 32, size: int = 4096, *, use_recvmmsg: bool = True):
+        self.count = count
+        self.size = size
+        self._buffers = [bytearray(size) for _ in range(count)]
+        self._views = [memoryview(buffer) for buffer in self._buffers]
+
+        # counters, mostly for benchmarking
+        self.syscalls = 0
+        self.datagrams = 0
+
+        self._msgs = None
+        if use_recvmmsg and has_recvmmsg:
+            self._iovecs = (_iovec * count)()
+            self._msgs = (_mmsghdr * count)()
+            for index, buffer in enumerate(self._buffers):
+                self._iovecs[index].iov_base = ctypes.addressof((ctypes.c_char * size).from_buffer(buffer))
+                self._iovecs[index].iov_len = size
+                self._msgs[index].msg_hdr.msg_iov = ctypes.pointer(self._iovecs[index])
+                self._msgs[index].msg_hdr.msg_iovlen = 1
+            # indexing a ctypes array builds a new object every time, keep them around
+            self._msg_list = list(self._msgs)
+
+    @property
+    def uses_recvmmsg(self) -> bool:
+        return self._msgs is not None
+
+    def recv(self, sock: socket.socket) -> List[memoryview]:
+        """Reads whatever is pending, up to ``count`` datagrams, without blocking."""
+        if self._msgs is not None:
+            return self._recvmmsg(sock)
+        return self._recv_loop(sock)
+
+    def _recvmmsg(self, sock):
+        fd = sock.fileno()
+        while True:
+            self.syscalls += 1
+            received = _recvmmsg(fd, self._msgs, self.count, MSG_DONTWAIT, None)
+            if received >= 0:
+                break
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return []
+            if err != errno.EINTR:
+                raise OSError(err, 'recvmmsg failed')
+
+        self.datagrams += received
+        return [view[:msg.msg_len] for view, msg in zip(self._views[:received], self._msg_list)]
+
+    def _recv_loop(self, sock):
+        batch = []
+        for view in self._views:
+            self.syscalls += 1
+            try:
+                size = sock.recv_into(view)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                # hand over what was read, the error (ICMP noise most likely) is dropped
+                if batch:
+                    break
+                raise
+            batch.append(view[:size])
+
+        self.datagrams += len(batch)
+        return batch
@@ -0,0 +1,10 @@
+"""Micro-benchmarks for the receive path, run them as modules :
+
+python -m discordpyvoicemod.benchmarks.decrypt
+
+``suite`` runs all of the receive path, stage by stage, and can save and compare results :
+
+python -m discordpyvoicemod.benchmarks.suite --json results.json
+
+``ratelimit`` sends bursts of requests to a local stand-in of the API that rate limits like Discord.
+"""
@@ -0,0 +1,102 @@
+"""
+Receiving a flood of voice packets one datagram per wakeup versus in batches.
+
+A separate process floods a local UDP socket with encrypted packets, the receiving
+side runs the real transport, protocol and decrypt path into a ring buffer sink.
+Prints wakeups, syscalls and CPU time per packet for every mode.
+
+python -m discordpyvoicemod.benchmarks.batch_recv [packets] [batch size]
+"""
+
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+from ..batch_recv import BatchReceiver, has_recvmmsg
+from ..recieve_audio import PooledDatagramTransport, VoiceReceiveProtocol
+from ..sinks import RingBufferSink
+from .client import StubClient
+from .rtp import encrypt_packet
+
+
+MODE = "xsalsa20_poly1305_lite"
+
+
+def flood(address, key, count):
+    packets = [encrypt_packet(MODE, key, seq & 0xFFFF, ssrc=seq % 10) for seq in range(1000)]
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for index in range(count):
+        while True:
+            try:
+                sock.sendto(packets[index % 1000], address)
+                break
+            except BlockingIOError:
+                time.sleep(0)
+
+
+async def run(mode, key, count, batch_size):
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+    sock.bind(("127.0.0.1", 0))
+    sock.setblocking(False)
+
+    sink = RingBufferSink(1024)
+    client = StubClient(loop, MODE, key)
+    batch = None
+    if mode != "single":
+        batch = BatchReceiver(batch_size, use_recvmmsg=mode == "recvmmsg")
+
+    protocol = VoiceReceiveProtocol(client, sink.write, (), sink.write_batch if batch else None)
+    transport = PooledDatagramTransport(loop, sock, protocol, batch=batch)
+    sink.attach(client, transport)
+
+    # count wakeups
+    wakeups = 0
+    read_ready = transport._read_ready
+
+    def counting_read_ready():
+        nonlocal wakeups
+        wakeups += 1
+        read_ready()
+
+    transport._read_ready = counting_read_ready
+    await asyncio.sleep(0)
+    loop.remove_reader(sock.fileno())
+    loop.add_reader(sock.fileno(), counting_read_ready)
+
+    sender = multiprocessing.Process(target=flood, args=(sock.getsockname(), key, count))
+    cpu = time.process_time()
+    sender.start()
+
+    # until the sender is done and the socket is drained
+    received = -1
+    while sender.is_alive() or received != sink.dropped + len(sink):
+        received = sink.dropped + len(sink)
+        await asyncio.sleep(0.1)
+
+    cpu = time.process_time() - cpu
+    sender.join()
+    transport.close()
+    await asyncio.sleep(0)
+
+    syscalls = batch.syscalls if batch else received
+    print(
+        f"{mode:<10} received {received:>8,}/{count:,}  wakeups {wakeups:>8,}"
+        f"  syscalls/packet {syscalls / max(received, 1):.3f}"
+        f"  cpu/packet {cpu / max(received, 1) * 1e6:.2f}us"
+    )
+
+
+def main(count=200_000, batch_size=32):
+    key = os.urandom(32)
+    modes = ["single", "loop"] + (["recvmmsg"] if has_recvmmsg else [])
+    for mode in modes:
+        asyncio.run(run(mode, key, count, batch_size))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
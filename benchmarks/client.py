@@ -0,0 +1,19 @@
+"""
+A stand-in for a voice client, just what the receive path and the process pool read off one.
+"""
+
+from ..decryption import PacketDecryptor
+
+
+class StubClient:
+    """Decrypts with ``mode`` and ``key``, ``users`` maps SSRCs to user ids like a voice client that saw them speak."""
+
+    def __init__(self, loop, mode, key, users=None):
+        self.loop = loop
+        self.mode = mode
+        self.secret_key = list(key)
+        self._ssrc_users = dict(users) if users else {}
+        self._decryptor = PacketDecryptor(mode, self.secret_key)
+
+    def _get_decryptor(self):
+        return self._decryptor
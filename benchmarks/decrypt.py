@@ -0,0 +1,52 @@
+"""
+Packets per second the decrypt engine gets through, for every encryption mode.
+
+python -m discordpyvoicemod.benchmarks.decrypt [packets]
+"""
+
+import os
+import sys
+import time
+
+import nacl.secret
+
+from ..decryption import PacketDecryptor, has_aesgcm
+from .rtp import OPUS_FRAME, encrypt_packet
+
+
+def uncached_lite(key, packet):
+    """What every packet used to cost, a new SecretBox each time."""
+    box = nacl.secret.SecretBox(bytes(key))
+    nonce = bytearray(24)
+    nonce[:4] = packet[-4:]
+    return box.decrypt(bytes(packet[12:-4]), bytes(nonce))
+
+
+def measure(decrypt, packets):
+    start = time.perf_counter()
+    for packet in packets:
+        decrypt(packet)
+    return len(packets) / (time.perf_counter() - start)
+
+
+def main(count=50_000):
+    key = os.urandom(32)
+
+    for mode in PacketDecryptor.supported_modes:
+        if mode == "aead_aes256_gcm_rtpsize" and not has_aesgcm:
+            print(f"{mode:<34} skipped (cryptography is not installed)")
+            continue
+
+        packets = [encrypt_packet(mode, key, seq & 0xFFFF) for seq in range(count)]
+        decryptor = PacketDecryptor(mode, list(key))
+        assert decryptor.decrypt(packets[0]) == OPUS_FRAME
+
+        print(f"{mode:<34} {measure(decryptor.decrypt, packets):>12,.0f} packets/s")
+
+        if mode == "xsalsa20_poly1305_lite":
+            rate = measure(lambda packet: uncached_lite(key, packet), packets)
+            print(f"{'  (new SecretBox per packet)':<34} {rate:>12,.0f} packets/s")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,122 @@
+"""
+A Discord API stand-in on the loopback interface, rate limiting like the real one.
+
+Every route gets a bucket (shared by the routes with the same first path segment, split by
+the channel, guild or webhook id after it, like Discord's major parameters), with a window of ``limit`` requests every ``window``
+seconds, and there's a global limit on top. Responses carry the ``X-RateLimit-*`` headers,
+going over a limit gets a 429 like Discord sends (JSON body, ``Via`` header).
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+
+MAJOR_PARAMETERS = ("channels", "guilds", "webhooks")  # their id splits the bucket
+USER = {"id": "1", "username": "benchmark", "discriminator": "0", "avatar": None}
+
+
+def _json(data, *, status: int = 200, headers: Dict[str, str]) -> web.Response:
+    # discord.py only parses bodies whose content type is exactly this, no charset
+    return web.Response(body=json.dumps(data).encode(), status=status, headers={**headers, "Content-Type": "application/json"})
+
+
+class FakeDiscordAPI:
+    """Serves ``GET``/``POST`` on any path with an empty JSON object (``/users/@me`` gets a user).
+
+    Parameters
+    ----------
+    limit: :class:`int`
+        Requests per bucket window.
+    window: :class:`float`
+        Seconds a bucket window lasts, from its first request.
+    global_limit: :class:`int`
+        Requests per second over everything.
+    latency: :class:`float`
+        Seconds every response is held for, like a network round trip.
+    """
+
+    def __init__(self, *, limit: int = 5, window: float = 1.0, global_limit: int = 50, latency: float = 0.0):
+        self.limit = limit
+        self.window = window
+        self.global_limit = global_limit
+        self.latency = latency
+
+        self._buckets: Dict[Tuple[str, str], List[float]] = {}  # (hash, major) -> [window end, requests left]
+        self._global: List[float] = []  # when the requests of the last second came
+        self._runner: Optional[web.AppRunner] = None
+
+        self.served = 0
+        self.limited = 0
+        self.global_limited = 0
+
+    async def start(self) -> str:
+        """Starts serving, returns the base URL to set as ``discord.http.Route.BASE``."""
+        app = web.Application()
+        app.router.add_route("*", "/{path:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        return f"http://{host}:{port}/api/v10"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def _bucket(self, path: str) -> Tuple[str, str]:
+        parts = path.split("/")[3:]  # after /api/v10
+        name = parts[0] if parts else ""
+        major = parts[1] if len(parts) > 1 and name in MAJOR_PARAMETERS else ""
+        return hashlib.sha1(name.encode()).hexdigest()[:16], major
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        now = time.monotonic()
+
+        recent = self._global
+        while recent and recent[0] <= now - 1.0:
+            recent.pop(0)
+        if len(recent) >= self.global_limit:
+            self.limited += 1
+            self.global_limited += 1
+            retry_after = recent[0] + 1.0 - now
+            return _json(
+                {"message": "You are being rate limited.", "retry_after": retry_after, "global": True},
+                status=429,
+                headers={"Via": "1.1 google", "X-RateLimit-Global": "true", "Retry-After": str(retry_after)},
+            )
+
+        key = self._bucket(request.path)
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket[0] <= now:
+            bucket = self._buckets[key] = [now + self.window, self.limit]
+
+        headers = {
+            "Via": "1.1 google",
+            "X-RateLimit-Bucket": key[0],
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Reset": f"{time.time() + bucket[0] - now:.3f}",
+            "X-RateLimit-Reset-After": f"{bucket[0] - now:.3f}",
+        }
+        if bucket[1] <= 0:
+            self.limited += 1
+            headers["X-RateLimit-Remaining"] = "0"
+            headers["X-RateLimit-Scope"] = "user"
+            return _json(
+                {"message": "You are being rate limited.", "retry_after": bucket[0] - now, "global": False},
+                status=429,
+                headers=headers,
+            )
+
+        recent.append(now)
+        bucket[1] -= 1
+        self.served += 1
+        headers["X-RateLimit-Remaining"] = str(int(bucket[1]))
+        return _json(USER if request.path.endswith("/users/@me") else {}, headers=headers)
@@ -0,0 +1,67 @@
+"""
+What counting the receive path costs.
+
+Runs the same encrypted packets through the receive protocol, into a ring buffer sink,
+with and without metrics, best of a few rounds each, and prints the overhead.
+
+python -m discordpyvoicemod.benchmarks.metrics [packets]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+from ..metrics import ReceiveMetrics
+from ..recieve_audio import VoiceReceiveProtocol
+from ..sinks import RingBufferSink
+from .client import StubClient
+from .rtp import encrypt_packet
+
+
+MODE = "xsalsa20_poly1305_lite"
+ROUNDS = 15
+
+
+def measure(protocol, packets):
+    start = time.perf_counter()
+    for packet in packets:
+        protocol.datagram_received(packet, None)
+    return time.perf_counter() - start
+
+
+async def run(count):
+    key = os.urandom(32)
+    client = StubClient(asyncio.get_running_loop(), MODE, key)
+    # 10 speakers, each one's packets in order
+    packets = [encrypt_packet(MODE, key, (index // 10) & 0xFFFF, ssrc=index % 10) for index in range(count)]
+
+    sink = RingBufferSink(1024)
+
+    def handler(packet):
+        # what listen puts in front of the sink
+        if not packet.is_silence():
+            sink.write(packet)
+
+    metrics = ReceiveMetrics()
+    plain_protocol = VoiceReceiveProtocol(client, handler)
+    measured_protocol = VoiceReceiveProtocol(client, handler, metrics=metrics)
+
+    # taking turns, so whatever else the machine is doing hits both the same
+    plain = measured = float("inf")
+    for _ in range(ROUNDS):
+        plain = min(plain, measure(plain_protocol, packets))
+        measured = min(measured, measure(measured_protocol, packets))
+
+    print(f"plain     {count / plain:>10,.0f} packets/s")
+    print(f"metrics   {count / measured:>10,.0f} packets/s")
+    print(f"overhead  {(measured / plain - 1) * 100:.2f}%")
+    print(metrics.snapshot()["decrypt_latency"])
+
+
+def main(count=50_000):
+    asyncio.run(run(count))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
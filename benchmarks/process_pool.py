@@ -0,0 +1,94 @@
+"""
+Decrypting on the event loop versus in a pool of worker processes.
+
+Pushes encrypted packets from a few hundred speakers through a pool session the way
+``listen`` does and waits for all of them to come back. Prints packets per second and
+the event loop's CPU time per packet for every pool size up to the number of CPUs.
+
+python -m discordpyvoicemod.benchmarks.process_pool [packets]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+from ..decryption import PacketDecryptor
+from ..process_pool import ProcessPool
+from .client import StubClient
+from .rtp import encrypt_packet
+
+
+MODE = "xsalsa20_poly1305_lite"
+SPEAKERS = 300
+IN_FLIGHT = 8192
+
+
+async def run(workers, packets, key):
+    loop = asyncio.get_running_loop()
+    pool = ProcessPool(workers)
+    client = StubClient(loop, MODE, key)
+    received = 0
+
+    def emit(packet):
+        nonlocal received
+        received += 1
+
+    session = pool.open(client, emit)
+    # let the workers start up before timing them
+    session.push(packets[0])
+    while not received:
+        await asyncio.sleep(0.01)
+    received = 0
+
+    # the loop's own share : pushing packets in and handling what comes back
+    cpu = 0.0
+    results_ready = pool._results_ready
+
+    def timed_results_ready(index):
+        nonlocal cpu
+        start = time.process_time()
+        results_ready(index)
+        cpu += time.process_time() - start
+
+    for index, fd in enumerate(pool._done_fds):
+        loop.remove_reader(fd)
+        loop.add_reader(fd, timed_results_ready, index)
+
+    wall = time.perf_counter()
+    for start in range(0, len(packets), 256):
+        # like packets coming in at line rate, not all at once
+        while start - received > IN_FLIGHT:
+            await asyncio.sleep(0.0005)
+        pushed = time.process_time()
+        for packet in packets[start:start + 256]:
+            session.push(packet)
+        cpu += time.process_time() - pushed
+        await asyncio.sleep(0)
+    session.flush()
+    await session.drain()
+    wall = time.perf_counter() - wall
+
+    await pool.close()
+    print(
+        f"{workers:>2} workers  {received / wall:>10,.0f} packets/s"
+        f"  loop cpu/packet {cpu / max(received, 1) * 1e6:.2f}us  dropped {pool.dropped}"
+    )
+
+
+def main(count=200_000):
+    key = os.urandom(32)
+    packets = [encrypt_packet(MODE, key, seq & 0xFFFF, ssrc=seq % SPEAKERS) for seq in range(count)]
+
+    decryptor = PacketDecryptor(MODE, list(key))
+    start = time.perf_counter()
+    for packet in packets:
+        decryptor.decrypt(packet)
+    print(f"on the loop {count / (time.perf_counter() - start):>10,.0f} packets/s")
+
+    for workers in range(1, (os.cpu_count() or 1) + 1):
+        asyncio.run(run(workers, packets, key))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
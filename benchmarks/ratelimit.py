@@ -0,0 +1,99 @@
+"""
+Bursts of rate limited requests against the local API stand-in, with discord.py's own
+handling and then with the request scheduler (see the ``ratelimit`` module).
+
+python -m discordpyvoicemod.benchmarks.ratelimit [--latency SECONDS]
+
+Three kinds of requests go out at once : a lot on one channel, a few on each of many
+channels (more than the global limit allows in a second) and a handful on one more
+channel, to see if anyone gets starved. Reports the 429s the server sent, the requests that
+ran out of retries, how long every kind took and, with the scheduler, how long requests waited in its queues.
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from typing import Dict, List
+
+import discord
+from discord.http import HTTPClient, Route
+
+from ..user_client import NonBotHTTPClient
+from ..ratelimit import RequestScheduler
+from .http_server import FakeDiscordAPI
+
+
+def _workload():
+    """Kind of request -> routes to request, all sent at once."""
+    return {
+        "busy channel": [Route("GET", "/channels/{channel_id}/messages", channel_id=1) for _ in range(60)],
+        "many channels": [Route("GET", "/channels/{channel_id}/messages", channel_id=100 + index % 30) for index in range(150)],
+        "one more channel": [Route("GET", "/channels/{channel_id}", channel_id=2) for _ in range(5)],
+    }
+
+
+async def run(cls, options) -> Dict:
+    api = FakeDiscordAPI(limit=5, window=0.5, global_limit=50, latency=options.latency)
+    Route.BASE = await api.start()
+    http = cls(asyncio.get_running_loop())
+    if isinstance(http, NonBotHTTPClient):
+        http.scheduler = RequestScheduler(rate=45)
+    try:
+        await http.static_login("token")
+        api.limited = api.global_limited = 0
+
+        start = time.perf_counter()
+        done: Dict[str, List[float]] = {}
+
+        failed = 0
+
+        async def send(kind, route):
+            nonlocal failed
+            try:
+                await http.request(route)
+            except discord.HTTPException:
+                # out of retries
+                failed += 1
+            else:
+                done.setdefault(kind, []).append(time.perf_counter() - start)
+
+        await asyncio.gather(*(send(kind, route) for kind, routes in _workload().items() for route in routes))
+        result = {
+            "seconds": time.perf_counter() - start,
+            "429s": api.limited,
+            "global 429s": api.global_limited,
+            "failed": failed,
+            "kinds": {kind: sorted(times) for kind, times in done.items()},
+        }
+        if http.scheduler is not None:
+            scheduler = http.scheduler
+            result["queued"] = (scheduler.queued, scheduler.queue_time / max(1, scheduler.requests), scheduler.max_queue_time)
+        return result
+    finally:
+        await http.close()
+        await api.stop()
+
+
+def report(name, result):
+    print(f"{name}: {result['seconds']:.2f}s, {result['429s']} 429s ({result['global 429s']} global), {result['failed']} requests failed")
+    for kind, times in result["kinds"].items():
+        print(f"  {kind:<18} {len(times):>4} done, p50 {times[len(times) // 2]:.2f}s, last {times[-1]:.2f}s")
+    if "queued" in result:
+        queued, mean, longest = result["queued"]
+        print(f"  {queued} requests queued, {mean * 1000:.0f}ms on average, {longest * 1000:.0f}ms at most")
+
+
+async def main(options):
+    # every 429 gets a warning, they're counted instead
+    logging.getLogger("discord.http").setLevel(logging.ERROR)
+    logging.getLogger("discordpyvoicemod.user_client").setLevel(logging.ERROR)
+    HTTPClient.scheduler = None  # what apply() adds, for the stock client
+    report("discord.py", await run(HTTPClient, options))
+    report("scheduler", await run(NonBotHTTPClient, options))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the server holds every response for")
+    asyncio.run(main(parser.parse_args()))
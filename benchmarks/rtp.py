@@ -0,0 +1,139 @@
+"""
+Synthetic voice traffic : Opus frames in RTP packets, encrypted like a voice server would.
+
+Everything comes out of a seeded :class:`random.Random`, the same arguments give the same packets
+(except for the random nonces of ``xsalsa20_poly1305_suffix``).
+"""
+
+import os
+import random
+import struct
+from typing import List, Optional
+
+import nacl.secret
+
+from ..decryption import has_aesgcm
+from ..recieve_audio import SILENCE_FRAME
+
+if has_aesgcm:
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+
+OPUS_FRAME = os.urandom(80)  # about the size of a 20ms speech frame
+EXTENSION = b"\xbe\xde\x00\x01" + os.urandom(4)  # what discord puts in front of every packet
+SAMPLES_PER_FRAME = 960  # 20ms at 48kHz, what the RTP timestamp advances by
+FIRST_SSRC = 1000
+
+
+def encrypt_packet(mode, key, sequence, payload=OPUS_FRAME, ssrc=1234, timestamp=None):
+    """Builds a packet like the voice server would send it (with a one word header extension)."""
+    if timestamp is None:
+        timestamp = sequence * SAMPLES_PER_FRAME
+    header = struct.pack(">BBHII", 0x90, 0x78, sequence, timestamp & 0xFFFFFFFF, ssrc)
+    counter = struct.pack(">I", sequence)
+
+    if mode == "xsalsa20_poly1305":
+        box = nacl.secret.SecretBox(key)
+        return header + box.encrypt(EXTENSION + payload, header + bytes(12)).ciphertext
+    if mode == "xsalsa20_poly1305_suffix":
+        box = nacl.secret.SecretBox(key)
+        nonce = os.urandom(24)
+        return header + box.encrypt(EXTENSION + payload, nonce).ciphertext + nonce
+    if mode == "xsalsa20_poly1305_lite":
+        box = nacl.secret.SecretBox(key)
+        return header + box.encrypt(EXTENSION + payload, counter + bytes(20)).ciphertext + counter
+
+    # rtpsize : the extension header is part of the additional data, its body gets encrypted
+    aad = header + EXTENSION[:4]
+    if mode == "aead_aes256_gcm_rtpsize":
+        return aad + AESGCM(key).encrypt(counter + bytes(8), EXTENSION[4:] + payload, aad) + counter
+    if mode == "aead_xchacha20_poly1305_rtpsize":
+        box = nacl.secret.Aead(key)
+        return aad + box.encrypt(EXTENSION[4:] + payload, aad, counter + bytes(20)).ciphertext + counter
+
+    raise ValueError(f"Unsupported voice encryption mode {mode!r}")
+
+
+def opus_frames(count: int, *, seed: int = 0) -> List[bytes]:
+    """``count`` different Opus frames to put in packets.
+
+    Real ones (a wobbling tone) when opus can be loaded, so decoding them means something.
+    Otherwise random bytes behind a 20ms fullband TOC byte, in speech frame sizes.
+    """
+    rng = random.Random(seed)
+    try:
+        from discord import opus
+
+        if not opus.is_loaded() and not opus._load_default():
+            raise opus.OpusNotLoaded()
+        encoder = opus.Encoder()
+    except Exception:
+        return [b"\x78" + rng.randbytes(rng.randint(40, 120)) for _ in range(count)]
+
+    import math
+
+    frames = []
+    phase = 0.0
+    for index in range(count):
+        pitch = 2 * math.pi * (180 + 40 * math.sin(index / 10)) / 48000
+        pcm = bytearray()
+        for _ in range(SAMPLES_PER_FRAME):
+            phase += pitch
+            sample = int(8000 * math.sin(phase)) + rng.randint(-500, 500)
+            pcm += struct.pack("<hh", sample, sample)
+        frames.append(encoder.encode(bytes(pcm), SAMPLES_PER_FRAME))
+    return frames
+
+
+def generate(
+    mode: str,
+    key: bytes,
+    count: int,
+    *,
+    speakers: int = 1,
+    silence: float = 0.0,
+    loss: float = 0.0,
+    reorder: float = 0.0,
+    seed: int = 0,
+    frames: Optional[List[bytes]] = None,
+) -> List[bytes]:
+    """``count`` encrypted packets from ``speakers`` people talking at once, interleaved like in a call.
+
+    Every speaker has their own SSRC (from ``FIRST_SSRC`` up) and starts at a random sequence
+    number and timestamp, so both wrap around in long runs.
+
+    Parameters
+    ----------
+    silence: :class:`float`
+        Share of the frames that are silence frames.
+    loss: :class:`float`
+        Share of the packets that get lost on the way, their sequence numbers are skipped.
+    reorder: :class:`float`
+        Share of the packets that get swapped with the one after.
+    frames: Optional[List[:class:`bytes`]]
+        Opus frames to cycle through, :func:`opus_frames` by default.
+    """
+    rng = random.Random(seed)
+    if frames is None:
+        frames = opus_frames(50, seed=seed)
+
+    # sequence, timestamp per speaker
+    state = [[rng.randrange(0x10000), rng.randrange(0x100000000)] for _ in range(speakers)]
+    packets = []
+    index = 0
+    while len(packets) < count:
+        speaker = index % speakers
+        sequence, timestamp = state[speaker]
+        state[speaker] = [(sequence + 1) & 0xFFFF, (timestamp + SAMPLES_PER_FRAME) & 0xFFFFFFFF]
+        index += 1
+
+        if loss and rng.random() < loss:
+            continue
+        payload = SILENCE_FRAME if silence and rng.random() < silence else frames[index % len(frames)]
+        packets.append(encrypt_packet(mode, key, sequence, payload, FIRST_SSRC + speaker, timestamp))
+
+    if reorder:
+        for index in range(len(packets) - 1):
+            if rng.random() < reorder:
+                packets[index], packets[index + 1] = packets[index + 1], packets[index]
+    return packets
@@ -0,0 +1,302 @@
+"""
+Every stage of the receive path on its own, then ``listen`` end to end against a fake voice server.
+
+For every stage : packets per second, CPU time per packet, latency per call (p50, p99, max)
+and bytes allocated per call (the peak while it runs and what's still held after).
+Stages get the best of a few rounds, the per call numbers include reading the clock.
+
+Write the results out with ``--json`` and compare two runs with ``--compare`` :
+
+python -m discordpyvoicemod.benchmarks.suite --json before.json
+python -m discordpyvoicemod.benchmarks.suite --compare before.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Optional
+
+import discord
+
+from ..decoder import FrameDecoder, decode_packet
+from ..decryption import PacketDecryptor, has_aesgcm, strip_header_ext
+from ..jitter_buffer import JitterBufferStage
+from ..metrics import ReceiveMetrics
+from ..resample import ResampleStage
+from ..recieve_audio import RawData, VoiceReceiveProtocol, unpack_audio
+from ..sinks import RingBufferSink
+from .client import StubClient
+from .rtp import EXTENSION, FIRST_SSRC, generate, opus_frames
+from .voice_server import FakeVoiceServer, LoopbackVoiceClient, wait_received
+
+
+MODE = "xsalsa20_poly1305_lite"
+SPEAKERS = 10
+USERS = {FIRST_SSRC + speaker: 10_000 + speaker for speaker in range(SPEAKERS)}  # ssrc -> user id, all of them seen speaking
+ROUNDS = 5
+ALLOCATION_SAMPLE = 2000  # calls traced for allocations, tracing is slow
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] / 1000
+
+
+def measure(make: Callable[[], Callable], items) -> Dict[str, Any]:
+    """Runs a fresh ``make()`` over ``items`` a few times. ``make`` gives what's called with each item."""
+    count = len(items)
+
+    best = float("inf")
+    cpu = 0.0
+    for _ in range(ROUNDS):
+        call = make()
+        started_cpu = time.process_time()
+        start = time.perf_counter()
+        for item in items:
+            call(item)
+        best = min(best, time.perf_counter() - start)
+        cpu += time.process_time() - started_cpu
+
+    call = make()
+    clock = time.perf_counter_ns
+    latencies = []
+    for item in items:
+        start = clock()
+        call(item)
+        latencies.append(clock() - start)
+    latencies.sort()
+
+    call = make()
+    sample = items[:ALLOCATION_SAMPLE]
+    peak = held = 0
+    tracemalloc.start()
+    for item in sample:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        call(item)
+        current, highest = tracemalloc.get_traced_memory()
+        peak += highest - before
+        held += current - before
+    tracemalloc.stop()
+
+    return {
+        "packets": count,
+        "pps": count / best,
+        "cpu_us": cpu / (count * ROUNDS) * 1e6,
+        "p50_us": _percentile(latencies, 0.5),
+        "p99_us": _percentile(latencies, 0.99),
+        "max_us": latencies[-1] / 1000,
+        "alloc_peak_bytes": peak / len(sample),
+        "alloc_held_bytes": held / len(sample),
+    }
+
+
+def _stages(loop, key, count):
+    """Name, ``make`` and items of every stage on its own."""
+    packets = generate(MODE, key, count, speakers=SPEAKERS, silence=0.05)
+    client = StubClient(loop, MODE, key, USERS)
+    frames = opus_frames(50)
+    sink = RingBufferSink(1024)
+
+    yield "strip_header_ext", lambda: strip_header_ext, [EXTENSION + frames[index % 50] for index in range(count)]
+
+    for mode in PacketDecryptor.supported_modes:
+        if mode == "aead_aes256_gcm_rtpsize" and not has_aesgcm:
+            continue
+        mode_packets = packets if mode == MODE else generate(mode, key, count, speakers=SPEAKERS)
+        yield f"decrypt/{mode}", lambda mode=mode: PacketDecryptor(mode, list(key)).decrypt, mode_packets
+
+    yield "RawData", lambda: lambda packet: RawData(packet, client), packets
+    yield "unpack_audio", lambda: lambda packet: unpack_audio(client, packet), packets
+
+    def jitter_buffer():
+        if stage_holder:
+            stage_holder.pop().flush()
+        stage = JitterBufferStage(sink.write, 0.06, loop=loop)
+        stage_holder.append(stage)
+        return stage.push
+
+    stage_holder = []
+    reordered = generate(MODE, key, count, speakers=SPEAKERS, loss=0.01, reorder=0.02, seed=1)
+    yield "jitter_buffer", jitter_buffer, [RawData(packet, client) for packet in reordered]
+
+    def protocol():
+        def handler(packet):
+            # what listen puts in front of the sink
+            if not packet.is_silence():
+                sink.write(packet)
+        datagram_received = VoiceReceiveProtocol(client, handler).datagram_received
+        return lambda packet: datagram_received(packet, None)
+
+    yield "datagram_received", protocol, packets
+
+    if discord.opus.is_loaded() or discord.opus._load_default():
+        def decode():
+            decoders = {}
+
+            def decode(packet):
+                decoder = decoders.get(packet.ssrc)
+                if decoder is None:
+                    decoder = decoders[packet.ssrc] = FrameDecoder()
+                decode_packet(decoder, packet.decrypted_data, packet.lost)
+            return decode
+
+        decoded = [RawData(packet, client) for packet in packets]
+        yield "opus_decode", decode, [packet for packet in decoded if not packet.is_silence()]
+
+    def resample():
+        convert = ResampleStage(sink.write, loop=loop).convert
+
+        def resample(packet):
+            # the PCM gets replaced, every call starts from the decoder's
+            packet.decoded_data = pcm
+            convert([packet])
+        return resample
+
+    # a 440Hz tone, decoded 20ms frames are all the same size anyway
+    pcm = b"".join(int(8000 * math.sin(2 * math.pi * 440 * n / 48000)).to_bytes(2, "little", signed=True) * 2 for n in range(960))
+    pcm_packets = [RawData(packet, client) for packet in packets]
+    yield "resample/16k", resample, [packet for packet in pcm_packets if not packet.is_silence()]
+
+
+async def run_listen(key, count, batch: Optional[int]) -> Dict[str, Any]:
+    """``listen`` into a ring buffer, against a :class:`FakeVoiceServer` flooding the socket."""
+    loop = asyncio.get_running_loop()
+    server = FakeVoiceServer(MODE, key, count, speakers=SPEAKERS, silence=0.05)
+    client = LoopbackVoiceClient(loop, MODE, key)
+    sink = RingBufferSink(1024)
+    metrics = ReceiveMetrics()
+
+    server.start()
+    await client.connect(server)
+    cpu = time.process_time()
+    start = time.perf_counter()
+    task = loop.create_task(client.listen(sink, batch=batch, metrics=metrics))
+
+    received, last = await wait_received(server, lambda: sum(stats.packets for stats in metrics.ssrcs.values()))
+    cpu = time.process_time() - cpu
+    client.close()
+    await task
+    server.join()
+
+    snapshot = metrics.snapshot()
+    return {
+        "packets": received,
+        "sent": count,
+        "pps": received / (last - start),
+        "cpu_us": cpu / max(received, 1) * 1e6,
+        # log2 buckets, sampled, an upper bound
+        "p50_us": snapshot["decrypt_latency"]["p50_us"],
+        "p99_us": snapshot["decrypt_latency"]["p99_us"],
+        "max_us": snapshot["decrypt_latency"]["max_us"],
+        "handler_p99_us": snapshot["handler_latency"]["p99_us"],
+    }
+
+
+def _meta():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "discord.py": discord.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def _format(value, unit=""):
+    if value is None:
+        return "-"
+    return f"{value:,.0f}{unit}" if value >= 100 else f"{value:.2f}{unit}"
+
+
+def report(results: Dict[str, Dict[str, Any]]) -> None:
+    print(f"{'stage':<42} {'packets/s':>12} {'cpu/pkt':>9} {'p50':>9} {'p99':>9} {'alloc':>8} {'held':>7}")
+    for name, result in results.items():
+        print(
+            f"{name:<42} {_format(result['pps']):>12} {_format(result['cpu_us'], 'us'):>9}"
+            f" {_format(result['p50_us'], 'us'):>9} {_format(result['p99_us'], 'us'):>9}"
+            f" {_format(result.get('alloc_peak_bytes'), 'B'):>8} {_format(result.get('alloc_held_bytes'), 'B'):>7}"
+            + (f"  received {result['packets']:,}/{result['sent']:,}" if "sent" in result else "")
+        )
+
+
+def compare(before: Dict[str, Any], after: Dict[str, Any]) -> None:
+    """Prints how every stage in both runs changed, positive is better."""
+    print(f"comparing to {before['meta'].get('commit')} from {before['meta'].get('time')}")
+    print(f"{'stage':<42} {'packets/s':>10} {'cpu/pkt':>9} {'p99':>9}")
+
+    def change(old, new, higher_is_better):
+        if not old or new is None:
+            return "-"
+        delta = (new / old - 1) * 100
+        return f"{delta if higher_is_better else -delta:+.1f}%"
+
+    for name, new in after["stages"].items():
+        old = before["stages"].get(name)
+        if old is None:
+            continue
+        print(
+            f"{name:<42} {change(old['pps'], new['pps'], True):>10}"
+            f" {change(old['cpu_us'], new['cpu_us'], False):>9} {change(old['p99_us'], new['p99_us'], False):>9}"
+        )
+
+
+async def run(count, only, listen):
+    key = os.urandom(32)
+    loop = asyncio.get_running_loop()
+    results = {}
+
+    for name, make, items in _stages(loop, key, count):
+        if only and only not in name:
+            continue
+        results[name] = measure(make, items)
+
+    if listen:
+        for name, batch in (("listen", None), ("listen/batch", 32)):
+            if only and only not in name:
+                continue
+            results[name] = await run_listen(key, count * 5, batch)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m discordpyvoicemod.benchmarks.suite", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--packets", type=int, default=20_000, help="packets per stage (5 times that for listen)")
+    parser.add_argument("--only", help="only run the stages with this in their name")
+    parser.add_argument("--no-listen", dest="listen", action="store_false", help="skip the end to end runs")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="compare to the results in this file")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args.packets, args.only, args.listen))
+    output = {"meta": _meta(), "stages": results}
+    report(results)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(output, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            before = json.load(file)
+        print()
+        compare(before, output)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
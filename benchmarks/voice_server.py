@@ -0,0 +1,162 @@
+"""
+A voice server stand-in on the loopback interface, to run ``listen`` against without joining a call.
+
+:class:`FakeVoiceServer` runs in a process of its own, answers IP discovery like the real one
+and then sends synthetic packets (see the ``rtp`` module) to whoever asked.
+:class:`LoopbackVoiceClient` is the other end, a voice client with just the UDP half.
+"""
+
+import asyncio
+import multiprocessing
+import socket
+import struct
+import time
+from typing import Callable, Optional, Tuple
+
+from ..recieve_audio import IOVoiceClient
+from .rtp import FIRST_SSRC, generate
+
+
+_discovery = struct.Struct(">HHI")  # type, length, ssrc
+
+
+def _serve(conn, mode, key, count, rate, options):
+    # generating takes a while, the client shouldn't be waiting on the socket for it
+    packets = generate(mode, key, count, **options)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    conn.send(sock.getsockname())
+
+    # IP discovery : type 1 request, type 2 response with the address it came from
+    while True:
+        request, address = sock.recvfrom(74)
+        if len(request) == 74 and _discovery.unpack_from(request)[0] == 1:
+            break
+    response = bytearray(74)
+    _discovery.pack_into(response, 0, 2, 70, _discovery.unpack_from(request)[2])
+    response[8:8 + len(address[0])] = address[0].encode("ascii")
+    struct.pack_into(">H", response, 72, address[1])
+    sock.sendto(response, address)
+
+    start = time.perf_counter()
+    for index, packet in enumerate(packets):
+        if rate and index % 64 == 0:
+            ahead = start + index / rate - time.perf_counter()
+            if ahead > 0:
+                time.sleep(ahead)
+        while True:
+            try:
+                sock.sendto(packet, address)
+                break
+            except (BlockingIOError, ConnectionRefusedError):
+                # the receive buffer is full (or the client isn't reading yet)
+                time.sleep(0)
+    conn.send(time.perf_counter() - start)
+    sock.close()
+
+
+class FakeVoiceServer:
+    """Sends ``count`` packets of ``speakers`` people talking, encrypted with ``mode`` and ``key``.
+
+    Parameters
+    ----------
+    rate: Optional[:class:`float`]
+        Packets per second to send at, as fast as possible by default.
+        A real call is 50 per second per speaker.
+    **options
+        Passed on to :func:`rtp.generate` (``silence``, ``loss``, ``reorder``, ``seed``).
+    """
+
+    def __init__(self, mode: str, key: bytes, count: int, *, speakers: int = 10, rate: Optional[float] = None, **options):
+        self.mode = mode
+        self.key = key
+        self.count = count
+        self.speakers = speakers
+        self.address: Optional[Tuple[str, int]] = None
+        self.send_time: Optional[float] = None  # seconds the server spent sending
+
+        options["speakers"] = speakers
+        self._conn, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve, args=(child, mode, key, count, rate, options), daemon=True)
+
+    def start(self) -> Tuple[str, int]:
+        """Starts the server process and returns the address it listens on, once it's ready."""
+        self._process.start()
+        self.address = self._conn.recv()
+        return self.address
+
+    def is_sending(self) -> bool:
+        return self._process.is_alive()
+
+    def join(self) -> None:
+        self._process.join()
+        if self._conn.poll():
+            self.send_time = self._conn.recv()
+        self._conn.close()
+
+    def stop(self) -> None:
+        if self._process.is_alive():
+            self._process.terminate()
+        self.join()
+
+
+class LoopbackVoiceClient:
+    """Just enough of a voice client for ``listen``, connected to a :class:`FakeVoiceServer`."""
+
+    _receiver = None
+    _decryptor = None
+    _ssrc_users = None
+    _user_ssrcs = None
+
+    _get_decryptor = IOVoiceClient._get_decryptor
+    _ensure_ssrc_index = IOVoiceClient._ensure_ssrc_index
+    _map_ssrc = IOVoiceClient._map_ssrc
+    get_user_id = IOVoiceClient.get_user_id
+    is_listening = IOVoiceClient.is_listening
+    stop_listening = IOVoiceClient.stop_listening
+    listen = IOVoiceClient.listen
+
+    def __init__(self, loop, mode: str, key: bytes, ssrc: int = 1):
+        self.loop = loop
+        self.mode = mode
+        self.secret_key = list(key)
+        self.ssrc = ssrc
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.setblocking(False)
+        self.ip = self.port = None
+
+    async def connect(self, server: FakeVoiceServer) -> None:
+        """IP discovery with the server, which starts sending right after. Knows every speaker's user ID, like after they spoke."""
+        packet = bytearray(74)
+        _discovery.pack_into(packet, 0, 1, 70, self.ssrc)
+        self.socket.sendto(packet, server.address)
+        response = await self.loop.sock_recv(self.socket, 74)
+        self.ip = response[8:response.index(0, 8)].decode("ascii")
+        self.port = struct.unpack_from(">H", response, len(response) - 2)[0]
+
+        for speaker in range(server.speakers):
+            self._map_ssrc(FIRST_SSRC + speaker, 10_000 + speaker)
+
+    def close(self) -> None:
+        self.stop_listening()
+        self.socket.close()
+
+
+async def wait_received(server: FakeVoiceServer, received: Callable[[], int], idle: float = 0.1) -> Tuple[int, float]:
+    """Waits until the server is done and ``received()`` stopped going up for ``idle`` seconds.
+
+    Returns the count and when (:func:`time.perf_counter`) it last went up.
+    """
+    count = received()
+    last = time.perf_counter()
+    while True:
+        await asyncio.sleep(idle)
+        now = received()
+        if now != count:
+            count = now
+            last = time.perf_counter()
+        elif not server.is_sending():
+            return count, last
@@ -0,0 +1,156 @@
+"""
+Relaying what's said in one call into another, without decoding anything.
+
+:class:`BridgeSink` takes the decrypted Opus packets coming out of one voice client's
+``listen`` and sends them right away from another voice client : new RTP header
+(its SSRC, sequence and timestamps), encrypted with its key, and that's all.
+The packets go out on the event loop as they come in, the only added latency is
+the receive path's own (leave out ``jitter_delay``, the other end has a jitter buffer).
+
+One voice client sends one stream, and mixing needs decoding, so only one person is
+relayed at a time : whoever is talking, until they've been quiet for ``switch_after``.
+"""
+
+import logging
+from typing import Optional
+
+import discord
+from discord.state import logging_coroutine
+
+from .ogg import SAMPLES_PER_FRAME, _silence_20, opus_samples
+from .playback import PlaybackVoiceClient, _rtp_fields
+from .sinks import AudioSink
+
+
+_log = logging.getLogger(__name__)
+
+CLOCK_RATE = 48000
+END_FRAMES = 5  # frames of silence sent when someone stops talking, like discord clients do
+MAX_STRETCH = 10 * CLOCK_RATE  # a speaker's timestamps jumping further than this started over
+
+
+class BridgeSink(AudioSink):
+    """Sink relaying the received audio out of another voice client, as it is.
+
+    Packets are skipped while ``target`` isn't connected or is playing something of its own.
+
+    Parameters
+    ----------
+    target: :class:`discord.VoiceClient`
+        Who sends the audio on. Its sequence numbers, timestamps and encryption
+        nonces carry on from where its own playback left them.
+    user_id: Optional[:class:`int`]
+        Only relay this user.
+    switch_after: :class:`float`
+        Seconds the person being relayed has to be quiet before someone else is.
+    """
+
+    def __init__(self, target: discord.VoiceClient, *, user_id: Optional[int] = None, switch_after: float = 0.2):
+        super().__init__()
+        self.target = target
+        self.user_id = user_id
+        self.switch_after = switch_after
+
+        self.ssrc: Optional[int] = None  # who is being relayed
+        self._timestamp = 0  # of their last packet relayed
+        self._last = None  # when it came in
+        self._speaking = False
+        self._timer = None
+
+        self.relayed = 0
+        self.skipped = 0  # others talking over the one relayed, or packets that came too late
+
+    def write(self, packet) -> None:
+        if self.user_id is not None and packet.user_id != self.user_id:
+            return
+        target = self.target
+        if not target.is_connected() or target.is_playing():
+            return
+
+        now = self.client.loop.time()
+        if packet.ssrc != self.ssrc:
+            if self.ssrc is not None and now - self._last < self.switch_after:
+                self.skipped += 1
+                return
+            self._start(packet.ssrc, now)
+            gap = None
+        else:
+            # signed, the timestamps wrap around at 2**32
+            gap = ((packet.timestamp - self._timestamp + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+            if gap <= 0:
+                self.skipped += 1
+                return
+            if gap > MAX_STRETCH:
+                gap = None
+
+        if gap is None:
+            # starting a new stretch, as far from the last one as the clock says
+            gap = SAMPLES_PER_FRAME
+            if self._last is not None:
+                gap = max(gap, round((now - self._last) * CLOCK_RATE / SAMPLES_PER_FRAME) * SAMPLES_PER_FRAME)
+
+        # target.timestamp is the next one, right after the last packet sent
+        self._send(packet.decrypted_data, target.timestamp + gap - SAMPLES_PER_FRAME)
+        self._timestamp = packet.timestamp
+        self._last = now
+        self.relayed += 1
+
+    def _start(self, ssrc: int, now: float):
+        self.ssrc = ssrc
+        if not self._speaking:
+            self._speaking = True
+            self._speak(discord.SpeakingState.voice)
+        if self._timer is None:
+            self._timer = self.client.loop.call_later(self.switch_after, self._check_quiet)
+
+    def _check_quiet(self):
+        quiet = self.client.loop.time() - self._last
+        if quiet < self.switch_after:
+            self._timer = self.client.loop.call_later(self.switch_after - quiet, self._check_quiet)
+            return
+
+        self._timer = None
+        # so the other end doesn't conceal into the silence
+        target = self.target
+        if target.is_connected() and not target.is_playing():
+            for _ in range(END_FRAMES):
+                self._send(_silence_20, target.timestamp)
+        self.ssrc = None
+        self._speaking = False
+        self._speak(discord.SpeakingState.none)
+
+    def _send(self, data: bytes, timestamp: int):
+        target = self.target
+        sequence = target.sequence = (target.sequence + 1) & 0xFFFF
+        timestamp &= 0xFFFFFFFF
+
+        header = bytearray(12)
+        header[0] = 0x80
+        header[1] = 0x78
+        _rtp_fields.pack_into(header, 2, sequence, timestamp, target.ssrc)
+        encryptor = PlaybackVoiceClient._get_encryptor(target)
+        packet = encryptor.encrypt(header, data)
+        # discord.py's own counter, for when it sends without the playback mod
+        target._lite_nonce = encryptor.nonce
+
+        target.timestamp = (timestamp + (opus_samples(data) or SAMPLES_PER_FRAME)) & 0xFFFFFFFF
+        try:
+            target.socket.sendto(packet, (target.endpoint_ip, target.voice_port))
+        except BlockingIOError:
+            _log.debug('A bridged packet has been dropped (seq: %s, timestamp: %s)', sequence, timestamp)
+        except OSError as exc:
+            _log.debug('Could not send a bridged packet: %s', exc)
+
+    def _speak(self, state):
+        if self.target.is_connected():
+            coro = self.target.ws.speak(state)
+            self.client.loop.create_task(logging_coroutine(coro, info='Voice bridge speaking update'))
+
+    def cleanup(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._speaking:
+            self._speaking = False
+            self._speak(discord.SpeakingState.none)
+        super().cleanup()
@@ -0,0 +1,137 @@
+"""
+Caching what :class:`UserClient` fetches, so bursts of events don't turn into bursts of GETs.
+
+Every entry expires after its kind's TTL, and the least recently used go once there are
+``maxsize`` of them. A fetch of something that's already being fetched waits on that
+request instead of sending its own. The gateway events that say something changed
+(channel updates, calls starting, changing, ending) drop the matching entries.
+"""
+
+import asyncio
+import collections
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+_log = logging.getLogger(__name__)
+
+_missing: Any = object()
+
+DEFAULT_TTL = {'channel': 300.0, 'user': 600.0}
+
+# gateway event -> kind of entry it makes stale, and where its id is in the payload
+INVALIDATING_EVENTS = {
+    'CHANNEL_UPDATE': ('channel', 'id'),
+    'CHANNEL_DELETE': ('channel', 'id'),
+    'CHANNEL_RECIPIENT_ADD': ('channel', 'channel_id'),
+    'CHANNEL_RECIPIENT_REMOVE': ('channel', 'channel_id'),
+    'CALL_CREATE': ('channel', 'channel_id'),
+    'CALL_UPDATE': ('channel', 'channel_id'),
+    'CALL_DELETE': ('channel', 'channel_id'),
+    'USER_UPDATE': ('user', 'id'),
+}
+
+
+class FetchCache:
+    """LRU cache of fetched entities, with a TTL per kind and one request in flight per entity.
+
+    Keys are ``(kind, id)``, like ``('channel', 1234)``.
+
+    Parameters
+    ----------
+    maxsize: :class:`int`
+        Entries kept at most, the least recently used go first.
+    ttl: Optional[Dict[:class:`str`, :class:`float`]]
+        Seconds an entry of each kind is fresh for, defaults to :data:`DEFAULT_TTL`. Kinds not
+        in there aren't cached (requests for them are still shared while in flight).
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: Optional[Dict[str, float]] = None):
+        self.maxsize = maxsize
+        self.ttl = dict(DEFAULT_TTL if ttl is None else ttl)
+        self._entries: 'collections.OrderedDict[Hashable, Tuple[float, Any]]' = collections.OrderedDict()  # key -> (expiry, value)
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0  # fetches that waited on someone else's request
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, _missing) is not _missing
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """The fresh value for ``key``, ``default`` if there's none."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        ttl = self.ttl.get(key[0])
+        if not ttl or self.maxsize <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drops ``key``, a request for it still in flight won't be cached either."""
+        self._entries.pop(key, None)
+        self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._inflight.clear()
+
+    async def fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """The cached value for ``key``, or what ``fetch()`` gives (cached then), sharing the request with concurrent callers.
+
+        Errors aren't cached, everyone waiting on the failed request gets the exception.
+        """
+        value = self.get(key, _missing)
+        if value is not _missing:
+            self.hits += 1
+            return value
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.shared += 1
+        else:
+            self.misses += 1
+            future = self._inflight[key] = asyncio.ensure_future(fetch())
+            future.add_done_callback(lambda future: self._fetched(key, future))
+        # one caller being cancelled mustn't cancel the request the others wait on
+        return await asyncio.shield(future)
+
+    def _fetched(self, key: Hashable, future: asyncio.Future):
+        failed = future.cancelled() or future.exception() is not None
+        # not there if it was invalidated while in flight, it may be stale already
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+            if not failed:
+                self.set(key, future.result())
+
+    def watch(self, state) -> None:
+        """Invalidates entries on the gateway events of ``state`` (the client's ``ConnectionState``) that change them."""
+        parsers = state.parsers
+        for event, (kind, field) in INVALIDATING_EVENTS.items():
+            parsers[event] = self._invalidating(parsers.get(event), kind, field)
+
+    def _invalidating(self, parse, kind: str, field: str):
+        def parse_and_invalidate(data):
+            try:
+                self.invalidate((kind, int(data[field])))
+            except (KeyError, TypeError, ValueError):
+                _log.debug('No %s id in %s to invalidate the fetch cache with.', kind, data)
+            if parse is not None:
+                parse(data)
+        return parse_and_invalidate
@@ -0,0 +1,187 @@
+"""
+Keeping track of the DM and group calls going on, from the gateway events.
+
+The ``CALL_CREATE`` / ``CALL_UPDATE`` / ``CALL_DELETE`` events and the voice state updates of
+non-guild channels update a :class:`CallStore` (``client.calls``) before they're dispatched, so
+a handler can look up who's ringing and who's in a call without parsing the payload again or
+asking the API. The events themselves still get the raw payload like before.
+"""
+
+import logging
+from typing import Any, Dict, Iterator, Optional, Set
+
+from discord.utils import _get_as_snowflake
+
+
+_log = logging.getLogger(__name__)
+
+
+class CallParticipant:
+    """Someone in a call, from their voice state."""
+
+    __slots__ = ('user_id', 'channel_id', 'session_id', 'self_mute', 'self_deaf', 'mute', 'deaf', 'self_video', 'self_stream', 'suppress')
+
+    def __init__(self, user_id: int, channel_id: int, data: Dict[str, Any]):
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self.update(data)
+
+    def update(self, data: Dict[str, Any]) -> None:
+        self.session_id: Optional[str] = data.get('session_id')
+        self.self_mute: bool = data.get('self_mute', False)
+        self.self_deaf: bool = data.get('self_deaf', False)
+        self.mute: bool = data.get('mute', False)
+        self.deaf: bool = data.get('deaf', False)
+        self.self_video: bool = data.get('self_video', False)
+        self.self_stream: bool = data.get('self_stream', False)
+        self.suppress: bool = data.get('suppress', False)
+
+    def __repr__(self):
+        return f'<CallParticipant user_id={self.user_id} channel_id={self.channel_id} self_mute={self.self_mute} self_deaf={self.self_deaf}>'
+
+
+class Call:
+    """A call in a DM or group channel.
+
+    ``ringing`` holds the ids of who's being rung, ``participants`` who's in it, by user id.
+    """
+
+    __slots__ = ('channel_id', 'message_id', 'region', 'ringing', 'participants', 'unavailable')
+
+    def __init__(self, channel_id: int):
+        self.channel_id = channel_id
+        self.message_id: Optional[int] = None  # of the "started a call" message
+        self.region: Optional[str] = None
+        self.ringing: Set[int] = set()
+        self.participants: Dict[int, CallParticipant] = {}
+        self.unavailable = False
+
+    def update(self, data: Dict[str, Any]) -> None:
+        if 'message_id' in data:
+            self.message_id = _get_as_snowflake(data, 'message_id')
+        if 'region' in data:
+            self.region = data['region']
+        if 'ringing' in data:
+            self.ringing = {int(user_id) for user_id in data['ringing']}
+        self.unavailable = data.get('unavailable', False)
+
+    def __repr__(self):
+        return f'<Call channel_id={self.channel_id} region={self.region!r} ringing={len(self.ringing)} participants={len(self.participants)}>'
+
+
+class CallStore:
+    """The calls going on, by channel id, and which call everyone is in."""
+
+    def __init__(self):
+        self._calls: Dict[int, Call] = {}
+        self._user_calls: Dict[int, int] = {}  # user id -> channel id of the call they're in
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __iter__(self) -> Iterator[Call]:
+        return iter(self._calls.values())
+
+    def __contains__(self, channel_id: int):
+        return channel_id in self._calls
+
+    def __repr__(self):
+        return f'<CallStore calls={len(self._calls)} participants={len(self._user_calls)}>'
+
+    # reading
+
+    def get(self, channel_id: int) -> Optional[Call]:
+        return self._calls.get(channel_id)
+
+    @property
+    def active(self):
+        """The calls going on (a view, copy it to keep it)."""
+        return self._calls.values()
+
+    def participants(self, channel_id: int) -> Dict[int, CallParticipant]:
+        """Who's in the call of ``channel_id`` by user id, empty if there's no call."""
+        call = self._calls.get(channel_id)
+        return call.participants if call is not None else {}
+
+    def call_of(self, user_id: int) -> Optional[Call]:
+        """The call ``user_id`` is in, if any."""
+        channel_id = self._user_calls.get(user_id)
+        return self._calls.get(channel_id) if channel_id is not None else None
+
+    def clear(self) -> None:
+        self._calls.clear()
+        self._user_calls.clear()
+
+    # what the events call
+
+    def _call(self, channel_id: int) -> Call:
+        call = self._calls.get(channel_id)
+        if call is None:
+            call = self._calls[channel_id] = Call(channel_id)
+        return call
+
+    def call_create(self, data: Dict[str, Any]) -> Call:
+        channel_id = int(data['channel_id'])
+        old = self._calls.pop(channel_id, None)
+        if old is not None:
+            # starting over, after a reconnect say
+            self._drop_participants(old)
+        call = self._call(channel_id)
+        call.update(data)
+        for voice_state in data.get('voice_states', ()):
+            self.voice_state_update({'channel_id': channel_id, **voice_state})
+        return call
+
+    def call_update(self, data: Dict[str, Any]) -> Call:
+        call = self._call(int(data['channel_id']))
+        call.update(data)
+        return call
+
+    def call_delete(self, data: Dict[str, Any]) -> Optional[Call]:
+        channel_id = int(data['channel_id'])
+        if data.get('unavailable'):
+            # the call's server went down, it isn't over
+            call = self._calls.get(channel_id)
+            if call is not None:
+                call.unavailable = True
+            return call
+        call = self._calls.pop(channel_id, None)
+        if call is not None:
+            self._drop_participants(call)
+        return call
+
+    def voice_state_update(self, data: Dict[str, Any]) -> Optional[CallParticipant]:
+        """A voice state update outside of guilds, returns the participant (`None` once they've left)."""
+        user_id = int(data['user_id'])
+        channel_id = _get_as_snowflake(data, 'channel_id')
+
+        previous = self._user_calls.get(user_id)
+        if previous is not None and previous != channel_id:
+            # left, or moved to another call
+            del self._user_calls[user_id]
+            call = self._calls.get(previous)
+            if call is not None:
+                call.participants.pop(user_id, None)
+                if not call.participants and call.message_id is None:
+                    # only ever known from voice states, no CALL_DELETE is coming for it
+                    del self._calls[previous]
+
+        if channel_id is None:
+            return None
+
+        # voice states can beat the CALL_CREATE
+        call = self._call(channel_id)
+        participant = call.participants.get(user_id)
+        if participant is None:
+            participant = call.participants[user_id] = CallParticipant(user_id, channel_id, data)
+            self._user_calls[user_id] = channel_id
+        else:
+            participant.update(data)
+        # they picked up
+        call.ringing.discard(user_id)
+        return participant
+
+    def _drop_participants(self, call: Call) -> None:
+        for user_id in call.participants:
+            if self._user_calls.get(user_id) == call.channel_id:
+                del self._user_calls[user_id]
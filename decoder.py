@@ -0,0 +1,152 @@
+"""
+Decoding received Opus packets into PCM, off the event loop.
+
+libopus releases the GIL while it decodes, so the work is spread over a few worker
+threads. Every SSRC is pinned to one worker, its decoder state is only ever touched
+by that thread and its packets come back in the order they went in.
+"""
+
+import asyncio
+import ctypes
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Set
+
+from discord import opus
+
+
+_log = logging.getLogger(__name__)
+
+MAX_FRAME_SIZE = 5760  # samples per channel in the longest (120ms) Opus packet
+MAX_CONCEALED = 5  # lost frames we make up for in one go, past that it's just a gap
+
+
+class FrameDecoder(opus.Decoder):
+    """:class:`discord.opus.Decoder` reusing one output buffer instead of allocating a new one per frame.
+
+    Gives 48kHz 16 bit stereo PCM, like :class:`discord.opus.Decoder`.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._pcm = (ctypes.c_int16 * (MAX_FRAME_SIZE * self.CHANNELS))()
+        self._pcm_ptr = ctypes.cast(self._pcm, opus.c_int16_ptr)
+
+    def decode(self, data, *, fec: bool = False) -> bytes:
+        if data is None or fec:
+            # concealing, opus wants to know how much audio is missing
+            frame_size = self._get_last_packet_duration() or self.SAMPLES_PER_FRAME
+        else:
+            frame_size = MAX_FRAME_SIZE
+
+        ret = opus._lib.opus_decode(self._state, data, len(data) if data else 0, self._pcm_ptr, frame_size, fec)
+        return ctypes.string_at(self._pcm, ret * self.SAMPLE_SIZE)
+
+
+def decode_packet(decoder: FrameDecoder, data: bytes, lost: int = 0) -> bytes:
+    """Decodes ``data``, making up for the ``lost`` packets right before it first."""
+    if not lost:
+        return decoder.decode(data)
+
+    frames = [decoder.decode(None) for _ in range(min(lost, MAX_CONCEALED) - 1)]
+    frames.append(decoder.decode(data, fec=True))
+    frames.append(decoder.decode(data))
+    return b''.join(frames)
+
+
+class OpusDecodeStage:
+    """Receive pipeline stage setting ``decoded_data`` on every packet.
+
+    Packets pushed during one loop iteration are decoded as one batch per worker.
+    Gaps marked by the jitter buffer are concealed, with the in-band FEC of the
+    packet after the gap and packet loss concealment for anything before that.
+
+    Parameters
+    ----------
+    emit: Callable
+        Called on the event loop with every decoded packet, in the order they were pushed (per SSRC).
+    loop: :class:`asyncio.AbstractEventLoop`
+        The loop the pipeline runs on.
+    workers: Optional[:class:`int`]
+        Decoding threads, defaults to the number of CPUs.
+    """
+
+    def __init__(self, emit: Callable, *, loop, workers=None):
+        if not opus.is_loaded() and not opus._load_default():
+            raise opus.OpusNotLoaded()
+
+        self.emit = emit
+        self.loop = loop
+        self.decoders: Dict[int, FrameDecoder] = {}
+
+        count = workers or os.cpu_count() or 1
+        self._workers = [ThreadPoolExecutor(1, thread_name_prefix='voice-decode') for _ in range(count)]
+        self._batches: List[list] = [[] for _ in range(count)]
+        self._scheduled = False
+        self._inflight: Set[asyncio.Future] = set()
+
+    def push(self, packet) -> None:
+        self._batches[packet.ssrc % len(self._batches)].append(packet)
+        if not self._scheduled:
+            self._scheduled = True
+            self.loop.call_soon(self._submit)
+
+    def _submit(self):
+        self._scheduled = False
+        for index, batch in enumerate(self._batches):
+            if not batch:
+                continue
+            self._batches[index] = []
+            future = self.loop.run_in_executor(self._workers[index], self._decode_batch, batch)
+            future.add_done_callback(self._deliver)
+            self._inflight.add(future)
+
+    def _decode_batch(self, batch):
+        # worker thread
+        decoders = self.decoders
+        for packet in batch:
+            if packet.decrypted_data is None:
+                # a silence span, nothing to decode
+                continue
+            try:
+                decoder = decoders[packet.ssrc]
+            except KeyError:
+                decoder = decoders[packet.ssrc] = FrameDecoder()
+
+            try:
+                packet.decoded_data = decode_packet(decoder, packet.decrypted_data, packet.lost)
+            except opus.OpusError as exc:
+                _log.debug('Could not decode a packet from SSRC %s: %s', packet.ssrc, exc)
+        return batch
+
+    def _deliver(self, future):
+        self._inflight.discard(future)
+        if future.cancelled():
+            return
+        exc = future.exception()
+        if exc is not None:
+            _log.error('Decoding a batch of voice packets failed.', exc_info=exc)
+            return
+
+        emit = self.emit
+        for packet in future.result():
+            if packet.decoded_data is not None or packet.decrypted_data is None:
+                emit(packet)
+
+    def remove(self, ssrc: int) -> None:
+        """Forgets the decoder state of ``ssrc``, for when the speaker leaves."""
+        self.decoders.pop(ssrc, None)
+
+    def flush(self) -> None:
+        """Hands off what's pending to the workers, see :meth:`drain` to wait for it."""
+        if self._scheduled:
+            self._submit()
+        for worker in self._workers:
+            worker.shutdown(wait=False)
+
+    async def drain(self) -> None:
+        """Waits until everything handed off has been decoded and emitted."""
+        # _deliver takes the futures out as it emits them
+        while self._inflight:
+            await asyncio.wait(list(self._inflight))
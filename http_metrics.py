@@ -0,0 +1,169 @@
+"""
+HTTP request metrics, where the time goes and how close the rate limits are.
+
+Set ``client.http.metrics = HTTPMetrics()``. Every request is timed phase by phase :
+
+- ``queue`` : waiting on the rate limits, in the request scheduler (429 retries wait there too)
+- ``network`` : sending the request until the response headers are in
+- ``parse`` : reading the body and ``json_or_text``
+- ``retry_sleep`` : backing off after a 5xx or a reset connection
+
+Every route gets a latency histogram (the whole request, retries included) and counters,
+429s are counted by kind, and the routes whose bucket hash changed are kept track of.
+Same histograms as the receive path (see the ``metrics`` module).
+"""
+
+import collections
+import logging
+import time
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from .metrics import Histogram
+
+
+_log = logging.getLogger(__name__)
+
+PHASES = ('queue', 'network', 'parse', 'retry_sleep')
+RATELIMIT_KINDS = ('bucket', 'sub', 'global', 'cloudflare')
+PRESSURE_WINDOW = 60.0  # seconds the recent 429s are counted over
+HASH_CHANGES_KEPT = 100
+
+
+class RouteStats:
+    """Counters of a single route (``'GET /channels/{channel_id}'``, parameters left in)."""
+
+    __slots__ = ('requests', 'failures', 'retries', 'ratelimited', 'hashes_found', 'statuses', 'latency')
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0  # requests that raised in the end
+        self.retries = 0  # attempts past the first
+        self.ratelimited = 0  # 429s
+        self.hashes_found = 0  # initial bucket hashes learned
+        self.statuses: Dict[int, int] = {}  # of the last attempt of every request
+        self.latency = Histogram()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'requests': self.requests,
+            'failures': self.failures,
+            'retries': self.retries,
+            'ratelimited': self.ratelimited,
+            'hashes_found': self.hashes_found,
+            'statuses': dict(self.statuses),
+            'latency': self.latency.snapshot(),
+        }
+
+
+class HTTPMetrics:
+    """Metrics of one HTTP client.
+
+    Parameters
+    ----------
+    hook: Optional[Callable[[:class:`str`, Dict], None]]
+        Called with every event as it happens : ``'phase'`` (route, phase, seconds), ``'request'``
+        (route, status, seconds, attempts), ``'ratelimited'`` (route, kind, retry_after),
+        ``'retry'`` (route, attempt, status), ``'hash_found'`` (route) and ``'hash_changed'`` (route, old, new).
+        Exceptions it raises are logged, never make a request fail.
+    """
+
+    def __init__(self, *, hook: Optional[Callable[[str, Dict[str, Any]], None]] = None):
+        self.hook = hook
+
+        self.phases = {phase: Histogram() for phase in PHASES}
+        self.routes: Dict[str, RouteStats] = {}
+        self.requests = 0
+        self.retries = 0
+        self.ratelimited = dict.fromkeys(RATELIMIT_KINDS, 0)
+        self.hashes_found = 0
+        self.hash_changes: Deque[Tuple[float, str, str, str]] = collections.deque(maxlen=HASH_CHANGES_KEPT)  # (time, route, old, new)
+        self._recent_429s: Deque[float] = collections.deque()
+
+    def _route(self, route: str) -> RouteStats:
+        stats = self.routes.get(route)
+        if stats is None:
+            stats = self.routes[route] = RouteStats()
+        return stats
+
+    def _emit(self, event: str, data: Dict[str, Any]) -> None:
+        try:
+            self.hook(event, data)
+        except Exception:
+            _log.exception('HTTP metrics hook failed on %s.', event)
+
+    # what the request calls
+
+    def phase(self, route: str, phase: str, nanoseconds: int) -> None:
+        self.phases[phase].record(nanoseconds)
+        if self.hook is not None:
+            self._emit('phase', {'route': route, 'phase': phase, 'seconds': nanoseconds / 1e9})
+
+    def retry(self, route: str, attempt: int, status: Optional[int]) -> None:
+        """``status`` is `None` after a connection error."""
+        self.retries += 1
+        self._route(route).retries += 1
+        if self.hook is not None:
+            self._emit('retry', {'route': route, 'attempt': attempt, 'status': status})
+
+    def rate_limited(self, route: str, kind: str, retry_after: Optional[float] = None) -> None:
+        self.ratelimited[kind] += 1
+        self._route(route).ratelimited += 1
+        now = time.monotonic()
+        recent = self._recent_429s
+        recent.append(now)
+        while recent[0] <= now - PRESSURE_WINDOW:
+            recent.popleft()
+        if self.hook is not None:
+            self._emit('ratelimited', {'route': route, 'kind': kind, 'retry_after': retry_after})
+
+    def hash_found(self, route: str) -> None:
+        """The route learned its rate limit bucket hash, from the first response that had one."""
+        self.hashes_found += 1
+        self._route(route).hashes_found += 1
+        if self.hook is not None:
+            self._emit('hash_found', {'route': route})
+
+    def hash_changed(self, route: str, old: str, new: str) -> None:
+        """The route's rate limit bucket hash changed, sub rate limits or limits that moved."""
+        self.hash_changes.append((time.time(), route, old, new))
+        if self.hook is not None:
+            self._emit('hash_changed', {'route': route, 'old': old, 'new': new})
+
+    def request(self, route: str, status: Optional[int], nanoseconds: int, attempts: int, failed: bool) -> None:
+        """A request is over, ``status`` of its last attempt (`None` if it never got a response)."""
+        self.requests += 1
+        stats = self._route(route)
+        stats.requests += 1
+        if failed:
+            stats.failures += 1
+        if status is not None:
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        stats.latency.record(nanoseconds)
+        if self.hook is not None:
+            self._emit('request', {'route': route, 'status': status, 'seconds': nanoseconds / 1e9, 'attempts': attempts})
+
+    # reading
+
+    @property
+    def recent_429s(self) -> int:
+        """429s in the last minute, the number to alert on before the account gets throttled."""
+        recent = self._recent_429s
+        expired = time.monotonic() - PRESSURE_WINDOW
+        while recent and recent[0] <= expired:
+            recent.popleft()
+        return len(recent)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Everything so far, as plain dicts and numbers."""
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'ratelimited': dict(self.ratelimited),
+            'recent_429s': self.recent_429s,
+            'hashes_found': self.hashes_found,
+            'hash_changes': [
+                {'time': when, 'route': route, 'old': old, 'new': new} for when, route, old, new in self.hash_changes
+            ],
+            'phases': {phase: histogram.snapshot() for phase, histogram in self.phases.items()},
+            'routes': {route: stats.snapshot() for route, stats in self.routes.items()},
+        }
@@ -0,0 +1,195 @@
+"""
+Putting received packets back in order, per speaker (SSRC).
+
+Packets arriving in order go straight through, they are only held back while a
+gap in the sequence numbers is open. A gap is given up on once it's older than
+the target delay (or that much audio has queued up behind it) and the packet
+after it gets its ``lost`` attribute set, so the gap can be concealed downstream.
+"""
+
+import logging
+from typing import Callable, Dict, Optional
+
+
+_log = logging.getLogger(__name__)
+
+FRAME_LENGTH = 0.02  # seconds of audio in a packet
+RESYNC_AFTER = 16  # packets in a row from way behind before they are taken as a restarted stream
+
+
+class JitterBuffer:
+    """Reorder buffer for the packets of a single SSRC.
+
+    Packets are kept in a ring indexed by sequence number, so storing,
+    finding duplicates and releasing are all O(1) per packet.
+    The first packet pushed sets where the sequence starts.
+    """
+
+    def __init__(self, delay: float = 0.06, capacity: int = 256):
+        if capacity & (capacity - 1):
+            raise ValueError('capacity must be a power of 2')
+
+        self.delay = delay
+        self.depth = max(1, round(delay / FRAME_LENGTH))
+        self.capacity = capacity
+
+        self._mask = capacity - 1
+        self._packets = [None] * capacity
+        self._held = 0
+        self._next = None  # sequence number of the packet to release next
+        self._ahead = 0  # how far past _next the furthest held packet is
+        self._lost = 0  # packets skipped since the last released one
+        self._strays = 0  # packets in a row that were too far behind
+        self.gap_since = None  # when the current gap was first waited on
+
+        # counters
+        self.released = 0
+        self.lost = 0
+        self.duplicates = 0
+        self.late = 0
+
+    def __len__(self):
+        return self._held
+
+    def push(self, packet, now: float, emit: Callable) -> None:
+        """Stores ``packet`` and emits every packet that can be released in order."""
+        seq = packet.sequence
+        if self._next is None:
+            self._next = seq
+
+        ahead = (seq - self._next) & 0xFFFF
+        if ahead >= self.capacity:
+            if ahead >= 0x8000 and self._strays < RESYNC_AFTER:
+                # we've released past it already, either late or a duplicate
+                self._strays += 1
+                self.late += 1
+                return
+            # a jump no reordering explains (the sender restarted or we missed a lot), start over from here
+            _log.debug('Sequence jumped from %s to %s, resyncing.', self._next, seq)
+            self.flush(emit)
+            self._next = seq
+            ahead = 0
+        self._strays = 0
+
+        index = seq & self._mask
+        if self._packets[index] is not None:
+            self.duplicates += 1
+            return
+
+        self._packets[index] = packet
+        self._held += 1
+        if ahead > self._ahead:
+            self._ahead = ahead
+
+        self._release(emit)
+        if self._held:
+            # the next packet is missing
+            if self.gap_since is None:
+                self.gap_since = now
+            elif self._ahead >= self.depth or now - self.gap_since >= self.delay:
+                self.expire(now, emit)
+
+    def expire(self, now: float, emit: Callable) -> None:
+        """Gives up on the open gap, if there is one, and releases what's behind it."""
+        if not self._held:
+            return
+
+        packets, mask = self._packets, self._mask
+        while packets[self._next & mask] is None:
+            self._skip()
+        self._release(emit)
+        self.gap_since = now if self._held else None
+
+    def flush(self, emit: Callable) -> None:
+        """Releases everything held, gaps included."""
+        while self._held:
+            self.expire(0.0, emit)
+        self.gap_since = None
+
+    def _skip(self):
+        self._next = (self._next + 1) & 0xFFFF
+        self._ahead -= 1
+        self._lost += 1
+        self.lost += 1
+
+    def _release(self, emit):
+        packets, mask = self._packets, self._mask
+        index = self._next & mask
+        packet = packets[index]
+        while packet is not None:
+            packets[index] = None
+            self._held -= 1
+            self._next = (self._next + 1) & 0xFFFF
+            self._ahead = max(self._ahead - 1, 0)
+
+            packet.lost = self._lost
+            self._lost = 0
+            self.released += 1
+            emit(packet)
+
+            index = self._next & mask
+            packet = packets[index]
+
+        if not self._held:
+            self.gap_since = None
+
+
+class JitterBufferStage:
+    """Receive pipeline stage holding a :class:`JitterBuffer` per SSRC.
+
+    Parameters
+    ----------
+    emit: Callable
+        Called with every packet, in sequence order.
+    delay: :class:`float`
+        The longest, in seconds, a gap is waited on before it's considered lost.
+    loop: :class:`asyncio.AbstractEventLoop`
+        Used for the clock and for expiring gaps when no packets come in to do it.
+    """
+
+    def __init__(self, emit: Callable, delay: float = 0.06, *, loop):
+        self.emit = emit
+        self.delay = delay
+        self.loop = loop
+        self.buffers: Dict[int, JitterBuffer] = {}
+        self._timer = None
+
+    def push(self, packet) -> None:
+        try:
+            buffer = self.buffers[packet.ssrc]
+        except KeyError:
+            buffer = self.buffers[packet.ssrc] = JitterBuffer(self.delay)
+
+        buffer.push(packet, self.loop.time(), self.emit)
+        if buffer.gap_since is not None and self._timer is None:
+            self._timer = self.loop.call_later(self.delay, self._expire)
+
+    def _expire(self):
+        self._timer = None
+        now = self.loop.time()
+        deadline = None
+        for buffer in self.buffers.values():
+            if buffer.gap_since is None:
+                continue
+            if now - buffer.gap_since >= self.delay:
+                buffer.expire(now, self.emit)
+            if buffer.gap_since is not None:
+                due = buffer.gap_since + self.delay
+                deadline = due if deadline is None else min(deadline, due)
+
+        if deadline is not None:
+            self._timer = self.loop.call_at(deadline, self._expire)
+
+    def remove(self, ssrc: int) -> Optional[JitterBuffer]:
+        """Releases and forgets the buffer of ``ssrc``, for when the speaker leaves."""
+        buffer = self.buffers.pop(ssrc, None)
+        if buffer is not None:
+            buffer.flush(self.emit)
+        return buffer
+
+    def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for buffer in self.buffers.values():
+            buffer.flush(self.emit)
@@ -0,0 +1,224 @@
+"""
+Receive path metrics.
+
+Pass a :class:`ReceiveMetrics` to ``listen(metrics=...)``. Everything is integer counters
+and fixed size histograms updated inline on the event loop, nothing gets allocated per
+packet (past the first packet of a speaker).
+
+What it costs, measured with ``benchmarks/metrics.py`` (xsalsa20_poly1305_lite, 10 speakers):
+6 to 7% fewer packets per second than listening without it. About 4.5 of that are the exact
+per speaker counters, the rest is timing 1 in 64 packets (reading the clock is slow, timing
+every packet costs 40%). That's over the 2% it's meant to stay under, leave it off where that matters.
+"""
+
+import logging
+from typing import Any, Callable, Dict, Optional
+
+
+_log = logging.getLogger(__name__)
+
+CLOCK_RATE = 48000  # RTP timestamp units per second
+FAR_BEHIND = 3000  # packets (a minute of audio), further back than that is a restarted stream
+
+
+class Histogram:
+    """Latencies in nanoseconds, in power of 2 buckets. Bucket ``i`` counts values below ``2 ** i``."""
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * 64
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value: int) -> None:
+        self.counts[value.bit_length()] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> int:
+        """Upper bound of the bucket the ``q`` (0 to 1) quantile falls in, in nanoseconds."""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(1 << bucket, self.max)
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'mean_us': self.total / self.count / 1000 if self.count else 0.0,
+            'p50_us': self.percentile(0.5) / 1000,
+            'p99_us': self.percentile(0.99) / 1000,
+            'max_us': self.max / 1000,
+        }
+
+
+class SsrcStats:
+    """Counters of a single speaker (SSRC)."""
+
+    __slots__ = (
+        'packets', 'bytes', 'silence', 'decrypt_failures', 'gaps', 'late', 'jitter',
+        'next', '_skipped', '_transit',
+    )
+
+    def __init__(self, sequence: int = 0):
+        self.packets = 0
+        self.bytes = 0
+        self.silence = 0  # frames of silence dropped
+        self.decrypt_failures = 0
+        self.gaps = 0  # times the sequence skipped ahead
+        self.late = 0  # packets from behind the highest sequence seen
+        self.jitter = 0.0  # interarrival jitter, in RTP timestamp units
+        self.next = sequence  # the sequence number expected next
+        self._skipped = 0  # sequence numbers jumped over
+        self._transit = None
+
+    @property
+    def lost(self) -> int:
+        """Packets skipped over that never showed up later."""
+        return max(0, self._skipped - self.late)
+
+    def jumped(self, sequence: int) -> bool:
+        """For a packet that isn't the expected next one. Returns whether ``next`` should move past it."""
+        ahead = (sequence - self.next) & 0xFFFF
+        if not ahead:
+            # just the wrap around
+            return True
+        if ahead >= 0x8000:
+            if ahead > 0x10000 - FAR_BEHIND:
+                self.late += 1
+                return False
+            # way behind, that's the stream starting over
+            return True
+        self.gaps += 1
+        self._skipped += ahead
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'packets': self.packets,
+            'bytes': self.bytes,
+            'silence': self.silence,
+            'decrypt_failures': self.decrypt_failures,
+            'gaps': self.gaps,
+            'lost': self.lost,
+            'late': self.late,
+            'jitter_ms': self.jitter * 1000 / CLOCK_RATE,
+        }
+
+
+class ReceiveMetrics:
+    """Metrics of one listening voice client.
+
+    Counters are exact. Latencies and jitter only come from the packets whose sequence number is
+    a multiple of ``sample_every``, reading the clock is most of what measuring costs.
+
+    Parameters
+    ----------
+    export: Optional[Callable[[Dict], None]]
+        Called with a :meth:`snapshot` every ``interval`` seconds while listening, and once more when it stops.
+    interval: :class:`float`
+        Seconds between exports.
+    sample_every: :class:`int`
+        How often packets get timed, a power of 2 up to 256, 1 to time them all.
+    """
+
+    def __init__(self, *, export: Optional[Callable[[Dict], None]] = None, interval: float = 10.0, sample_every: int = 64):
+        if not 1 <= sample_every <= 256 or sample_every & (sample_every - 1):
+            raise ValueError('sample_every has to be a power of 2 up to 256.')
+        self.export = export
+        self.interval = interval
+        self.sample_every = sample_every
+
+        self.ssrcs: Dict[int, SsrcStats] = {}
+        self.rtcp = 0  # RTCP packets skipped
+        self.decrypt_latency = Histogram()
+        # per handler call, so per batch when reading in batches
+        self.handler_latency = Histogram()
+
+        self.client = None
+        self._timer = None
+
+    def _stats(self, ssrc: int, sequence: int = 0) -> SsrcStats:
+        stats = self.ssrcs.get(ssrc)
+        if stats is None:
+            stats = self.ssrcs[ssrc] = SsrcStats(sequence)
+        return stats
+
+    def received(self, ssrc: int, sequence: int, size: int) -> SsrcStats:
+        """Counts a packet. The receive path inlines this, it's here for everything else."""
+        stats = self.ssrcs.get(ssrc)
+        if stats is None:
+            stats = self.ssrcs[ssrc] = SsrcStats(sequence)
+        stats.packets += 1
+        stats.bytes += size
+        if sequence == stats.next or stats.jumped(sequence):
+            stats.next = (sequence + 1) & 0xFFFF
+        return stats
+
+    def sampled(self, stats: SsrcStats, timestamp: int, now: int) -> None:
+        """Updates the jitter of a speaker from a timed packet that arrived at ``now`` (:func:`time.perf_counter_ns`).
+
+        Like RFC 3550 6.4.1, only between the timed packets instead of every consecutive pair.
+        """
+        transit = (now * CLOCK_RATE // 1_000_000_000 - timestamp) & 0xFFFFFFFF
+        if stats._transit is not None:
+            delta = ((transit - stats._transit + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+            stats.jitter += (abs(delta) - stats.jitter) / 16
+        stats._transit = transit
+
+    def remove(self, ssrc: int) -> None:
+        """Forgets a speaker, once they left."""
+        self.ssrcs.pop(ssrc, None)
+
+    def decrypt_failed(self, ssrc: int) -> None:
+        self._stats(ssrc).decrypt_failures += 1
+
+    def silence(self, ssrc: int) -> None:
+        self._stats(ssrc).silence += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Everything so far, as plain dicts and numbers."""
+        users = self.client._ssrc_users if self.client is not None else None
+        ssrcs = {}
+        for ssrc, stats in self.ssrcs.items():
+            ssrcs[ssrc] = snapshot = stats.snapshot()
+            snapshot['user_id'] = users.get(ssrc) if users else None
+
+        return {
+            'rtcp': self.rtcp,
+            'decrypt_latency': self.decrypt_latency.snapshot(),
+            'handler_latency': self.handler_latency.snapshot(),
+            'ssrcs': ssrcs,
+        }
+
+    # export
+
+    def start(self, client) -> None:
+        """Called by ``listen`` when it starts."""
+        self.client = client
+        if self.export is not None and self._timer is None:
+            self._timer = client.loop.call_later(self.interval, self._export)
+
+    def stop(self) -> None:
+        """Called by ``listen`` once it stops."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+            self._export(reschedule=False)
+
+    def _export(self, reschedule: bool = True):
+        try:
+            self.export(self.snapshot())
+        except Exception:
+            _log.exception('Exporting voice receive metrics failed.')
+        if reschedule:
+            self._timer = self.client.loop.call_later(self.interval, self._export)
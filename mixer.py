@@ -0,0 +1,153 @@
+"""
+Mixing every speaker of a call into one PCM track.
+
+Each speaker's RTP timestamps are anchored to one shared clock of 20ms ticks, their
+frames are summed (in int32) into the tick they belong to, and a tick is emitted once
+it's ``delay`` old, clipped back to int16. Whoever didn't send anything for a tick
+just adds nothing, so missing speakers are silence for free.
+
+All the buffers are allocated up front, nothing is allocated per tick.
+"""
+
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from .sinks import AudioSink
+
+
+FRAME_LENGTH = 0.02  # seconds per tick
+SAMPLES_PER_FRAME = 960  # per channel, at 48kHz
+CHANNELS = 2
+FRAME_SAMPLES = SAMPLES_PER_FRAME * CHANNELS
+
+
+class MixerSink(AudioSink):
+    """Sink mixing the decoded audio of every speaker into 20ms frames of 48kHz 16 bit stereo.
+
+    Parameters
+    ----------
+    on_frame: Callable[[:class:`numpy.ndarray`, :class:`int`], None]
+        Called on the event loop with every mixed frame and its tick number. The array
+        (int16, interleaved stereo) is reused for the next frame, copy it to keep it.
+    delay: :class:`float`
+        How long, in seconds, a tick is kept open for late packets before it's mixed.
+    passthrough: Optional[:class:`AudioSink`]
+        Also gets every packet, for when the separate speakers are wanted too.
+    """
+
+    needs_decoding = True
+    accepts_resampled = False
+
+    def __init__(self, on_frame: Callable, *, delay: float = 0.1, passthrough: Optional[AudioSink] = None):
+        super().__init__()
+        self.on_frame = on_frame
+        self.passthrough = passthrough
+        if passthrough is not None:
+            # the mix itself skips the silence spans, it keeps time on its own
+            self.wants_silence = passthrough.wants_silence
+        self.delay_ticks = max(1, round(delay / FRAME_LENGTH))
+
+        size = 16
+        while size < self.delay_ticks * 2 + 16:
+            size *= 2
+        self._mask = size - 1
+        self._mix = np.zeros((size, FRAME_SAMPLES), dtype=np.int32)
+        self._out = np.zeros(FRAME_SAMPLES, dtype=np.int16)
+
+        self._anchors: Dict[int, Tuple[int, int]] = {}  # ssrc -> (rtp timestamp, tick)
+        self._start = 0.0
+        self._next_tick = 0  # the next tick to mix
+        self._last_tick = -1  # the latest tick anything was added to
+        self._timer = None
+
+        self.late = 0  # frames that came after their tick was mixed
+
+    def attach(self, client, transport, *, rate: int = 48000, channels: int = 2) -> None:
+        super().attach(client, transport, rate=rate, channels=channels)
+        if self.passthrough is not None:
+            self.passthrough.attach(client, transport, rate=rate, channels=channels)
+        self._start = client.loop.time()
+
+    def _now(self) -> int:
+        return int((self.client.loop.time() - self._start) / FRAME_LENGTH)
+
+    def _tick_of(self, packet, now: int) -> int:
+        anchor = self._anchors.get(packet.ssrc)
+        if anchor is not None:
+            timestamp, tick = anchor
+            # signed difference, the timestamps wrap around at 2**32
+            elapsed = ((packet.timestamp - timestamp + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+            tick += round(elapsed / SAMPLES_PER_FRAME)
+            if now - self._mask + self.delay_ticks < tick <= now + self.delay_ticks:
+                return tick
+
+        # first packet of this speaker, or their clock ran away from ours
+        self._anchors[packet.ssrc] = (packet.timestamp, now)
+        return now
+
+    def write(self, packet) -> None:
+        if self.passthrough is not None:
+            self.passthrough.write(packet)
+
+        pcm = packet.decoded_data
+        if not pcm:
+            return
+
+        now = self._now()
+        if self._timer is None:
+            # nothing was going on, don't mix the silence in between
+            self._next_tick = max(self._next_tick, now - self.delay_ticks)
+            self._schedule()
+
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        frames = len(samples) // FRAME_SAMPLES
+        # frames concealing a gap come before the packet's own
+        tick = self._tick_of(packet, now) - min(packet.lost, frames - 1)
+
+        for index in range(frames):
+            if tick < self._next_tick or tick - self._next_tick > self._mask:
+                self.late += 1
+            else:
+                slot = self._mix[tick & self._mask]
+                np.add(slot, samples[index * FRAME_SAMPLES:(index + 1) * FRAME_SAMPLES], out=slot)
+                if tick > self._last_tick:
+                    self._last_tick = tick
+            tick += 1
+
+    def _schedule(self):
+        due = self._start + (self._next_tick + self.delay_ticks + 1) * FRAME_LENGTH
+        self._timer = self.client.loop.call_at(due, self._mix_ready)
+
+    def _mix_ready(self):
+        self._mix_until(self._now() - self.delay_ticks)
+
+        if self._next_tick > self._last_tick + self.delay_ticks:
+            # everyone went quiet
+            self._timer = None
+        else:
+            self._schedule()
+
+    def _mix_until(self, ready: int):
+        mix, out, mask = self._mix, self._out, self._mask
+        while self._next_tick <= ready:
+            slot = mix[self._next_tick & mask]
+            np.clip(slot, -32768, 32767, out=slot)
+            out[:] = slot
+            slot.fill(0)
+            self.on_frame(out, self._next_tick)
+            self._next_tick += 1
+
+    def cleanup(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+            # what's still open won't get any later packets
+            self._mix_until(self._last_tick)
+        if self.passthrough is not None:
+            self.passthrough.cleanup()
+        super().cleanup()
+
+    async def wait_closed(self) -> None:
+        if self.passthrough is not None:
+            await self.passthrough.wait_closed()
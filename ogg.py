@@ -0,0 +1,273 @@
+"""
+Recording received Opus as it is, into one Ogg Opus file per speaker.
+
+Nothing gets decoded or encoded. The packets are laced into Ogg pages on the event
+loop (cheap, the checksums are zlib's), the pages are buffered per speaker and handed
+to a writer thread in batches. Granule positions follow the RTP timestamps : stretches
+without packets (silence, loss) are filled with Opus silence packets, so every file
+plays back in real time, like RFC 7845 wants.
+"""
+
+import logging
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from .sinks import AudioSink, Policy
+
+
+_log = logging.getLogger(__name__)
+
+CLOCK_RATE = 48000
+SAMPLES_PER_FRAME = 960  # 20ms
+PAGE_SIZE = 4096  # bytes of packets per page, a bit under a second of speech
+FLUSH_SIZE = 64 * 1024  # bytes of pages per speaker before they go to the file
+MAX_FILL = 3600 * CLOCK_RATE  # samples of silence filled in at most, past that the timestamps are garbage
+PRE_SKIP = 312  # samples decoders drop at the start, what RFC 7845 recommends for libopus (discord's encoder)
+
+_page_header = struct.Struct('<4sBBqIIIB')  # capture pattern, version, flags, granule, serial, page, crc, segments
+_BOS = 0x02
+_EOS = 0x04
+
+_opus_head = struct.Struct('<8sBBHIhB')  # magic, version, channels, pre-skip, input rate, gain, mapping
+VENDOR = b'discordpyvoicemod'
+
+# what discord sends for silence, 20ms of it, and the same frame six times over (code 3, CBR), 120ms
+_silence_20 = b'\xf8\xff\xfe'
+_silence_120 = b'\xfb\x06' + b'\xff\xfe' * 6
+
+# per TOC config, samples of one frame at 48kHz (SILK 10/20/40/60ms, hybrid 10/20ms, CELT 2.5/5/10/20ms)
+_frame_samples = [480, 960, 1920, 2880] * 3 + [480, 960] * 2 + [120, 240, 480, 960] * 4
+
+_reverse_bits = bytes(int(f'{byte:08b}'[::-1], 2) for byte in range(256))
+_zeros_crc: Dict[int, int] = {}
+
+
+def ogg_crc(data: bytes) -> int:
+    """Ogg's CRC-32 (polynomial 0x04C11DB7, MSB first, no initial value or final xor).
+
+    zlib only has the bit reflected one, with an initial value and a final xor.
+    Reflecting the input bytes and the result, and cancelling out the initial value
+    (it adds the same as the checksum of as many zeros), turns one into the other.
+    """
+    size = len(data)
+    zeros = _zeros_crc.get(size)
+    if zeros is None:
+        zeros = _zeros_crc[size] = zlib.crc32(bytes(size))
+    return int(f'{zlib.crc32(data.translate(_reverse_bits)) ^ zeros:032b}'[::-1], 2)
+
+
+def opus_samples(packet: bytes) -> int:
+    """Samples (per channel, at 48kHz) in an Opus packet, from its TOC byte (RFC 6716 3.1)."""
+    if not packet:
+        return 0
+    toc = packet[0]
+    code = toc & 0x03
+    if code == 0:
+        frames = 1
+    elif code < 3:
+        frames = 2
+    elif len(packet) > 1:
+        frames = packet[1] & 0x3F
+    else:
+        return 0
+    return frames * _frame_samples[toc >> 3]
+
+
+class OggOpusStream:
+    """Ogg Opus pages of one speaker, in memory. Take what's done with :meth:`take`."""
+
+    def __init__(self, serial: int, *, channels: int = 2):
+        self.serial = serial
+        self.granule = 0  # samples up to the end of the last packet
+        self.next_timestamp: Optional[int] = None  # RTP timestamp right after the last packet
+
+        self._page = 0
+        self._segments = bytearray()
+        self._packets: List[bytes] = []
+        self._size = 0
+        self._out = bytearray()
+        self._last = 0  # where the last finished page starts in _out
+
+        self._add(_opus_head.pack(b'OpusHead', 1, channels, PRE_SKIP, CLOCK_RATE, 0, 0))
+        self._close_page(_BOS, 0)
+        self._add(b'OpusTags' + struct.pack('<I', len(VENDOR)) + VENDOR + struct.pack('<I', 0))
+        self._close_page(0, 0)
+
+    def __len__(self):
+        """Bytes of finished pages."""
+        return len(self._out)
+
+    def write(self, packet: bytes, timestamp: int) -> bool:
+        """Adds an Opus packet sent with RTP ``timestamp``, after filling the silence before it.
+
+        Returns `False` if it came late (before the last packet), it's not added then.
+        """
+        if self.next_timestamp is not None:
+            # signed, the timestamps wrap around at 2**32
+            gap = ((timestamp - self.next_timestamp + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+            if gap < 0:
+                return False
+            if gap:
+                self.silence(gap)
+
+        samples = opus_samples(packet) or SAMPLES_PER_FRAME
+        self._add(packet)
+        self.granule += samples
+        self.next_timestamp = (timestamp + samples) & 0xFFFFFFFF
+        return True
+
+    def silence(self, samples: int, timestamp: Optional[int] = None) -> None:
+        """Fills in ``samples`` of silence (in whole 20ms frames), starting at RTP ``timestamp`` if known."""
+        samples = min(samples, MAX_FILL)
+        if timestamp is not None:
+            self.next_timestamp = timestamp
+        if self.next_timestamp is not None:
+            self.next_timestamp = (self.next_timestamp + samples) & 0xFFFFFFFF
+
+        while samples >= 6 * SAMPLES_PER_FRAME:
+            self._add(_silence_120)
+            self.granule += 6 * SAMPLES_PER_FRAME
+            samples -= 6 * SAMPLES_PER_FRAME
+        while samples >= SAMPLES_PER_FRAME:
+            self._add(_silence_20)
+            self.granule += SAMPLES_PER_FRAME
+            samples -= SAMPLES_PER_FRAME
+
+    def _add(self, packet: bytes):
+        lacing = len(packet) // 255 + 1
+        if len(self._segments) + lacing > 255 or self._size >= PAGE_SIZE:
+            self._close_page(0, self.granule)
+
+        self._segments += b'\xff' * (lacing - 1)
+        self._segments.append(len(packet) % 255)
+        self._packets.append(packet)
+        self._size += len(packet)
+
+    def _close_page(self, flags: int, granule: int):
+        page = bytearray(_page_header.pack(b'OggS', 0, flags, granule, self.serial, self._page, 0, len(self._segments)))
+        page += self._segments
+        for packet in self._packets:
+            page += packet
+        struct.pack_into('<I', page, 22, ogg_crc(page))
+        self._last = len(self._out)
+        self._out += page
+
+        self._page += 1
+        self._segments = bytearray()
+        self._packets = []
+        self._size = 0
+
+    def take(self, *, end: bool = False) -> bytes:
+        """The finished pages so far. With ``end``, the last page is closed too and marks the end of the stream.
+
+        Without ``end`` the last finished page is held back, it may be the one that has to mark the end.
+        """
+        if not end:
+            out = bytes(self._out[:self._last])
+            del self._out[:self._last]
+            self._last = 0
+            return out
+
+        if self._segments:
+            self._close_page(_EOS, self.granule)
+        elif self._out:
+            # nothing after the last page, it becomes the end rather than an empty page after it
+            last = self._last
+            self._out[last + 5] |= _EOS
+            struct.pack_into('<I', self._out, last + 22, 0)
+            struct.pack_into('<I', self._out, last + 22, ogg_crc(bytes(self._out[last:])))
+        out = bytes(self._out)
+        self._out.clear()
+        self._last = 0
+        return out
+
+
+class OggOpusSink(AudioSink):
+    """Records every speaker's Opus packets into their own Ogg Opus file, without transcoding.
+
+    The packets have to come in order, run ``listen`` with a ``jitter_delay``.
+    Late ones are dropped (counted in ``late``), silence and gaps are filled in.
+
+    Parameters
+    ----------
+    path_format: :class:`str`
+        Path of each speaker's file, formatted with ``ssrc`` and ``user_id`` (`None` if unknown yet).
+    maxsize: :class:`int`
+        Bytes that can wait for the writer thread. Past that the packets are dropped,
+        or with the ``'block'`` policy the socket isn't read until the writer catches up.
+    """
+
+    wants_silence = True
+
+    def __init__(self, path_format: str = '{ssrc}.opus', *, maxsize: int = 4 * 1024 * 1024, policy: Policy = 'drop_newest'):
+        super().__init__(policy)
+        self.path_format = path_format
+        self.maxsize = maxsize
+        self.streams: Dict[int, OggOpusStream] = {}
+        self.late = 0
+
+        self._users: Dict[int, Optional[int]] = {}
+        self._files: Dict[int, Any] = {}  # only touched by the writer thread
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix='voice-ogg-writer')
+        self._backlog = 0  # bytes handed to the writer, not written yet
+
+    def _stream(self, packet) -> OggOpusStream:
+        stream = self.streams.get(packet.ssrc)
+        if stream is None:
+            stream = self.streams[packet.ssrc] = OggOpusStream(packet.ssrc)
+            self._users[packet.ssrc] = packet.user_id
+        return stream
+
+    def write(self, packet) -> None:
+        if self._backlog >= self.maxsize:
+            self.dropped += 1
+            return
+
+        stream = self._stream(packet)
+        if packet.decrypted_data is None:
+            # a silence span
+            stream.silence(packet.samples, packet.timestamp)
+        elif not stream.write(packet.decrypted_data, packet.timestamp):
+            self.late += 1
+
+        if len(stream) >= FLUSH_SIZE:
+            self._flush(packet.ssrc, stream.take())
+
+    def _flush(self, ssrc: int, data: bytes):
+        self._backlog += len(data)
+        if self.policy == 'block' and self._backlog >= self.maxsize:
+            self._pause()
+        future = self._writer.submit(self._write_pages, ssrc, self._users[ssrc], data)
+        future.add_done_callback(lambda _: self.client.loop.call_soon_threadsafe(self._written, len(data)))
+
+    def _written(self, size: int):
+        self._backlog -= size
+        if self._paused and self._backlog <= self.maxsize // 2:
+            self._resume()
+
+    def _write_pages(self, ssrc: int, user_id: Optional[int], data: bytes, close: bool = False):
+        # writer thread
+        try:
+            file = self._files.get(ssrc)
+            if file is None:
+                file = self._files[ssrc] = open(self.path_format.format(ssrc=ssrc, user_id=user_id), 'wb')
+            file.write(data)
+            if close:
+                del self._files[ssrc]
+                file.close()
+        except Exception:
+            _log.exception('Writing the Ogg Opus recording of SSRC %s failed.', ssrc)
+
+    def cleanup(self) -> None:
+        super().cleanup()
+        for ssrc, stream in self.streams.items():
+            self._writer.submit(self._write_pages, ssrc, self._users[ssrc], stream.take(end=True), True)
+        self.streams.clear()
+        # the files are all closed once the queued writes are done, wait_closed waits for that
+        self._writer.shutdown(wait=False)
+
+    async def wait_closed(self) -> None:
+        """Waits for the writer thread to write the last pages and close the files."""
+        await self.client.loop.run_in_executor(None, self._writer.shutdown)
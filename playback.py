@@ -0,0 +1,287 @@
+"""
+Playing the same audio into many calls without paying for it once per call.
+
+- :class:`OpusFrames` is audio encoded ahead of time (from an Ogg Opus file or a packed
+  frame file), loaded once and played into any number of calls with :meth:`OpusFrames.source`.
+- :class:`Broadcaster` plays one live source into many voice clients, reading and encoding
+  it once, every client just encrypts and sends the frames.
+
+Applying this mod also makes every voice client keep its cipher for the session
+instead of building one per packet sent.
+"""
+
+import asyncio
+import logging
+import struct
+import threading
+import time
+from typing import IO, Any, Callable, Iterable, List, Optional, Tuple, Union
+
+import discord
+from discord.oggparse import OggStream
+
+from .encryption import PacketEncryptor
+from .ogg import SAMPLES_PER_FRAME, _silence_20, _silence_120, opus_samples
+
+
+_log = logging.getLogger(__name__)
+
+_rtp_fields = struct.Struct('>HII')  # sequence, timestamp and ssrc, after the first 2 bytes of the header
+_frame_length = struct.Struct('>H')
+
+
+def _open(file, mode):
+    if isinstance(file, (str, bytes)) or hasattr(file, '__fspath__'):
+        return open(file, mode), True
+    return file, False
+
+
+class OpusFrames:
+    """20ms Opus frames in memory, to be played as they are.
+
+    Load them once with :meth:`from_ogg` or :meth:`from_packed`,
+    then play them into as many voice clients as needed with :meth:`source`.
+    """
+
+    def __init__(self, frames: List[bytes]):
+        self.frames = frames
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def duration(self) -> float:
+        """In seconds."""
+        return len(self.frames) * 0.02
+
+    @classmethod
+    def from_ogg(cls, file: Union[str, IO[bytes]]) -> 'OpusFrames':
+        """Reads the frames of an Ogg Opus file (like ``ffmpeg -c:a libopus -frame_duration 20`` makes).
+
+        Raises
+        ------
+        discord.oggparse.OggError
+            It's not an Ogg file.
+        ValueError
+            It's not an Ogg Opus file, or it has frames that aren't 20ms long.
+        """
+        file, owned = _open(file, 'rb')
+        try:
+            packets = iter(OggStream(file).iter_packets())
+            head = next(packets, b'')
+            if not head.startswith(b'OpusHead'):
+                raise ValueError('Not an Ogg Opus file.')
+
+            frames = []
+            for packet in packets:
+                if packet.startswith(b'OpusTags'):
+                    continue
+                samples = opus_samples(packet)
+                if samples == SAMPLES_PER_FRAME:
+                    frames.append(packet)
+                elif packet == _silence_120:
+                    # how the recording sink fills in silence
+                    frames.extend([_silence_20] * 6)
+                else:
+                    raise ValueError(f'Only 20ms Opus frames can be played as they are, found one of {samples / 48:g}ms.')
+        finally:
+            if owned:
+                file.close()
+        return cls(frames)
+
+    @classmethod
+    def from_packed(cls, file: Union[str, IO[bytes]]) -> 'OpusFrames':
+        """Reads the frames of a file written by :meth:`save_packed`."""
+        file, owned = _open(file, 'rb')
+        try:
+            data = file.read()
+        finally:
+            if owned:
+                file.close()
+
+        frames = []
+        offset = 0
+        while offset < len(data):
+            (length,) = _frame_length.unpack_from(data, offset)
+            offset += 2
+            frames.append(data[offset:offset + length])
+            offset += length
+        return cls(frames)
+
+    def save_packed(self, file: Union[str, IO[bytes]]) -> None:
+        """Writes the frames as they are, each one behind its length (2 bytes, big endian)."""
+        file, owned = _open(file, 'wb')
+        try:
+            file.write(b''.join(_frame_length.pack(len(frame)) + frame for frame in self.frames))
+        finally:
+            if owned:
+                file.close()
+
+    def source(self) -> 'OpusFramesAudio':
+        """A new audio source playing the frames from the start, for ``VoiceClient.play``."""
+        return OpusFramesAudio(self.frames)
+
+
+class OpusFramesAudio(discord.AudioSource):
+    """Plays a list of Opus frames, nothing gets encoded. See :class:`OpusFrames`."""
+
+    def __init__(self, frames: List[bytes]):
+        self.frames = frames
+        self._index = 0
+
+    def read(self) -> bytes:
+        index = self._index
+        if index >= len(self.frames):
+            return b''
+        self._index = index + 1
+        return self.frames[index]
+
+    def is_opus(self) -> bool:
+        return True
+
+
+class Broadcaster(threading.Thread):
+    """Plays one audio source into any number of voice clients at once.
+
+    The source is read, and encoded if it's PCM, once per frame on this one thread,
+    the clients only encrypt and send the frames. Clients can be added and removed
+    while it plays. A client that's playing something else of its own or isn't
+    connected is skipped until it's free again.
+
+    Parameters
+    ----------
+    source: :class:`discord.AudioSource`
+        What to play.
+    clients: Iterable[:class:`discord.VoiceClient`]
+        Who to play it to, to start with.
+    after: Optional[Callable[[Optional[:class:`Exception`]], Any]]
+        Called when the source runs out or the broadcast fails or is stopped, like with ``VoiceClient.play``.
+    """
+
+    DELAY = discord.opus.Encoder.FRAME_LENGTH / 1000.0
+
+    def __init__(self, source: discord.AudioSource, clients: Iterable = (), *, after: Optional[Callable[[Optional[Exception]], Any]] = None):
+        threading.Thread.__init__(self, name='voice-broadcaster', daemon=True)
+        if not isinstance(source, discord.AudioSource):
+            raise TypeError(f'source must be an AudioSource not {source.__class__.__name__}')
+
+        self.source = source
+        self.after = after
+        self.encoder = None if source.is_opus() else discord.opus.Encoder()
+        self.frames = 0  # read and sent so far
+
+        self._clients: Tuple = tuple(clients)
+        self._lock = threading.Lock()
+        self._end = threading.Event()
+        self._error: Optional[Exception] = None
+
+    @property
+    def clients(self) -> Tuple:
+        return self._clients
+
+    def add(self, client) -> None:
+        """Starts playing into ``client`` too, from wherever the source is at."""
+        with self._lock:
+            if client in self._clients:
+                return
+            self._clients += (client,)
+        if self.is_alive():
+            self._speak(client, discord.SpeakingState.voice)
+
+    def remove(self, client) -> None:
+        with self._lock:
+            if client not in self._clients:
+                return
+            self._clients = tuple(other for other in self._clients if other is not client)
+        if self.is_alive():
+            self._speak(client, discord.SpeakingState.none)
+
+    def is_playing(self) -> bool:
+        return self.is_alive() and not self._end.is_set()
+
+    def stop(self) -> None:
+        self._end.set()
+
+    def run(self) -> None:
+        try:
+            self._do_run()
+        except Exception as exc:
+            self._error = exc
+        finally:
+            self._end.set()
+            for client in self._clients:
+                self._speak(client, discord.SpeakingState.none)
+            self._call_after()
+            self.source.cleanup()
+
+    def _do_run(self):
+        for client in self._clients:
+            self._speak(client, discord.SpeakingState.voice)
+
+        read = self.source.read
+        encoder = self.encoder
+        loops = 0
+        start = time.perf_counter()
+        while not self._end.is_set():
+            data = read()
+            if not data:
+                break
+            if encoder is not None:
+                data = encoder.encode(data, encoder.SAMPLES_PER_FRAME)
+
+            for client in self._clients:
+                if not client.is_connected() or client.is_playing():
+                    continue
+                try:
+                    client.send_audio_packet(data, encode=False)
+                except OSError as exc:
+                    # the client is disconnecting, its socket is gone
+                    _log.debug('Could not send a broadcast frame to %s: %s', client, exc)
+
+            self.frames += 1
+            loops += 1
+            time.sleep(max(0.0, start + self.DELAY * loops - time.perf_counter()))
+
+    def _speak(self, client, state) -> None:
+        try:
+            asyncio.run_coroutine_threadsafe(client.ws.speak(state), client.loop)
+        except Exception:
+            _log.exception('Speaking call in broadcaster failed')
+
+    def _call_after(self) -> None:
+        if self.after is not None:
+            try:
+                self.after(self._error)
+            except Exception as exc:
+                exc.__context__ = self._error
+                _log.exception('Calling the after function failed.', exc_info=exc)
+        elif self._error is not None:
+            _log.exception('Exception in voice broadcaster', exc_info=self._error)
+
+
+class PlaybackVoiceClient(discord.VoiceClient):
+
+    _encryptor = None
+
+    def _get_encryptor(self) -> PacketEncryptor:
+        """The encryptor for the current session, only rebuilt when the mode or the secret key changes."""
+        encryptor = getattr(self, '_encryptor', None)  # also used on clients this mod wasn't applied to
+        if encryptor is None or encryptor.mode != self.mode:
+            # carry on from where discord.py's own nonce counter got to
+            encryptor = self._encryptor = PacketEncryptor(self.mode, self.secret_key, getattr(self, '_lite_nonce', 0))
+        elif encryptor.secret_key is not self.secret_key:
+            encryptor.update_key(self.secret_key)
+        return encryptor
+
+    def _get_voice_packet(self, data):
+        header = bytearray(12)
+        header[0] = 0x80
+        header[1] = 0x78
+        _rtp_fields.pack_into(header, 2, self.sequence, self.timestamp, self.ssrc)
+        return self._get_encryptor().encrypt(header, data)
+
+
+def apply():
+    discord.VoiceClient._encryptor = None #type: ignore
+    discord.VoiceClient._get_encryptor = PlaybackVoiceClient._get_encryptor #type: ignore
+    discord.VoiceClient._get_voice_packet = PlaybackVoiceClient._get_voice_packet #type: ignore
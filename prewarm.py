@@ -0,0 +1,101 @@
+"""
+Warming up the HTTP session at login, so the first requests don't pay for DNS, TCP and TLS.
+
+``UserClient(http_settings=HTTPSettings(prewarm=4))`` builds the session's connector from the
+settings (pool size, DNS cache, keep-alive) and, before the login request, opens ``prewarm``
+connections to the API host and leaves them in the pool. How long that and the first request
+took ends up in ``client.login_timings``.
+"""
+
+import asyncio
+import logging
+import socket
+from typing import Optional
+
+import aiohttp
+from discord.http import Route
+
+
+_log = logging.getLogger(__name__)
+
+
+class HTTPSettings:
+    """Settings of the client's HTTP connector, and how many connections to open at login.
+
+    Parameters
+    ----------
+    pool_size: :class:`int`
+        Connections open at once at most, ``0`` for no limit (discord.py's default).
+    dns_cache_ttl: Optional[:class:`float`]
+        Seconds a resolved host is kept for, `None` to keep it forever.
+    keepalive: :class:`float`
+        Seconds an idle connection stays in the pool.
+    prewarm: :class:`int`
+        Connections opened at login, before the first request. ``0`` doesn't open any.
+    prewarm_timeout: :class:`float`
+        Seconds the prewarm gets before login goes on without it.
+    """
+
+    def __init__(
+        self,
+        *,
+        pool_size: int = 100,
+        dns_cache_ttl: Optional[float] = 300.0,
+        keepalive: float = 60.0,
+        prewarm: int = 0,
+        prewarm_timeout: float = 5.0,
+    ):
+        self.pool_size = pool_size
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive = keepalive
+        self.prewarm = min(prewarm, pool_size) if pool_size else prewarm
+        self.prewarm_timeout = prewarm_timeout
+
+    def __repr__(self):
+        return f'<HTTPSettings pool_size={self.pool_size} dns_cache_ttl={self.dns_cache_ttl} keepalive={self.keepalive} prewarm={self.prewarm}>'
+
+    def connector(self) -> aiohttp.TCPConnector:
+        """A connector with these settings, has to be made inside the running loop."""
+        return aiohttp.TCPConnector(
+            limit=self.pool_size,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive,
+            family=socket.AF_INET,  # discord does not support ipv6
+        )
+
+
+async def prewarm(
+    connector: aiohttp.BaseConnector,
+    count: int,
+    *,
+    timeout: float = 5.0,
+    proxy: Optional[str] = None,
+    proxy_auth: Optional[aiohttp.BasicAuth] = None,
+) -> int:
+    """Opens ``count`` keep-alive connections to the API host through ``connector``, returns how many made it.
+
+    They're opened by concurrent ``GET /gateway`` (no token needed), every one needs a
+    connection of its own, and they all go back to the pool once their response is read.
+    Pass the client's ``proxy`` and ``proxy_auth``, the pool keeps connections per proxy.
+    """
+    if count <= 0:
+        return 0
+
+    # doesn't own the connector, closing it leaves the connections in the pool
+    async with aiohttp.ClientSession(connector=connector, connector_owner=False) as session:
+        async def open_one() -> bool:
+            async with session.get(Route.BASE + '/gateway', proxy=proxy, proxy_auth=proxy_auth) as response:
+                await response.read()
+                return True
+
+        try:
+            results = await asyncio.wait_for(asyncio.gather(*(open_one() for _ in range(count)), return_exceptions=True), timeout)
+        except asyncio.TimeoutError:
+            _log.warning('Prewarming %d connections took over %.1fs, going on without them.', count, timeout)
+            return 0
+
+    opened = sum(result is True for result in results)
+    if opened < count:
+        errors = [result for result in results if isinstance(result, BaseException)]
+        _log.warning('Prewarmed %d of %d connections, first error: %r', opened, count, errors[0])
+    return opened
@@ -0,0 +1,568 @@
+"""
+Decrypting and decoding received audio in other processes.
+
+With enough calls, the one core the event loop runs on gives out long before the
+machine does. A :class:`ProcessPool` moves decryption (and Opus decoding) to worker
+processes : the loop copies every raw datagram straight into a shared memory ring
+of the worker its speaker is pinned to, and the worker writes the Opus payload and
+PCM back into a ring of its own. Nothing is pickled per packet, the loop and a worker
+only poke each other through a pipe, once per batch.
+
+Every SSRC of a session always goes to the same worker and the rings are FIFO,
+so a speaker's packets come out in the order they arrived.
+
+Workers are started with ``spawn``, so the main module of the program has to be
+safe to import (behind ``if __name__ == '__main__':``).
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import struct
+import time
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional
+
+from discord import opus
+
+from .decoder import FrameDecoder, decode_packet
+from .decryption import DECRYPT_ERRORS, PacketDecryptor
+from .jitter_buffer import RESYNC_AFTER
+from .recieve_audio import SILENCE_FRAME, RawData
+
+
+_log = logging.getLogger(__name__)
+
+# ring layout : head, tail (each on its own cache line), then the records
+_index = struct.Struct('<Q')
+_length = struct.Struct('<I')
+_HEAD = 0
+_TAIL = 64
+_DATA = 128
+_WRAP = 0xFFFFFFFF  # the rest of the ring is unused, next record is at the start
+
+# every record starts with its length
+# loop -> worker : length, kind, session, then the payload
+_request = struct.Struct('<IBxxxI')
+PACKET, KEY, REMOVE, MARK, CLOSE = range(5)
+
+# worker -> loop : length, kind, lost, sequence, session, timestamp, ssrc, opus length, then opus and pcm
+_result = struct.Struct('<IBBHIIIH')
+DECRYPTED, MARKED = range(2)
+
+DRAIN_TIMEOUT = 5.0  # seconds drain waits on the workers, what they still have after that is lost
+DRAIN_CHECK = 0.1  # seconds between looking for dead workers while draining
+
+_rtp_header = struct.Struct('>xxHII')
+_ssrc = struct.Struct('>8xI')
+_u32 = struct.Struct('<I')
+
+
+class ShmRing:
+    """Single producer, single consumer queue of variable sized records in shared memory.
+
+    A record is a header (a :class:`struct.Struct` starting with the record's length
+    as a little endian u32) and some payload. Records are 8 byte aligned and never split,
+    one that doesn't fit before the end of the ring starts over at the beginning.
+
+    Only the producer writes the head and only the consumer the tail, each works off its
+    own copy and publishes it once per batch (:meth:`commit`, :meth:`release`), so most
+    records don't touch the shared indexes at all.
+
+    Parameters
+    ----------
+    size: :class:`int`
+        Bytes of records, a power of 2.
+    name: Optional[:class:`str`]
+        Attach to the ring with this name (see :attr:`name`) instead of creating one.
+    """
+
+    def __init__(self, size: int = 1 << 22, *, name: Optional[str] = None):
+        if name is None:
+            if size & (size - 1):
+                raise ValueError('size must be a power of 2')
+            self._shm = shared_memory.SharedMemory(create=True, size=_DATA + size)
+            self._shm.buf[:_DATA] = bytes(_DATA)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            size = 1 << (self._shm.size - _DATA).bit_length() - 1
+
+        self.size = size
+        self._mask = size - 1
+        self._buf = self._shm.buf
+        #: The records, :meth:`get` gives offsets into this.
+        self.data = self._buf[_DATA:_DATA + size]
+
+        self._head = _index.unpack_from(self._buf, _HEAD)[0]
+        self._tail = _index.unpack_from(self._buf, _TAIL)[0]
+        self._limit = self._tail + size  # how far the producer knows it can go
+        self._seen = self._head  # how far the consumer knows there are records
+        self._next = self._tail  # end of the record the consumer is on
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    # producer
+
+    def put(self, header: struct.Struct, values: tuple, payload=b'') -> bool:
+        """Appends a record, `False` if the ring is too full. The consumer sees it after :meth:`commit`."""
+        length = header.size + len(payload)
+        needed = (length + 7) & ~7
+
+        head = self._head
+        pos = head & self._mask
+        skip = self.size - pos if pos + needed > self.size else 0
+        if head + skip + needed > self._limit:
+            self._limit = _index.unpack_from(self._buf, _TAIL)[0] + self.size
+            if head + skip + needed > self._limit:
+                return False
+
+        data = self.data
+        if skip:
+            _length.pack_into(data, pos, _WRAP)
+            pos = 0
+        header.pack_into(data, pos, length, *values)
+        data[pos + header.size:pos + length] = payload
+        self._head = head + skip + needed
+        return True
+
+    def commit(self) -> None:
+        """Publishes what was put so far."""
+        _index.pack_into(self._buf, _HEAD, self._head)
+
+    # consumer
+
+    def get(self) -> int:
+        """Offset of the oldest record in :attr:`data`, -1 if there is none. :meth:`consume` it when done."""
+        tail = self._tail
+        if tail == self._seen:
+            self._seen = _index.unpack_from(self._buf, _HEAD)[0]
+            if tail == self._seen:
+                return -1
+
+        pos = tail & self._mask
+        length = _length.unpack_from(self.data, pos)[0]
+        if length == _WRAP:
+            tail += self.size - pos
+            pos = 0
+            length = _length.unpack_from(self.data, 0)[0]
+        self._next = tail + ((length + 7) & ~7)
+        return pos
+
+    def consume(self) -> None:
+        """Moves on past the record :meth:`get` gave, its room goes back to the producer on :meth:`release`."""
+        self._tail = self._next
+
+    def release(self) -> None:
+        _index.pack_into(self._buf, _TAIL, self._tail)
+
+    def close(self, unlink: bool = False) -> None:
+        self.data.release()
+        self._buf.release()
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+
+# worker process
+
+class _Worker:
+    def __init__(self, outbox: ShmRing, done_fd: int):
+        self.outbox = outbox
+        self.done_fd = done_fd
+        self.sessions: Dict[int, tuple] = {}  # session -> (decryptor, decode)
+        self.decoders: Dict[tuple, list] = {}  # (session, ssrc) -> [decoder, next sequence, strays]
+        self.unread = 0  # results the loop wasn't told about yet
+
+    def handle(self, data, pos):
+        length, kind, session = _request.unpack_from(data, pos)
+        payload = data[pos + _request.size:pos + length]
+
+        if kind == PACKET:
+            self.decrypt(session, payload)
+        elif kind == KEY:
+            decode = payload[0]
+            mode, _, key = bytes(payload[1:]).partition(b'\0')
+            state = self.sessions.get(session)
+            if state is not None and state[0].mode == mode.decode():
+                state[0].update_key(list(key))
+            else:
+                self.sessions[session] = (PacketDecryptor(mode.decode(), list(key)), decode)
+        elif kind == REMOVE:
+            self.decoders.pop((session, _u32.unpack_from(payload)[0]), None)
+        elif kind == MARK:
+            self.put((MARKED, 0, 0, session, 0, 0, 0))
+        elif kind == CLOSE:
+            self.sessions.pop(session, None)
+            for key in [key for key in self.decoders if key[0] == session]:
+                del self.decoders[key]
+        payload.release()
+
+    def decrypt(self, session, packet):
+        try:
+            decryptor, decode = self.sessions[session]
+            opus_data = decryptor.decrypt(packet)
+        except (KeyError, *DECRYPT_ERRORS):
+            return
+
+        sequence, timestamp, ssrc = _rtp_header.unpack_from(packet)
+        lost = 0
+        pcm = b''
+        if decode:
+            state = self.decoders.get((session, ssrc))
+            if state is None:
+                state = self.decoders[session, ssrc] = [FrameDecoder(), sequence, 0]
+
+            # decoding happens in arrival order, anything behind is too late to go in
+            ahead = (sequence - state[1]) & 0xFFFF
+            if ahead >= 0x8000 and state[2] < RESYNC_AFTER:
+                state[2] += 1
+                return
+            state[1] = (sequence + 1) & 0xFFFF
+            state[2] = 0
+
+            if opus_data != SILENCE_FRAME:
+                lost = ahead if ahead < 0x8000 else 0
+                try:
+                    pcm = decode_packet(state[0], opus_data, lost)
+                except opus.OpusError as exc:
+                    _log.debug('Could not decode a packet from SSRC %s: %s', ssrc, exc)
+                    return
+
+        self.put((DECRYPTED, min(lost, 255), sequence, session, timestamp, ssrc, len(opus_data)), opus_data + pcm)
+
+    def put(self, values, payload=b''):
+        while not self.outbox.put(_result, values, payload):
+            # the loop is behind, make sure it knows there's something to read
+            self.notify()
+            time.sleep(0.001)
+
+        self.unread += 1
+        if self.unread >= 64:
+            self.notify()
+
+    def notify(self):
+        if self.unread:
+            self.unread = 0
+            self.outbox.commit()
+            os.write(self.done_fd, b'\0')
+
+
+def _worker_main(inbox_name, outbox_name, wake, done, opus_name):
+    if opus_name is not None:
+        opus.load_opus(opus_name)
+
+    inbox = ShmRing(name=inbox_name)
+    outbox = ShmRing(name=outbox_name)
+    worker = _Worker(outbox, done.fileno())
+    wake_fd = wake.fileno()
+    data = inbox.data
+    try:
+        # an empty read means the pool closed its end
+        while os.read(wake_fd, 4096):
+            handled = 0
+            while True:
+                pos = inbox.get()
+                if pos < 0:
+                    break
+                try:
+                    worker.handle(data, pos)
+                except Exception:
+                    _log.exception('Handling a voice packet failed.')
+                inbox.consume()
+
+                handled += 1
+                if handled % 64 == 0:
+                    inbox.release()
+            inbox.release()
+            worker.notify()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        del data
+        inbox.close()
+        outbox.close()
+
+
+# event loop side
+
+class PoolSession:
+    """What a listening voice client pushes its raw packets into, see :meth:`ProcessPool.open`.
+
+    Works like a receive pipeline stage, except it takes datagrams instead of :class:`RawData`.
+    """
+
+    def __init__(self, pool: 'ProcessPool', session: int, client, emit: Callable, decode: bool):
+        self.pool = pool
+        self.id = session
+        self.client = client
+        self.emit = emit
+        self.decode = decode
+        self._key = None
+        self._mode = None
+        self._marks = 0
+        self._drained = None
+        # spreads the sessions' SSRCs differently over the workers
+        self._salt = session * 0x9E3779B1 & 0xFFFFFFFF
+
+    def _worker_of(self, ssrc: int) -> int:
+        return (ssrc ^ self._salt) % len(self.pool._inboxes)
+
+    def _send_key(self) -> bool:
+        client = self.client
+        payload = bytes([self.decode]) + client.mode.encode() + b'\0' + bytes(client.secret_key)
+        for index in range(len(self.pool._inboxes)):
+            if not self.pool._submit(index, KEY, self.id, payload):
+                return False
+        self._key = client.secret_key
+        self._mode = client.mode
+        return True
+
+    def push(self, data) -> None:
+        if len(data) < _rtp_header.size or 200 <= data[1] <= 204:
+            # too short for RTP, or RTCP
+            return
+
+        client = self.client
+        if (client.secret_key is not self._key or client.mode != self._mode) and not self._send_key():
+            return
+        pool = self.pool
+        pool._submit((_ssrc.unpack_from(data)[0] ^ self._salt) % len(pool._inboxes), PACKET, self.id, data)
+
+    def remove(self, ssrc: int) -> None:
+        """Forgets the decoder state of ``ssrc``, for when the speaker leaves."""
+        self.pool._submit(self._worker_of(ssrc), REMOVE, self.id, _u32.pack(ssrc))
+
+    def flush(self) -> None:
+        """Wakes the workers up for what's pending, see :meth:`drain` to wait for it."""
+        self.pool._notify()
+
+    async def drain(self) -> None:
+        """Waits until everything pushed came back and was emitted, then ends the session.
+
+        Gives up after :data:`DRAIN_TIMEOUT` seconds, or right away once a worker died.
+        """
+        pool = self.pool
+        loop = pool._loop
+        self._drained = loop.create_future()
+        self._marks = len(pool._inboxes)
+        deadline = loop.time() + DRAIN_TIMEOUT
+        try:
+            for index in range(len(pool._inboxes)):
+                if not await pool._submit_control(index, MARK, self.id):
+                    return
+            while not self._drained.done():
+                if pool._dead_workers():
+                    return
+                if loop.time() >= deadline:
+                    _log.warning('Voice workers took over %.1fs to drain, going on without what they still have.', DRAIN_TIMEOUT)
+                    return
+                await asyncio.wait([self._drained], timeout=DRAIN_CHECK)
+        finally:
+            pool._sessions.pop(self.id, None)
+            for index in range(len(pool._inboxes)):
+                await pool._submit_control(index, CLOSE, self.id)
+
+    def _marked(self):
+        self._marks -= 1
+        if not self._marks and not self._drained.done():
+            self._drained.set_result(None)
+
+
+class ProcessPool:
+    """Worker processes decrypting (and decoding) the received audio of any number of voice clients.
+
+    Pass it to ``listen(pool=...)``, one pool is meant to be shared by every client on the loop.
+
+    Parameters
+    ----------
+    workers: Optional[:class:`int`]
+        Processes to start, defaults to the number of CPUs.
+    ring_size: :class:`int`
+        Bytes of shared memory for each direction of each worker, a power of 2.
+    """
+
+    def __init__(self, workers: Optional[int] = None, *, ring_size: int = 1 << 22):
+        self.workers = workers or os.cpu_count() or 1
+        self.ring_size = ring_size
+        self.dropped = 0  # packets that didn't fit in a worker's ring
+
+        self._loop = None
+        self._processes: List[multiprocessing.Process] = []
+        self._inboxes: List[ShmRing] = []
+        self._outboxes: List[ShmRing] = []
+        self._wake_fds: List[int] = []
+        self._done_fds: List[int] = []
+        self._pipes = []
+        self._sessions: Dict[int, PoolSession] = {}
+        self._next_session = 1
+        self._dirty = set()
+        self._scheduled = False
+        self._reported_dead = set()
+
+    def start(self, loop) -> None:
+        """Starts the workers, done by :meth:`open` if needed."""
+        if self._loop is not None:
+            return
+        self._loop = loop
+
+        opus_name = opus._lib._name if opus.is_loaded() else None
+        context = multiprocessing.get_context('spawn')
+        for index in range(self.workers):
+            inbox = ShmRing(self.ring_size)
+            outbox = ShmRing(self.ring_size)
+            wake_recv, wake_send = context.Pipe(duplex=False)
+            done_recv, done_send = context.Pipe(duplex=False)
+
+            process = context.Process(
+                target=_worker_main,
+                args=(inbox.name, outbox.name, wake_recv, done_send, opus_name),
+                name=f'voice-worker-{index}',
+                daemon=True,
+            )
+            process.start()
+            # the worker has its own copies now
+            wake_recv.close()
+            done_send.close()
+
+            os.set_blocking(wake_send.fileno(), False)
+            os.set_blocking(done_recv.fileno(), False)
+            loop.add_reader(done_recv.fileno(), self._results_ready, index)
+
+            self._processes.append(process)
+            self._inboxes.append(inbox)
+            self._outboxes.append(outbox)
+            self._wake_fds.append(wake_send.fileno())
+            self._done_fds.append(done_recv.fileno())
+            self._pipes += (wake_send, done_recv)
+
+    def open(self, client, emit: Callable, *, decode: bool = False) -> PoolSession:
+        """A session for ``client``'s packets, the results go to ``emit`` as :class:`RawData`."""
+        if decode and not opus.is_loaded() and not opus._load_default():
+            raise opus.OpusNotLoaded()
+
+        self.start(client.loop)
+        session = PoolSession(self, self._next_session, client, emit, decode)
+        self._next_session = (self._next_session + 1) & 0xFFFFFFFF or 1
+        self._sessions[session.id] = session
+        return session
+
+    def _submit(self, index: int, kind: int, session: int, payload=b'') -> bool:
+        ring = self._inboxes[index]
+        if not ring.put(_request, (kind, session), payload):
+            self.dropped += 1
+            ring.commit()
+            self._wake(index)
+            return False
+
+        self._dirty.add(index)
+        if not self._scheduled:
+            # one wake up per worker per loop iteration
+            self._scheduled = True
+            self._loop.call_soon(self._notify)
+        return True
+
+    async def _submit_control(self, index: int, kind: int, session: int) -> bool:
+        """Submits until there's room, `False` if the worker is dead (there never will be)."""
+        while not self._submit(index, kind, session):
+            if not self._processes[index].is_alive():
+                return False
+            await asyncio.sleep(0.001)
+        return True
+
+    def _dead_workers(self) -> List[int]:
+        """Indexes of the workers that exited, logged the first time."""
+        dead = [index for index, process in enumerate(self._processes) if not process.is_alive()]
+        for index in dead:
+            if index not in self._reported_dead:
+                self._reported_dead.add(index)
+                _log.error('Voice worker %d exited with code %s, what it had is lost.', index, self._processes[index].exitcode)
+        return dead
+
+    def _notify(self):
+        self._scheduled = False
+        for index in self._dirty:
+            self._inboxes[index].commit()
+            self._wake(index)
+        self._dirty.clear()
+
+    def _wake(self, index):
+        try:
+            os.write(self._wake_fds[index], b'\0')
+        except BlockingIOError:
+            # the pipe is full of wake ups already
+            pass
+        except BrokenPipeError:
+            # the worker's gone, drain() and close() deal with it
+            pass
+
+    def _results_ready(self, index):
+        try:
+            os.read(self._done_fds[index], 4096)
+        except BlockingIOError:
+            pass
+
+        ring = self._outboxes[index]
+        data = ring.data
+        sessions = self._sessions
+        while True:
+            pos = ring.get()
+            if pos < 0:
+                break
+
+            length, kind, lost, sequence, session_id, timestamp, ssrc, opus_len = _result.unpack_from(data, pos)
+            session = sessions.get(session_id)
+            if session is not None:
+                if kind == MARKED:
+                    session._marked()
+                else:
+                    start = pos + _result.size
+                    end = start + opus_len
+                    packet = RawData.from_decrypted(
+                        session.client, sequence, timestamp, ssrc,
+                        bytes(data[start:end]),
+                        bytes(data[end:pos + length]) if end < pos + length else None,
+                        lost,
+                    )
+                    try:
+                        session.emit(packet)
+                    except Exception:
+                        _log.exception('Handling a voice packet failed.')
+            ring.consume()
+        ring.release()
+
+    async def close(self) -> None:
+        """Stops the workers and frees the shared memory."""
+        if self._loop is None:
+            return
+
+        for fd in self._done_fds:
+            self._loop.remove_reader(fd)
+        # what's been submitted still gets handled
+        self._notify()
+        # closing the wake up pipes is what tells the workers to exit
+        for pipe in self._pipes:
+            pipe.close()
+
+        def join():
+            for process in self._processes:
+                process.join(5)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+
+        await self._loop.run_in_executor(None, join)
+        for ring in self._inboxes + self._outboxes:
+            ring.close(unlink=True)
+
+        self._processes.clear()
+        self._inboxes.clear()
+        self._outboxes.clear()
+        self._wake_fds.clear()
+        self._done_fds.clear()
+        self._pipes.clear()
+        self._sessions.clear()
+        self._reported_dead.clear()
+        self._loop = None
@@ -0,0 +1,282 @@
+"""
+Sending requests when the rate limits say there's room, instead of finding out from a 429.
+
+:class:`RequestScheduler` keeps what the ``X-RateLimit-*`` headers said about every bucket
+(requests left, when the window resets) and holds each request in its bucket's queue until
+the bucket has room. On top of that it keeps every request under a global cap, and when
+several buckets are waiting it takes turns between them, so one busy route can't starve
+the others. User accounts get penalized for racking up 429s, this tries not to get any.
+"""
+
+import asyncio
+import collections
+import datetime
+import logging
+from typing import Any, Callable, Deque, Dict, Mapping, Optional
+
+from discord.errors import RateLimited
+
+
+_log = logging.getLogger(__name__)
+
+IDLE_BUCKET = 300.0  # seconds a bucket with nothing going on is kept for
+
+
+class _Bucket:
+    __slots__ = ('key', 'limit', 'remaining', 'reset_at', 'inflight', 'waiters', 'known', 'last_used')
+
+    def __init__(self, key: str):
+        self.key = key
+        self.limit = 1
+        self.remaining = 1
+        self.reset_at: Optional[float] = None  # loop time the window resets at
+        self.inflight = 0
+        self.waiters: Deque[asyncio.Future] = collections.deque()
+        self.known = False  # seen its headers yet
+        self.last_used = 0.0
+
+    def ready_at(self, now: float) -> Optional[float]:
+        """When a request can go, `None` if that's once one in flight comes back."""
+        if self.reset_at is not None and now >= self.reset_at:
+            # new window
+            self.remaining = self.limit - self.inflight
+            self.reset_at = None
+        if not self.known:
+            # one at a time until the headers tell us more
+            return now if not self.inflight else None
+        if self.remaining > 0:
+            return now
+        if self.reset_at is None and not self.inflight:
+            # nothing left and nothing saying when it comes back, try anyway
+            return now
+        return self.reset_at
+
+
+class RequestScheduler:
+    """Queues requests per rate limit bucket and lets them go when the bucket has room.
+
+    Every :meth:`acquire` has to be followed by one :meth:`release`, with the response headers if there was a response.
+
+    Parameters
+    ----------
+    rate: :class:`int`
+        Requests allowed every ``per`` seconds, over all buckets. Discord's global limit is 50 per second.
+    per: :class:`float`
+        Seconds of the global window.
+    on_queued: Optional[Callable[[:class:`str`, :class:`float`], Any]]
+        Called with the bucket key and the seconds waited, for every request let through.
+    """
+
+    def __init__(self, *, rate: int = 45, per: float = 1.0, on_queued: Optional[Callable[[str, float], Any]] = None):
+        self.rate = rate
+        self.per = per
+        self.on_queued = on_queued
+
+        self._buckets: Dict[str, _Bucket] = {}
+        self._waiting: Deque[_Bucket] = collections.deque()  # buckets with requests queued, whose turn is first
+        # the global window : when the last requests came back, and how many are still out (they count until they're back,
+        # the server saw them somewhere in between)
+        self._done: Deque[float] = collections.deque()
+        self._inflight = 0
+        self._blocked_until = 0.0  # global 429
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.requests = 0
+        self.queued = 0  # requests that had to wait
+        self.queue_time = 0.0  # seconds waited, in total
+        self.max_queue_time = 0.0
+
+    def __repr__(self):
+        return f'<RequestScheduler buckets={len(self._buckets)} waiting={sum(len(bucket.waiters) for bucket in self._waiting)}>'
+
+    def _bucket(self, key: str) -> _Bucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= 256:
+                self._prune()
+            bucket = self._buckets[key] = _Bucket(key)
+        return bucket
+
+    def _prune(self):
+        expired = self._loop.time() - IDLE_BUCKET
+        for key, bucket in list(self._buckets.items()):
+            if bucket.last_used < expired and not bucket.inflight and not bucket.waiters:
+                del self._buckets[key]
+
+    def rename(self, key: str, new_key: str) -> None:
+        """The requests of ``key`` turned out to be in bucket ``new_key`` (from its bucket hash), they share one from now on.
+
+        Releasing with either key releases from the shared bucket after this.
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return
+        existing = self._buckets.get(new_key)
+        if existing is None:
+            bucket.key = new_key
+            self._buckets[new_key] = bucket
+            return
+        if existing is bucket:
+            return
+
+        # another route found the bucket first, what's out and what's queued here moves over to it
+        existing.inflight += bucket.inflight
+        existing.remaining -= bucket.inflight
+        existing.last_used = max(existing.last_used, bucket.last_used)
+        if bucket.waiters:
+            self._waiting.remove(bucket)
+            if not existing.waiters:
+                self._waiting.append(existing)
+            existing.waiters.extend(bucket.waiters)
+            bucket.waiters.clear()
+        bucket.inflight = 0
+        self._buckets[key] = existing
+        if existing.waiters and self._loop is not None:
+            self._dispatch()
+
+    def wait_time(self, key: str) -> float:
+        """Seconds a request to ``key`` would wait for its bucket's window, at least."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        bucket = self._buckets.get(key)
+        wait = max(0.0, self._blocked_until - now)
+        if bucket is not None and bucket.known and bucket.remaining <= 0 and bucket.reset_at is not None:
+            wait = max(wait, bucket.reset_at - now)
+        return wait
+
+    async def acquire(self, key: str, *, max_wait: Optional[float] = None) -> float:
+        """Waits for room in the bucket ``key``, returns how many seconds that took.
+
+        Raises
+        ------
+        RateLimited
+            The bucket resets further than ``max_wait`` seconds away.
+        """
+        loop = self._loop = asyncio.get_running_loop()
+        if max_wait:
+            wait = self.wait_time(key)
+            if wait > max_wait:
+                raise RateLimited(wait)
+
+        bucket = self._bucket(key)
+        start = loop.time()
+        future = loop.create_future()
+        if not bucket.waiters:
+            self._waiting.append(bucket)
+        bucket.waiters.append(future)
+        self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # let through right as we got cancelled, give the turn back
+                self.release(key)
+            raise
+
+        waited = loop.time() - start
+        self.requests += 1
+        if waited > 0:
+            self.queued += 1
+            self.queue_time += waited
+            self.max_queue_time = max(self.max_queue_time, waited)
+        if self.on_queued is not None:
+            self.on_queued(key, waited)
+        return waited
+
+    def release(
+        self,
+        key: str,
+        headers: Optional[Mapping[str, str]] = None,
+        *,
+        retry_after: Optional[float] = None,
+        is_global: bool = False,
+        use_clock: bool = False,
+    ) -> None:
+        """The request let through by :meth:`acquire` is done, with the response ``headers`` if it got one.
+
+        ``retry_after`` is for a 429, the bucket (or with ``is_global`` everything) waits that long.
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return
+        loop = self._loop or asyncio.get_running_loop()
+        now = loop.time()
+        bucket.inflight -= 1
+        bucket.last_used = now
+        self._inflight -= 1
+        self._done.append(now)
+
+        if headers is not None and 'X-Ratelimit-Remaining' in headers:
+            bucket.known = True
+            bucket.limit = int(headers.get('X-Ratelimit-Limit', 1))
+            # what's left once the requests still in flight are counted too
+            bucket.remaining = max(0, int(headers['X-Ratelimit-Remaining']) - bucket.inflight)
+            reset_after = headers.get('X-Ratelimit-Reset-After')
+            if use_clock or not reset_after:
+                reset = datetime.datetime.fromtimestamp(float(headers['X-Ratelimit-Reset']), datetime.timezone.utc)
+                reset_after = (reset - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+            bucket.reset_at = now + float(reset_after)
+
+        if retry_after is not None:
+            if is_global:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+                # the bucket didn't see it
+                if bucket.reset_at is not None:
+                    bucket.remaining += 1
+            else:
+                bucket.remaining = 0
+                bucket.reset_at = max(bucket.reset_at or 0.0, now + retry_after)
+
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        loop = self._loop
+        now = loop.time()
+        done = self._done
+        while done and done[0] <= now - self.per:
+            done.popleft()
+
+        wake_at = None
+        waiting = self._waiting
+        # every bucket gets one request through per turn, until the global window is full
+        passes = len(waiting)
+        while waiting and passes:
+            if now < self._blocked_until:
+                wake_at = self._blocked_until
+                break
+            if len(done) + self._inflight >= self.rate:
+                # or when one comes back
+                wake_at = done[0] + self.per if done else None
+                break
+
+            bucket = waiting.popleft()
+            passes -= 1
+            while bucket.waiters and bucket.waiters[0].done():
+                # cancelled while queued
+                bucket.waiters.popleft()
+            if not bucket.waiters:
+                continue
+
+            ready_at = bucket.ready_at(now)
+            if ready_at is not None and ready_at <= now:
+                bucket.waiters.popleft().set_result(None)
+                bucket.inflight += 1
+                bucket.remaining -= 1
+                bucket.last_used = now
+                self._inflight += 1
+                # it's had its turn, back of the queue, and whoever's left gets another pass
+                passes = len(waiting) + 1
+            elif ready_at is not None and (wake_at is None or ready_at < wake_at):
+                wake_at = ready_at
+
+            if bucket.waiters:
+                waiting.append(bucket)
+
+        if wake_at is not None and waiting:
+            self._timer = loop.call_at(wake_at, self._dispatch)
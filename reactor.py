@@ -0,0 +1,132 @@
+"""
+One receive reactor for every voice client of the process.
+
+The attached clients' voice sockets all go in one selector of the reactor's own (epoll /
+kqueue), and only that selector is registered with the event loop. However many calls
+there are, the loop watches one fd. When it's readable the reactor asks the selector which
+sockets have packets and reads just those, in batches into one shared set of buffers, since
+a batch is dispatched to its client's pipeline before the next socket is read.
+Idle calls cost nothing until a packet shows up.
+
+Where the selector can't be watched itself (no epoll or kqueue), every socket is registered
+with the loop on its own, like ``listen(batch=...)`` does.
+"""
+
+import asyncio
+import logging
+import selectors
+from typing import Callable, Dict, List, Optional
+
+import discord
+
+from .batch_recv import BatchReceiver
+from .recieve_audio import PooledDatagramTransport
+from .sinks import AudioSink
+
+
+_log = logging.getLogger(__name__)
+
+
+class ReceiveReactor:
+    """Reads the voice sockets of many clients and hands the packets to each client's pipeline.
+
+    Parameters
+    ----------
+    batch: :class:`int`
+        Datagrams read per syscall, shared by every client.
+    """
+
+    def __init__(self, *, batch: int = 32):
+        self._batch = BatchReceiver(batch)
+        self._tasks: Dict[discord.VoiceClient, asyncio.Task] = {}
+
+        selector = selectors.DefaultSelector()
+        if hasattr(selector, 'fileno'):
+            self._selector: Optional[selectors.BaseSelector] = selector
+        else:
+            selector.close()
+            self._selector = None
+        self._readers: Dict[int, Callable[[], None]] = {}  # fd -> its transport's read callback
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.wakeups = 0
+
+    def __len__(self):
+        return len(self._tasks)
+
+    @property
+    def clients(self) -> List[discord.VoiceClient]:
+        """The voice clients currently attached."""
+        return list(self._tasks)
+
+    @property
+    def datagrams(self) -> int:
+        """Datagrams read so far, for every client."""
+        return self._batch.datagrams
+
+    def transport_for(self, loop, sock, protocol) -> PooledDatagramTransport:
+        """Used by ``listen`` to read ``sock`` through this reactor."""
+        if self._selector is None:
+            return PooledDatagramTransport(loop, sock, protocol, batch=self._batch)
+        if self._loop is None:
+            self._loop = loop
+        elif loop is not self._loop:
+            raise RuntimeError('A reactor only works with the clients of one event loop.')
+        return PooledDatagramTransport(loop, sock, protocol, batch=self._batch, poller=self)
+
+    # what the transports call, instead of the loop's
+
+    def add_reader(self, fd: int, callback: Callable[[], None]) -> None:
+        selector = self._selector
+        if fd in self._readers:
+            selector.modify(fd, selectors.EVENT_READ, callback)
+        else:
+            selector.register(fd, selectors.EVENT_READ, callback)
+            if not self._readers:
+                self._loop.add_reader(selector.fileno(), self._read_ready)
+        self._readers[fd] = callback
+
+    def remove_reader(self, fd: int) -> bool:
+        if self._readers.pop(fd, None) is None:
+            return False
+        self._selector.unregister(fd)
+        if not self._readers:
+            self._loop.remove_reader(self._selector.fileno())
+        return True
+
+    def _read_ready(self):
+        self.wakeups += 1
+        # level triggered, a socket that isn't drained yet is back next time
+        for key, _ in self._selector.select(0):
+            key.data()
+
+    def attach(self, client: discord.VoiceClient, sink: AudioSink, **options) -> asyncio.Task:
+        """Starts receiving ``client``'s audio into ``sink``.
+
+        ``options`` are passed on to ``listen``. The returned task finishes once the client
+        is detached or disconnects, the client is forgotten by then.
+        """
+        if client in self._tasks:
+            raise discord.ClientException('Client is already attached.')
+
+        task = client.loop.create_task(client.listen(sink, reactor=self, **options))
+        self._tasks[client] = task
+        task.add_done_callback(lambda task: self._forget(client, task))
+        return task
+
+    def _forget(self, client, task):
+        if self._tasks.get(client) is task:
+            del self._tasks[client]
+        if not task.cancelled() and task.exception() is not None:
+            _log.error('Receiving audio failed for %s.', client, exc_info=task.exception())
+
+    def detach(self, client: discord.VoiceClient) -> None:
+        """Stops receiving ``client``'s audio."""
+        if client in self._tasks:
+            client.stop_listening()
+
+    async def close(self) -> None:
+        """Detaches every client and waits until they've all stopped."""
+        tasks = list(self._tasks.values())
+        for client in list(self._tasks):
+            client.stop_listening()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -2,48 +2,92 @@
 Recieving audio data from connected voice channel
 """
 
-import nacl
+import asyncio
+import logging
+import socket
 import struct
-import time
+from time import perf_counter_ns
+from typing import Optional
 
 import discord
 
+from .batch_recv import BatchReceiver
+from .decoder import OpusDecodeStage
+from .decryption import DECRYPT_ERRORS, PacketDecryptor
+from .jitter_buffer import JitterBufferStage
+from .metrics import ReceiveMetrics
+from .resample import ResampleStage
+from .silence import SilenceTimelineStage
+from .sinks import AudioSink
+
+
+_log = logging.getLogger(__name__)
+
+# sequence, timestamp and ssrc out of the fixed 12 byte RTP header
+_rtp_header = struct.Struct(">xxHII")
+
+SILENCE_FRAME = b"\xf8\xff\xfe"
+
 
 class RawData:
     """Handles raw data from Discord so that it can be decrypted and decoded to be used.
 
+    ``data`` is only read while constructing, it can be a view into a receive buffer
+    that gets reused for the next packet right after.
+
     .. versionadded:: 2.0
     """
 
-    def __init__(self, data, client):
-        self.data = bytearray(data)
+    __slots__ = ("client", "sequence", "timestamp", "ssrc", "decrypted_data", "decoded_data", "user_id", "lost")
+
+    def __init__(self, data, client, decryptor: Optional[PacketDecryptor] = None):
         self.client = client
 
-        self.header = data[:12]
-        self.data = self.data[12:]
-        import struct
-        unpacker = struct.Struct(">xxHII")
-        self.sequence, self.timestamp, self.ssrc = unpacker.unpack_from(self.header)
-        self.decrypted_data = getattr(self.client, f"_decrypt_{self.client.mode}")(
-            self.header, self.data
-        )
+        self.sequence, self.timestamp, self.ssrc = _rtp_header.unpack_from(data)
+        if decryptor is None:
+            decryptor = client._get_decryptor()
+        self.decrypted_data = decryptor.decrypt(data)
         self.decoded_data = None
 
-        self.user_id = None
+        users = client._ssrc_users
+        self.user_id = users.get(self.ssrc) if users else None
+        # packets missing right before this one, set by the jitter buffer
+        self.lost = 0
 
-def unpack_audio(vc, data):
-    """Takes an audio packet received from Discord and decodes it into pcm audio data.
-    If there are no users talking in the channel, `None` will be returned.
+    @classmethod
+    def from_decrypted(cls, client, sequence, timestamp, ssrc, decrypted_data, decoded_data=None, lost=0):
+        """For a packet that was decrypted (and maybe decoded) somewhere else."""
+        self = cls.__new__(cls)
+        self.client = client
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.ssrc = ssrc
+        self.decrypted_data = decrypted_data
+        self.decoded_data = decoded_data
 
-    You must be connected to receive audio.
+        users = client._ssrc_users
+        self.user_id = users.get(ssrc) if users else None
+        self.lost = lost
+        return self
 
-    .. versionadded:: 2.0
+    def is_silence(self) -> bool:
+        return self.decrypted_data == SILENCE_FRAME
+
+def unpack_packet(vc, data, decryptor: Optional[PacketDecryptor] = None):
+    """Takes a packet received from Discord and decrypts it into a :class:`RawData`.
+    RTCP packets and packets that can't be decrypted give `None`, frames of silence are kept
+    (they still take up a sequence number).
 
     Parameters
     ----------
-    data: :class:`bytes`
+    data: :term:`py:bytes-like object`
         Bytes received by Discord via the UDP connection used for sending and receiving voice data.
+    decryptor: Optional[:class:`PacketDecryptor`]
+        The voice client's, looked up from it if not given.
     """
+    if len(data) < _rtp_header.size:
+        # too short for an RTP header, nothing to make of it
+        return
     if 200 <= data[1] <= 204:
         # RTCP received.
         # RTCP provides information about the connection
@@ -51,69 +95,722 @@ def unpack_audio(vc, data):
         # important at the moment.
         return
 
-    data = RawData(data, vc)
+    try:
+        return RawData(data, vc, decryptor)
+    except DECRYPT_ERRORS:
+        _log.debug('Dropping a voice packet that failed to decrypt.')
+        return
+
 
-    if data.decrypted_data == b"\xf8\xff\xfe":  # Frame of silence
+def unpack_audio(vc, data):
+    """Takes an audio packet received from Discord and decodes it into pcm audio data.
+    If there are no users talking in the channel, `None` will be returned.
+
+    You must be connected to receive audio.
+
+    .. versionadded:: 2.0
+
+    Parameters
+    ----------
+    data: :term:`py:bytes-like object`
+        Bytes received by Discord via the UDP connection used for sending and receiving voice data.
+    """
+    data = unpack_packet(vc, data)
+
+    if data is None or data.is_silence():  # Frame of silence
         return
     return data.decrypted_data
 
 
-def strip_header_ext(data):
-    if data[0] == 0xBE and data[1] == 0xDE and len(data) > 4:
-        _, length = struct.unpack_from(">HH", data)
-        offset = 4 + length * 4
-        data = data[offset:]
-    return data
+class BufferPool:
+    """Preallocated receive buffers, so reading a packet doesn't allocate anything.
 
-# listen to content of voice channel
-class IOVoiceClient(discord.VoiceClient):
+    A buffer only has to live until its packets are decrypted,
+    running out just means a new one gets allocated (and kept, up to ``count``).
+    """
 
-    def _decrypt_xsalsa20_poly1305_lite(self, header, data):
-        box = nacl.secret.SecretBox(bytes(self.secret_key)) # type: ignore
+    def __init__(self, count=64, size=4096):
+        self.count = count
+        self.size = size
+        self._free = [memoryview(bytearray(size)) for _ in range(count)]
 
-        nonce = bytearray(24)
-        nonce[:4] = data[-4:]
-        data = data[:-4]
+    def acquire(self) -> memoryview:
+        try:
+            return self._free.pop()
+        except IndexError:
+            return memoryview(bytearray(self.size))
 
-        return strip_header_ext(box.decrypt(bytes(data), bytes(nonce)))
+    def release(self, buffer: memoryview) -> None:
+        if len(self._free) < self.count:
+            self._free.append(buffer)
 
-    async def listen(self):
-        import select
-        self.socket.listen
-        BUFFER_SIZE = 4096
 
-        # UDP socket : 
-        # Datagram socket (doesn't ) 
-        # data = self.socket.recv(BUFFER_SIZE)
-        def data_handler(data : bytes):
-            print(len(data))
-        
-        while True:
+# batches read in one go before giving other callbacks a turn
+MAX_BATCHES_PER_WAKEUP = 4
+
+# buffers are handed back before the loop runs anything else, so every listener can share them
+_buffer_pool = BufferPool()
+
+
+class PooledDatagramTransport(asyncio.DatagramTransport):
+    """Read side of a datagram transport that ``recv_into``'s pooled buffers.
+
+    The loop's own transport allocates a new bytes object for every datagram,
+    this one hands the protocol a view into a buffer that is reused once the protocol returns.
+    Sending still goes through the voice client's socket.
+
+    The socket is watched by ``poller`` (``add_reader`` / ``remove_reader``), the loop by default.
+    When the voice client's socket is replaced (new voice server), :meth:`rebind` moves it over.
+    """
+
+    def __init__(self, loop, sock, protocol, pool=_buffer_pool, *, batch: Optional[BatchReceiver] = None, poller=None):
+        super().__init__({'socket': sock, 'sockname': sock.getsockname()})
+        self._loop = loop
+        self._poller = poller if poller is not None else loop
+        self._sock = sock
+        self._protocol = protocol
+        self._pool = pool
+        self._batch = batch
+        self._read_ready = self._read_batch_ready if batch is not None else self._read_one_ready
+        self._closing = False
+        self._paused = False
+
+        loop.call_soon(protocol.connection_made, self)
+        loop.call_soon(self._add_reader)
+
+    def _add_reader(self):
+        # closed or paused before it got to run, close() / resume_reading() have it covered
+        if self._closing or self._paused or self._sock is None:
+            return
+        self._poller.add_reader(self._sock.fileno(), self._read_ready)
+
+    def _remove_reader(self):
+        if self._sock is not None:
+            self._poller.remove_reader(self._sock.fileno())
+
+    def rebind(self, sock: Optional[socket.socket]) -> None:
+        """Reads ``sock`` from now on and closes the socket read until now.
+
+        `None` reads nothing until the next rebind, for while the new socket is still busy with the handshake.
+        """
+        if self._closing:
+            if sock is not None:
+                sock.close()
+            return
+        if not self._paused:
+            self._remove_reader()
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = sock
+        self._extra['socket'] = sock
+        self._extra['sockname'] = sock.getsockname() if sock is not None else None
+        self._add_reader()
+
+    def _read_one_ready(self):
+        buffer = self._pool.acquire()
+        try:
+            size = self._sock.recv_into(buffer)
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError as exc:
+            self._protocol.error_received(exc)
+        else:
+            self._protocol.datagram_received(buffer[:size], None)
+        finally:
+            self._pool.release(buffer)
+
+    def _read_batch_ready(self):
+        # drain the socket, the batch's buffers get reused once the protocol is done with them.
+        # A flood could keep it from ever being empty, so let the loop run every few batches
+        batch = self._batch
+        for _ in range(MAX_BATCHES_PER_WAKEUP):
+            if self._closing or self._paused:
+                # paused by the sink in the last batch, the rest waits in the socket
+                return
             try:
-                ready, _, err = select.select([self.socket],[], [self.socket], 0.01)
-            except (OSError,ValueError):
-                print("wait error")
-                time.sleep(1)
+                datagrams = batch.recv(self._sock)
+            except OSError as exc:
+                self._protocol.error_received(exc)
+                return
+            if datagrams:
+                self._protocol.datagrams_received(datagrams)
+            if len(datagrams) < batch.count:
+                return
+
+    def is_closing(self) -> bool:
+        return self._closing
+
+    def pause_reading(self) -> None:
+        """Leaves incoming packets in the socket's buffer (which drops them once full)."""
+        if self._closing or self._paused:
+            return
+        self._paused = True
+        self._remove_reader()
+
+    def resume_reading(self) -> None:
+        if self._closing or not self._paused:
+            return
+        self._paused = False
+        self._add_reader()
+
+    def is_reading(self) -> bool:
+        return not self._closing and not self._paused
+
+    def close(self) -> None:
+        if self._closing:
+            return
+        self._closing = True
+        if not self._paused:
+            self._remove_reader()
+        self._loop.call_soon(self._call_connection_lost)
+
+    abort = close
+
+    def _call_connection_lost(self):
+        try:
+            self._protocol.connection_lost(None)
+        finally:
+            if self._sock is not None:
+                self._sock.close()
+
+
+class VoiceReceiveProtocol(asyncio.DatagramProtocol):
+    """Datagram protocol sitting on the voice UDP socket.
+
+    The event loop only calls into it when a packet actually arrives,
+    so an idle listener costs nothing and never blocks other tasks.
+    """
+
+    def __init__(
+        self,
+        client,
+        handler,
+        stages=(),
+        batch_handler=None,
+        metrics: Optional[ReceiveMetrics] = None,
+        decryptor: Optional[PacketDecryptor] = None,
+    ):
+        self.client = client
+        self.handler = handler
+        # resolved once, the voice client swaps it when the session changes (see _voice_ws_hook)
+        self.decryptor = decryptor if decryptor is not None else client._get_decryptor()
+        # takes a list of packets at once, when there is nothing in between the protocol and the sink
+        self.batch_handler = batch_handler
+        # the pipeline stages behind the handler, told when a speaker leaves
+        self.stages = stages
+        self.transport = None
+        self._closed = client.loop.create_future()
+
+        self.metrics = metrics
+        if metrics is not None:
+            # the plain path stays as it is, not even a check per packet
+            self._stats_of = metrics.ssrcs.get
+            self._unsampled = metrics.sample_every - 1
+            self.datagram_received = self._measured_datagram_received
+            self.datagrams_received = self._measured_datagrams_received
+
+        timings = getattr(client, 'timings', None)
+        if timings is not None and 'first_packet' not in timings:
+            # the connect timings want the first packet (see the voice_call module), only that one pays for it
+            self._time_first_packet()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def _time_first_packet(self):
+        received, batch_received = self.datagram_received, self.datagrams_received
+
+        def first(method):
+            def first_received(*args):
+                self.datagram_received, self.datagrams_received = received, batch_received
+                self.client._connect_phase('first_packet')
+                return method(*args)
+            return first_received
+
+        self.datagram_received = first(received)
+        self.datagrams_received = first(batch_received)
+
+    def datagram_received(self, data, addr):
+        # Decryption & Handling
+        packet = unpack_packet(self.client, data, self.decryptor)
+        if packet is None:
+            return
+        self.handler(packet)
+
+    def datagrams_received(self, datagrams):
+        """Batched :meth:`datagram_received`, decrypts the lot before handing it on."""
+        client = self.client
+        decryptor = self.decryptor
+        packets = []
+        for data in datagrams:
+            packet = unpack_packet(client, data, decryptor)
+            if packet is not None:
+                packets.append(packet)
+
+        if self.batch_handler is not None:
+            self.batch_handler(packets)
+        else:
+            handler = self.handler
+            for packet in packets:
+                handler(packet)
+
+    # with metrics
+    # Only the packets of every sample_every-th sequence number are timed, picked by the low bits of the
+    # sequence so it takes no state. The rest is counted inline, no method calls unless the sequence jumps.
+
+    def _timed_unpack(self, data):
+        metrics = self.metrics
+        start = perf_counter_ns()
+        try:
+            packet = RawData(data, self.client, self.decryptor)
+        except DECRYPT_ERRORS:
+            _log.debug('Dropping a voice packet that failed to decrypt.')
+            metrics.decrypt_failed(_rtp_header.unpack_from(data)[2])
+            return None
+        now = perf_counter_ns()
+        metrics.decrypt_latency.record(now - start)
+
+        stats = metrics.received(packet.ssrc, packet.sequence, len(data))
+        metrics.sampled(stats, packet.timestamp, now)
+        return packet
+
+    def _measured_datagram_received(self, data, addr):
+        if len(data) < _rtp_header.size:
+            return
+        if 200 <= data[1] <= 204:
+            self.metrics.rtcp += 1
+            return
+
+        if not data[3] & self._unsampled:
+            packet = self._timed_unpack(data)
+            if packet is not None:
+                start = perf_counter_ns()
+                self.handler(packet)
+                self.metrics.handler_latency.record(perf_counter_ns() - start)
+            return
+
+        try:
+            packet = RawData(data, self.client, self.decryptor)
+        except DECRYPT_ERRORS:
+            _log.debug('Dropping a voice packet that failed to decrypt.')
+            self.metrics.decrypt_failed(_rtp_header.unpack_from(data)[2])
+            return
+
+        # metrics.received, inlined
+        stats = self._stats_of(packet.ssrc)
+        if stats is None:
+            stats = self.metrics._stats(packet.ssrc, packet.sequence)
+        stats.packets += 1
+        stats.bytes += len(data)
+        sequence = packet.sequence
+        if sequence == stats.next or stats.jumped(sequence):
+            stats.next = (sequence + 1) & 0xFFFF
+        self.handler(packet)
+
+    def _measured_datagrams_received(self, datagrams):
+        metrics = self.metrics
+        client, decryptor, stats_of, unsampled = self.client, self.decryptor, self._stats_of, self._unsampled
+        packets = []
+        timed = False
+        for data in datagrams:
+            if len(data) < _rtp_header.size:
                 continue
-                
-            if not ready:
-                if err:
-                    print(err)
+            if 200 <= data[1] <= 204:
+                metrics.rtcp += 1
                 continue
-            
-            # Collect the data
-            try:
-                data = self.socket.recv(4096)
-            except (OSError):
+
+            if not data[3] & unsampled:
+                timed = True
+                packet = self._timed_unpack(data)
+                if packet is not None:
+                    packets.append(packet)
                 continue
 
-            # Decryption & Handling
-            data = unpack_audio(self,data)
-            if data is None: 
+            try:
+                packet = RawData(data, client, decryptor)
+            except DECRYPT_ERRORS:
+                _log.debug('Dropping a voice packet that failed to decrypt.')
+                metrics.decrypt_failed(_rtp_header.unpack_from(data)[2])
                 continue
-            data_handler(data)
+
+            stats = stats_of(packet.ssrc)
+            if stats is None:
+                stats = metrics._stats(packet.ssrc, packet.sequence)
+            stats.packets += 1
+            stats.bytes += len(data)
+            sequence = packet.sequence
+            if sequence == stats.next or stats.jumped(sequence):
+                stats.next = (sequence + 1) & 0xFFFF
+            packets.append(packet)
+
+        # the batches with a timed packet in them get the handler timed
+        if timed:
+            start = perf_counter_ns()
+        if self.batch_handler is not None:
+            self.batch_handler(packets)
+        else:
+            handler = self.handler
+            for packet in packets:
+                handler(packet)
+        if timed:
+            metrics.handler_latency.record(perf_counter_ns() - start)
+
+    def error_received(self, exc):
+        # ICMP errors and such, the socket is still usable
+        _log.debug('Voice receive socket error: %s', exc)
+
+    def connection_lost(self, exc):
+        if not self._closed.done():
+            self._closed.set_result(exc)
+
+    async def wait_closed(self):
+        return await self._closed
+
+
+class RawReceiveProtocol(VoiceReceiveProtocol):
+    """Hands the datagrams on as they are, for when decryption happens further down the pipeline.
+
+    The handler gets views into receive buffers that are reused right after it returns.
+    """
+
+    def datagram_received(self, data, addr):
+        self.handler(data)
+
+    def datagrams_received(self, datagrams):
+        handler = self.handler
+        for data in datagrams:
+            handler(data)
+
+    # with metrics, decryption happens out of sight so only what the header says is counted
+
+    def _measured_datagram_received(self, data, addr):
+        metrics = self.metrics
+        if len(data) < _rtp_header.size:
+            return
+        if 200 <= data[1] <= 204:
+            metrics.rtcp += 1
+            return
+
+        sequence, timestamp, ssrc = _rtp_header.unpack_from(data)
+        stats = self._stats_of(ssrc)
+        if stats is None:
+            stats = metrics._stats(ssrc, sequence)
+        stats.packets += 1
+        stats.bytes += len(data)
+        if sequence == stats.next or stats.jumped(sequence):
+            stats.next = (sequence + 1) & 0xFFFF
+        if sequence & self._unsampled:
+            self.handler(data)
+            return
+
+        start = perf_counter_ns()
+        metrics.sampled(stats, timestamp, start)
+        self.handler(data)
+        metrics.handler_latency.record(perf_counter_ns() - start)
+
+    def _measured_datagrams_received(self, datagrams):
+        for data in datagrams:
+            self._measured_datagram_received(data, None)
+
+
+# listen to content of voice channel
+class IOVoiceClient(discord.VoiceClient):
+
+    _receiver = None
+    _receiver_socket = None  # the socket the listener reads a dup of
+    _decryptor = None
+    _ssrc_users = None  # ssrc -> user id
+    _user_ssrcs = None  # user id -> ssrc
+
+    def _get_decryptor(self) -> PacketDecryptor:
+        """The decryptor for the current session, only rebuilt when the mode or the secret key changes."""
+        decryptor = self._decryptor
+        if decryptor is None or decryptor.mode != self.mode:
+            decryptor = self._decryptor = PacketDecryptor(self.mode, self.secret_key)
+        elif decryptor.secret_key is not self.secret_key:
+            decryptor.update_key(self.secret_key)
+        return decryptor
+
+    def _ensure_ssrc_index(self) -> None:
+        if self._ssrc_users is None:
+            self._ssrc_users = {}
+            self._user_ssrcs = {}
+
+    async def connect_websocket(self) -> discord.gateway.DiscordVoiceWebSocket:
+        """Same as the original, just hooking into the voice websocket events to learn who is who."""
+        self._ensure_ssrc_index()
+        ws = await discord.gateway.DiscordVoiceWebSocket.from_client(self, hook=self._voice_ws_hook)
+        self._connected.clear()
+        while ws.secret_key is None:
+            await ws.poll_event()
+        self._connected.set()
+        # past IP discovery, the listener can have the new socket
+        self._rebind_receiver()
+        return ws
+
+    def _rebind_receiver(self) -> None:
+        """Points the listener at ``self.socket`` if that was replaced since (new voice server, reconnect)."""
+        if self._receiver is None or self._receiver_socket is self.socket:
+            return
+        transport = self._receiver.transport
+        if transport is None:
+            return
+        self._receiver_socket = self.socket
+        transport.rebind(self.socket.dup())
+
+    async def _voice_ws_hook(self, ws, msg) -> None:
+        op = msg['op']
+        data = msg['d']
+
+        if op == ws.SPEAKING:
+            self._map_ssrc(int(data['ssrc']), int(data['user_id']))
+        elif op == ws.CLIENT_CONNECT:
+            # older gateway versions tell the ssrc right away
+            if data.get('audio_ssrc'):
+                self._map_ssrc(int(data['audio_ssrc']), int(data['user_id']))
+        elif op == ws.CLIENT_DISCONNECT:
+            self._unmap_user(int(data['user_id']))
+        elif op == ws.SESSION_DESCRIPTION:
+            # new key (or mode) after a reconnect, the listener keeps the decryptor it was given
+            if self._receiver is not None:
+                self._receiver.decryptor = self._get_decryptor()
+
+    def _map_ssrc(self, ssrc: int, user_id: int) -> None:
+        self._ensure_ssrc_index()
+        previous_user = self._ssrc_users.get(ssrc)
+        if previous_user == user_id:
+            return
+        if previous_user is not None:
+            self._user_ssrcs.pop(previous_user, None)
+
+        previous_ssrc = self._user_ssrcs.get(user_id)
+        if previous_ssrc is not None:
+            self._ssrc_users.pop(previous_ssrc, None)
+            if self._receiver is not None and self._receiver.metrics is not None:
+                self._receiver.metrics.remove(previous_ssrc)
+
+        self._ssrc_users[ssrc] = user_id
+        self._user_ssrcs[user_id] = ssrc
+
+    def _unmap_user(self, user_id: int) -> None:
+        if self._user_ssrcs is None:
+            return
+        ssrc = self._user_ssrcs.pop(user_id, None)
+        if ssrc is None:
+            return
+        self._ssrc_users.pop(ssrc, None)
+
+        # whatever the pipeline kept for them can go too
+        if self._receiver is not None:
+            for stage in self._receiver.stages:
+                stage.remove(ssrc)
+            if self._receiver.metrics is not None:
+                self._receiver.metrics.remove(ssrc)
+
+    def get_user_id(self, ssrc: int) -> Optional[int]:
+        """The ID of the user sending audio with ``ssrc``, if they've been seen speaking."""
+        return self._ssrc_users.get(ssrc) if self._ssrc_users else None
+
+    def get_ssrc(self, user_id: int) -> Optional[int]:
+        """The ssrc the user with ``user_id`` sends audio with, if they've been seen speaking."""
+        return self._user_ssrcs.get(user_id) if self._user_ssrcs else None
+
+    def is_listening(self) -> bool:
+        """Indicates if we're currently receiving audio."""
+        return self._receiver is not None
+
+    def stop_listening(self) -> None:
+        """Stops receiving audio, the pending :meth:`listen` call returns."""
+        if self._receiver is not None and self._receiver.transport is not None:
+            self._receiver.transport.close()
+
+    async def listen(
+        self,
+        sink: AudioSink,
+        *,
+        jitter_delay: Optional[float] = None,
+        decode: Optional[bool] = None,
+        decode_workers: Optional[int] = None,
+        silence: Optional[bool] = None,
+        resample: Optional[int] = None,
+        batch: Optional[int] = None,
+        reactor=None,
+        pool=None,
+        metrics: Optional[ReceiveMetrics] = None,
+    ):
+        """Receive audio into ``sink`` until :meth:`stop_listening` is called or we disconnect.
+
+        The packets are read by the event loop whenever the socket is readable,
+        into pooled buffers, so any number of listening clients can share one loop.
+
+        Parameters
+        ----------
+        sink: :class:`AudioSink`
+            Where the received packets (:class:`RawData`) go, see the ``sinks`` module.
+        jitter_delay: Optional[:class:`float`]
+            Put every speaker's packets back in sequence order, waiting on a missing
+            packet for up to this many seconds. By default packets are handled as they arrive.
+        decode: Optional[:class:`bool`]
+            Decode the Opus packets into 48kHz 16 bit stereo PCM (``RawData.decoded_data``),
+            on worker threads. Needs opus to be loaded. Defaults to what the sink needs.
+        decode_workers: Optional[:class:`int`]
+            Threads to decode with, defaults to the number of CPUs.
+        silence: Optional[:class:`bool`]
+            Hand the sink a :class:`SilenceSpan` for every stretch a speaker was quiet,
+            worked out from the RTP timestamps, so their timeline is kept. Silence is never
+            decoded either way. Defaults to what the sink wants (``sink.wants_silence``).
+        resample: Optional[:class:`int`]
+            Convert the decoded audio into 16 bit mono PCM at this rate (16000 for speech
+            recognition, it has to divide 48000) before it reaches the sink, its ``rate`` and
+            ``channels`` say so. Implies ``decode``, the sink has to ``accepts_resampled``.
+        batch: Optional[:class:`int`]
+            Read up to this many datagrams per wakeup (with one ``recvmmsg`` call on Linux)
+            and decrypt and hand them on as one batch. Worth it in busy group calls.
+        reactor: Optional[:class:`ReceiveReactor`]
+            Read the socket through this reactor instead, in its shared batches,
+            ``batch`` is ignored then. See :meth:`ReceiveReactor.attach`.
+        pool: Optional[:class:`ProcessPool`]
+            Decrypt (and decode) in these worker processes instead of on the event loop.
+            The workers decode in arrival order, concealing gaps and dropping packets
+            that come too late, ``jitter_delay`` then only reorders what comes back.
+        metrics: Optional[:class:`ReceiveMetrics`]
+            Count what's received into this, see the ``metrics`` module. With a ``pool``,
+            decrypt failures and latency happen in the workers and aren't counted.
+        """
+        if self._receiver is not None:
+            raise discord.ClientException('Already listening.')
+
+        if not isinstance(sink, AudioSink):
+            raise TypeError(f'sink must be an AudioSink not {sink.__class__.__name__}')
+
+        if decode is None:
+            decode = sink.needs_decoding or resample is not None
+        elif not decode and resample is not None:
+            raise ValueError('Only decoded audio can be resampled.')
+        elif not decode and sink.needs_decoding:
+            raise ValueError(f'{sink.__class__.__name__} needs decoded audio, it can\'t listen with decode=False.')
+        if resample is not None and not sink.accepts_resampled:
+            raise ValueError(f'{sink.__class__.__name__} only takes 48kHz stereo, it can\'t listen with resample.')
+        if silence is None:
+            silence = sink.wants_silence
+
+        # resolve the mode handler now, a mode we can't decrypt should fail here and not per packet
+        decryptor = self._get_decryptor()
+        self._ensure_ssrc_index()
+
+        # the pipeline : decrypted packet -> (jitter buffer) -> drop silence -> (decoder) -> (resampler) -> sink
+        # or with a pool : datagram -> pool -> (jitter buffer) -> drop silence -> (resampler) -> sink
+        # (to keep the silence, the timeline stage drops the silence frames instead)
+        stages = []
+        emit = sink.write
+        if resample is not None:
+            stages.append(ResampleStage(emit, loop=self.loop, rate=resample))
+            emit = stages[-1].push
+
+        if decode and pool is None:
+            stages.append(OpusDecodeStage(emit, loop=self.loop, workers=decode_workers))
+            emit = stages[-1].push
+
+        if silence:
+            stages.append(SilenceTimelineStage(emit, loop=self.loop, on_silence=metrics.silence if metrics is not None else None))
+            emit = stages[-1].push
+        else:
+            if metrics is None:
+                def drop_silence(packet: RawData, emit=emit):
+                    if not packet.is_silence():
+                        emit(packet)
+            else:
+                def drop_silence(packet: RawData, emit=emit):
+                    if not packet.is_silence():
+                        emit(packet)
+                    else:
+                        metrics.silence(packet.ssrc)
+            emit = drop_silence
+
+        if jitter_delay is not None:
+            stages.append(JitterBufferStage(emit, jitter_delay, loop=self.loop))
+            emit = stages[-1].push
+
+        if pool is not None:
+            stages.append(pool.open(self, emit, decode=decode))
+            emit = stages[-1].push
+
+        # UDP socket :
+        # The transport owns the socket it is given and closes it when done,
+        # so it gets a duplicate. The original is still used (and closed) by the voice client for sending.
+        sock = self.socket.dup()
+        self._receiver_socket = self.socket
+        if reactor is not None:
+            batch = True
+
+        if batch and not stages:
+            # straight to the sink
+            def write_batch(packets):
+                audio = [packet for packet in packets if not packet.is_silence()]
+                if metrics is not None and len(audio) != len(packets):
+                    for packet in packets:
+                        if packet.is_silence():
+                            metrics.silence(packet.ssrc)
+                sink.write_batch(audio)
+            batch_handler = write_batch
+        else:
+            batch_handler = None
+
+        if pool is not None:
+            protocol = RawReceiveProtocol(self, emit, stages, metrics=metrics, decryptor=decryptor)
+        else:
+            protocol = VoiceReceiveProtocol(self, emit, stages, batch_handler, metrics, decryptor)
+        if reactor is not None:
+            transport = reactor.transport_for(self.loop, sock, protocol)
+        else:
+            transport = PooledDatagramTransport(self.loop, sock, protocol, batch=BatchReceiver(batch) if batch else None)
+        if resample is not None:
+            sink.attach(self, transport, rate=resample, channels=1)
+        else:
+            sink.attach(self, transport)
+        if metrics is not None:
+            metrics.start(self)
+        self._receiver = protocol
+        try:
+            await protocol.wait_closed()
+        finally:
+            transport.close()
+            self._receiver = None
+            self._receiver_socket = None
+            # upstream first, what it lets go of still goes through the rest
+            for stage in reversed(stages):
+                stage.flush()
+                if hasattr(stage, 'drain'):
+                    await stage.drain()
+            sink.cleanup()
+            if metrics is not None:
+                metrics.stop()
+            await sink.wait_closed()
+
+    def cleanup(self) -> None:
+        self.stop_listening()
+        if self._ssrc_users is not None:
+            self._ssrc_users.clear()
+            self._user_ssrcs.clear()
+        discord.VoiceProtocol.cleanup(self)
 
 
 def apply():
-    discord.VoiceClient._decrypt_xsalsa20_poly1305_lite = IOVoiceClient._decrypt_xsalsa20_poly1305_lite #type: ignore
+    discord.VoiceClient._decryptor = None #type: ignore
+    discord.VoiceClient._get_decryptor = IOVoiceClient._get_decryptor #type: ignore
+    discord.VoiceClient._receiver = None #type: ignore
+    discord.VoiceClient._receiver_socket = None #type: ignore
+    discord.VoiceClient._rebind_receiver = IOVoiceClient._rebind_receiver #type: ignore
+    discord.VoiceClient._ssrc_users = None #type: ignore
+    discord.VoiceClient._user_ssrcs = None #type: ignore
+    discord.VoiceClient._ensure_ssrc_index = IOVoiceClient._ensure_ssrc_index #type: ignore
+    discord.VoiceClient.connect_websocket = IOVoiceClient.connect_websocket #type: ignore
+    discord.VoiceClient._voice_ws_hook = IOVoiceClient._voice_ws_hook #type: ignore
+    discord.VoiceClient._map_ssrc = IOVoiceClient._map_ssrc #type: ignore
+    discord.VoiceClient._unmap_user = IOVoiceClient._unmap_user #type: ignore
+    discord.VoiceClient.get_user_id = IOVoiceClient.get_user_id #type: ignore
+    discord.VoiceClient.get_ssrc = IOVoiceClient.get_ssrc #type: ignore
+    discord.VoiceClient.is_listening = IOVoiceClient.is_listening #type: ignore
+    discord.VoiceClient.stop_listening = IOVoiceClient.stop_listening #type: ignore
     discord.VoiceClient.listen = IOVoiceClient.listen #type: ignore
+    discord.VoiceClient.cleanup = IOVoiceClient.cleanup #type: ignore
@@ -0,0 +1,169 @@
+"""
+Turning the decoded audio into what speech recognition wants, 16kHz mono by default.
+
+The decoder gives 48kHz stereo. :class:`ResampleStage` averages the channels and
+low-pass filters and decimates in one go with NumPy, over every frame of a speaker
+that came in during the same loop iteration. Each speaker's filter picks up where
+their last frame left it, so frame boundaries don't click. The work buffers are
+allocated once and grown when needed, only the converted bytes are new.
+"""
+
+from typing import Callable, Dict, List
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+CLOCK_RATE = 48000  # what the decoder gives
+CHANNELS = 2
+TAPS_PER_STEP = 16  # filter length, per input sample skipped
+
+
+def lowpass(factor: int) -> np.ndarray:
+    """Kaiser windowed sinc anti-aliasing filter for keeping one sample in ``factor``, averaging the channels included."""
+    if factor == 1:
+        return np.array([0.5], dtype=np.float32)
+    taps = TAPS_PER_STEP * factor + 1
+    cutoff = 0.45 / factor  # of the input rate, a bit under the new nyquist
+    n = np.arange(taps) - (taps - 1) / 2
+    h = np.sinc(2 * cutoff * n) * np.kaiser(taps, 8.0)
+    # unity gain, halved since the two channels get summed
+    return (h / h.sum() * 0.5).astype(np.float32)
+
+
+class ResampleStage:
+    """Receive pipeline stage converting ``decoded_data`` into 16 bit mono PCM at ``rate``.
+
+    Goes right before the sink, after the decoder. Silence spans go through as they are
+    (their ``samples`` still count at 48kHz), a speaker's filter starts over after one.
+
+    Parameters
+    ----------
+    emit: Callable
+        Called with every converted packet, in the order they were pushed (per SSRC).
+    loop: :class:`asyncio.AbstractEventLoop`
+        The loop the pipeline runs on.
+    rate: :class:`int`
+        Sample rate to convert to, has to divide 48000.
+    """
+
+    def __init__(self, emit: Callable, *, loop, rate: int = 16000):
+        if rate <= 0 or CLOCK_RATE % rate:
+            raise ValueError(f'rate must divide {CLOCK_RATE}, not {rate!r}')
+
+        self.emit = emit
+        self.loop = loop
+        self.rate = rate
+        self.factor = CLOCK_RATE // rate
+        self.filter = lowpass(self.factor)
+        # input held back before the first frame, so the output lines up with the input (the filter is symmetric)
+        self._lead = (len(self.filter) - 1) // 2
+
+        # ssrc -> [input the next frame's filter still needs, how much of it there is]
+        self._speakers: Dict[int, List] = {}
+        self._pending: Dict[int, list] = {}
+        self._scheduled = False
+
+        self._input = np.zeros(0, dtype=np.float32)
+        self._windows = np.zeros((0, len(self.filter)), dtype=np.float32)
+        self._output = np.zeros(0, dtype=np.float32)
+        self._pcm = np.zeros(0, dtype=np.int16)
+
+    def push(self, packet) -> None:
+        pending = self._pending.get(packet.ssrc)
+        if pending is None:
+            pending = self._pending[packet.ssrc] = []
+        pending.append(packet)
+        if not self._scheduled:
+            self._scheduled = True
+            self.loop.call_soon(self._submit)
+
+    def _submit(self):
+        self._scheduled = False
+        pending, self._pending = self._pending, {}
+        emit = self.emit
+        for packets in pending.values():
+            for packet in self.convert(packets):
+                emit(packet)
+
+    def convert(self, packets: list) -> list:
+        """Converts the packets of one speaker in place, in one batch per stretch between silence spans."""
+        start = 0
+        for index, packet in enumerate(packets):
+            if packet.decoded_data is None:
+                # a silence span, or a packet that couldn't be decoded
+                self._convert_run(packets, start, index)
+                start = index + 1
+                if packet.decrypted_data is None:
+                    # what the filter holds was followed by silence, it's gone in the span
+                    self._speakers.pop(packet.ssrc, None)
+        self._convert_run(packets, start, len(packets))
+        return packets
+
+    def _convert_run(self, packets: list, start: int, end: int):
+        if start == end:
+            return
+        h = self.filter
+        taps = len(h)
+        factor = self.factor
+
+        state = self._speakers.get(packets[start].ssrc)
+        if state is None:
+            state = self._speakers[packets[start].ssrc] = [np.zeros(taps, dtype=np.float32), self._lead]
+        held, size = state
+
+        total = size + sum(len(packets[index].decoded_data) for index in range(start, end)) // (2 * CHANNELS)
+        x = self._buffer('_input', total)
+        x[:size] = held[:size]
+
+        # downmixing, the filter halves the sum
+        position = size
+        for index in range(start, end):
+            pcm = np.frombuffer(packets[index].decoded_data, dtype=np.int16)
+            samples = len(pcm) // CHANNELS
+            np.add(pcm[0::2], pcm[1::2], out=x[position:position + samples], dtype=np.float32)
+            position += samples
+
+        # every output sample is the filter over the input window starting factor samples after the last one
+        count = (total - taps) // factor + 1 if total >= taps else 0
+        pcm_out = self._buffer('_pcm', count)
+        if count:
+            step = x.strides[0]
+            # copied out, np.dot would copy the overlapping windows into a new array itself
+            windows = self._buffer('_windows', count)
+            np.copyto(windows, as_strided(x, (count, taps), (step * factor, step), writeable=False))
+            out = self._buffer('_output', count)
+            np.dot(windows, h, out=out)
+            np.rint(out, out=out)
+            np.clip(out, -32768, 32767, out=out)
+            pcm_out[:] = out
+
+        # each packet gets the output whose window ends within it
+        consumed = size
+        first = 0
+        for index in range(start, end):
+            packet = packets[index]
+            consumed += len(packet.decoded_data) // (2 * CHANNELS)
+            last = (consumed - taps) // factor + 1 if consumed >= taps else 0
+            packet.decoded_data = pcm_out[first:last].tobytes() if last > first else b''
+            first = last
+
+        used = count * factor
+        size = state[1] = total - used
+        held[:size] = x[used:total]
+
+    def _buffer(self, name: str, size: int) -> np.ndarray:
+        buffer = getattr(self, name)
+        if len(buffer) < size:
+            capacity = max(size, 2 * len(buffer), 1024)
+            buffer = np.zeros((capacity,) + buffer.shape[1:], dtype=buffer.dtype)
+            setattr(self, name, buffer)
+        return buffer[:size]
+
+    def remove(self, ssrc: int) -> None:
+        """Forgets the filter state of ``ssrc``, for when the speaker leaves."""
+        self._speakers.pop(ssrc, None)
+
+    def flush(self) -> None:
+        if self._scheduled:
+            self._submit()
@@ -0,0 +1,129 @@
+"""
+Keeping every speaker's timeline through the silence.
+
+Discord clients stop sending altogether when nobody talks (DTX), after a few frames of
+silence. The RTP timestamps keep running though, so when a speaker comes back the jump
+in timestamps says how long they were quiet. :class:`SilenceTimelineStage` turns that
+jump into one :class:`SilenceSpan` right before the packet, nothing is decoded and no PCM
+is allocated for the silence, whoever consumes the span makes up the samples if needed.
+"""
+
+from typing import Callable, Dict, List, Optional
+
+from .decoder import MAX_CONCEALED
+
+
+CLOCK_RATE = 48000  # RTP timestamp units per second
+SAMPLES_PER_FRAME = 960  # 20ms
+CLOCK_SLACK = 1.0  # seconds a speaker's timestamps can run ahead of when their packets came in
+
+
+class SilenceSpan:
+    """``samples`` (per channel, at 48kHz) of silence from a speaker, starting at RTP ``timestamp``.
+
+    Goes down the pipeline in place of the packets that were never sent,
+    sinks that don't want these don't get them (see :attr:`AudioSink.wants_silence`).
+    """
+
+    __slots__ = ('ssrc', 'user_id', 'timestamp', 'samples')
+
+    # RawData look alike
+    decrypted_data = None
+    decoded_data = None
+    lost = 0
+
+    def __init__(self, ssrc: int, user_id: Optional[int], timestamp: int, samples: int):
+        self.ssrc = ssrc
+        self.user_id = user_id
+        self.timestamp = timestamp
+        self.samples = samples
+
+    @property
+    def duration(self) -> float:
+        """In seconds."""
+        return self.samples / CLOCK_RATE
+
+    def is_silence(self) -> bool:
+        return True
+
+    def __repr__(self):
+        return f'<SilenceSpan ssrc={self.ssrc} timestamp={self.timestamp} duration={self.duration:.2f}s>'
+
+
+class SilenceTimelineStage:
+    """Receive pipeline stage dropping silence frames and emitting a :class:`SilenceSpan` for every quiet stretch.
+
+    Goes after the jitter buffer, it needs the packets in order. A speaker's first
+    packet gets a span back to when listening started, so everyone's timeline starts
+    at the same time. Trailing silence isn't emitted, there's nothing after it.
+
+    Parameters
+    ----------
+    emit: Callable
+        Called with the audio packets and the spans in between.
+    loop: :class:`asyncio.AbstractEventLoop`
+        For the clock, to keep a sender's jumping timestamps in check.
+    on_silence: Optional[Callable[[:class:`int`], None]]
+        Called with the SSRC of every silence frame dropped.
+    """
+
+    def __init__(self, emit: Callable, *, loop, on_silence: Optional[Callable[[int], None]] = None):
+        self.emit = emit
+        self.loop = loop
+        self.on_silence = on_silence
+        self._start = loop.time()
+        # ssrc -> [timestamp the next packet should have, when the last audio packet came in]
+        self._speakers: Dict[int, List] = {}
+
+        self.spans = 0
+
+    def push(self, packet) -> None:
+        state = self._speakers.get(packet.ssrc)
+        if packet.is_silence():
+            # they still take up time, the next span covers them
+            if state is None:
+                self._first(packet)
+            if self.on_silence is not None:
+                self.on_silence(packet.ssrc)
+            return
+
+        now = self.loop.time()
+        if state is None:
+            state = self._first(packet, now)
+
+        # signed, the timestamps wrap around at 2**32
+        gap = ((packet.timestamp - state[0] + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+        if gap < 0:
+            # late, what it covers was accounted for already
+            self.emit(packet)
+            return
+
+        # the decoder makes up for (some of) the lost frames before this one
+        silent = gap - min(packet.lost, MAX_CONCEALED) * SAMPLES_PER_FRAME
+        if silent > 0:
+            # a sender that restarted can jump anywhere, no more than what the clock says
+            limit = int((now - state[1] + CLOCK_SLACK) * CLOCK_RATE)
+            if silent > limit:
+                silent = limit // SAMPLES_PER_FRAME * SAMPLES_PER_FRAME
+            self.spans += 1
+            self.emit(SilenceSpan(packet.ssrc, packet.user_id, (packet.timestamp - silent) & 0xFFFFFFFF, silent))
+
+        state[0] = (packet.timestamp + SAMPLES_PER_FRAME) & 0xFFFFFFFF
+        state[1] = now
+        self.emit(packet)
+
+    def _first(self, packet, now: Optional[float] = None) -> List:
+        if now is None:
+            now = self.loop.time()
+        # whole frames since listening started
+        lead = int((now - self._start) * CLOCK_RATE) // SAMPLES_PER_FRAME * SAMPLES_PER_FRAME
+        state = self._speakers[packet.ssrc] = [(packet.timestamp - lead) & 0xFFFFFFFF, self._start]
+        return state
+
+    def remove(self, ssrc: int) -> None:
+        """Forgets the timeline of ``ssrc``, for when the speaker leaves."""
+        self._speakers.pop(ssrc, None)
+
+    def flush(self) -> None:
+        # nothing's held back, and silence after someone's last packet isn't written out
+        pass
@@ -0,0 +1,316 @@
+"""
+Where received audio ends up, pass one of these to ``VoiceClient.listen``.
+
+Every sink holds a bounded amount of audio. When its consumer falls behind,
+``policy`` decides what gives :
+
+- ``'drop_oldest'`` : make room by throwing away the oldest packet
+- ``'drop_newest'`` : throw away the packet that doesn't fit
+- ``'block'`` : stop reading the voice socket until there is room again
+  (packets already on their way through the pipeline are dropped like ``'drop_newest'``)
+
+None of them ever make the receive loop wait.
+"""
+
+import asyncio
+import collections
+import logging
+import threading
+import wave
+from typing import Any, Dict, List, Literal, Optional
+
+
+_log = logging.getLogger(__name__)
+
+Policy = Literal['drop_oldest', 'drop_newest', 'block']
+_policies = ('drop_oldest', 'drop_newest', 'block')
+
+_silence = memoryview(bytes(48000 * 4))  # a second of 48kHz 16 bit stereo, sliced without copying
+
+
+class AudioSink:
+    """Base class for everything that consumes received packets (:class:`RawData`).
+
+    ``write`` is called on the event loop for every packet and must not block.
+    """
+
+    #: Whether the packets need ``decoded_data`` (PCM), ``listen`` decodes by default if so.
+    needs_decoding = False
+    #: Whether to get a :class:`SilenceSpan` for every stretch a speaker was quiet,
+    #: instead of nothing at all. ``listen`` keeps the timeline by default if so.
+    wants_silence = False
+    #: Whether the decoded audio can come resampled (``listen(resample=...)``),
+    #: ``rate`` and ``channels`` then say what it is.
+    accepts_resampled = True
+
+    def __init__(self, policy: Policy = 'drop_oldest'):
+        if policy not in _policies:
+            raise ValueError(f'policy must be one of {", ".join(_policies)}, not {policy!r}')
+
+        self.policy = policy
+        self.client = None
+        self.transport = None
+        self.dropped = 0  # packets that didn't fit
+        self.rate = 48000  # of the decoded audio
+        self.channels = 2
+        self._paused = False
+
+    def attach(self, client, transport, *, rate: int = 48000, channels: int = 2) -> None:
+        """Called by ``listen`` before the first packet, with the rate and channels of the decoded audio."""
+        self.client = client
+        self.transport = transport
+        self.rate = rate
+        self.channels = channels
+
+    def write(self, packet) -> None:
+        raise NotImplementedError
+
+    def write_batch(self, packets) -> None:
+        """Called instead of ``write`` with a whole batch of packets when ``listen`` reads in batches."""
+        for packet in packets:
+            self.write(packet)
+
+    def cleanup(self) -> None:
+        """Called by ``listen`` once it stops, no more packets will be written."""
+        self._resume()
+
+    async def wait_closed(self) -> None:
+        """Waits until what was written is all out (files complete and closed), ``listen`` returns after it."""
+
+    # backpressure
+
+    def _pause(self) -> None:
+        if not self._paused and self.transport is not None:
+            self._paused = True
+            self.transport.pause_reading()
+
+    def _resume(self) -> None:
+        if self._paused:
+            self._paused = False
+            self.transport.resume_reading()
+
+
+class QueueSink(AudioSink):
+    """Puts the packets in an :class:`asyncio.Queue`.
+
+    Read it with :meth:`get` or ``async for packet in sink``, those also
+    let the socket be read again when the policy is ``'block'``.
+    """
+
+    def __init__(self, maxsize: int = 256, policy: Policy = 'drop_oldest', *, decoded: bool = False):
+        if maxsize <= 0:
+            # asyncio.Queue takes that as unbounded
+            raise ValueError(f'maxsize must be positive, not {maxsize}')
+        super().__init__(policy)
+        self.needs_decoding = decoded
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._closed = False
+
+    def write(self, packet) -> None:
+        queue = self.queue
+        if queue.full():
+            self.dropped += 1
+            if self.policy != 'drop_oldest':
+                return
+            queue.get_nowait()
+
+        queue.put_nowait(packet)
+        if self.policy == 'block' and queue.full():
+            self._pause()
+
+    async def get(self):
+        """Waits for the next packet, `None` once listening has stopped and everything was read."""
+        if self._closed and self.queue.empty():
+            return None
+
+        packet = await self.queue.get()
+        if self._paused and self.queue.qsize() <= self.queue.maxsize // 2:
+            self._resume()
+        return packet
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        packet = await self.get()
+        if packet is None:
+            raise StopAsyncIteration
+        return packet
+
+    def cleanup(self) -> None:
+        super().cleanup()
+        self._closed = True
+        # only an empty queue can have someone waiting on it, wake them up with the end marker
+        if self.queue.empty():
+            self.queue.put_nowait(None)
+
+
+class RingBufferSink(AudioSink):
+    """Keeps the latest ``capacity`` packets in a fixed size ring, nothing is allocated per packet."""
+
+    def __init__(self, capacity: int = 500, policy: Policy = 'drop_oldest', *, decoded: bool = False):
+        if capacity <= 0:
+            raise ValueError(f'capacity must be positive, not {capacity}')
+        super().__init__(policy)
+        self.needs_decoding = decoded
+        self.capacity = capacity
+        self._packets: List[Any] = [None] * capacity
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def write(self, packet) -> None:
+        if self._size == self.capacity:
+            self.dropped += 1
+            if self.policy != 'drop_oldest':
+                return
+            # overwrite the oldest
+            self._packets[self._start] = packet
+            self._start = (self._start + 1) % self.capacity
+            return
+
+        self._packets[(self._start + self._size) % self.capacity] = packet
+        self._size += 1
+        if self.policy == 'block' and self._size == self.capacity:
+            self._pause()
+
+    def read(self):
+        """Takes the oldest packet out, `None` if there's nothing."""
+        if not self._size:
+            return None
+
+        packet = self._packets[self._start]
+        self._packets[self._start] = None
+        self._start = (self._start + 1) % self.capacity
+        self._size -= 1
+
+        if self._paused and self._size <= self.capacity // 2:
+            self._resume()
+        return packet
+
+    def snapshot(self) -> List[Any]:
+        """The packets held, oldest first, without taking them out."""
+        return [self._packets[(self._start + i) % self.capacity] for i in range(self._size)]
+
+
+class FileSink(AudioSink):
+    """Streams every speaker's PCM into their own file, on a writer thread.
+
+    The stretches a speaker was quiet are written as silence,
+    so every file keeps time from when listening started. If writing fails (disk full,
+    a bad ``path_format``) the error is logged and kept in ``failed``, and everything
+    after it is dropped, listening goes on.
+
+    Parameters
+    ----------
+    path_format: :class:`str`
+        Path of each speaker's file, formatted with ``ssrc`` and ``user_id`` (`None` if unknown yet).
+    wav: :class:`bool`
+        Write WAV files, or headerless 16 bit PCM if `False` (48kHz stereo, unless ``listen`` resamples).
+    maxsize: :class:`int`
+        Frames that can wait for the writer thread.
+    """
+
+    needs_decoding = True
+    wants_silence = True
+
+    def __init__(self, path_format: str = '{ssrc}.wav', *, wav: bool = True, maxsize: int = 500, policy: Policy = 'drop_oldest'):
+        super().__init__(policy)
+        self.path_format = path_format
+        self.wav = wav
+        self.maxsize = maxsize
+
+        self._frames = collections.deque()
+        self._ready = threading.Condition()
+        self._closed = False
+        self.failed: Optional[BaseException] = None  # what stopped the writer thread, the frames are dropped from then on
+        self._files: Dict[int, Any] = {}
+        self._thread = threading.Thread(target=self._run, name='voice-file-writer')
+
+    def attach(self, client, transport, *, rate: int = 48000, channels: int = 2) -> None:
+        super().attach(client, transport, rate=rate, channels=channels)
+        self._thread.start()
+
+    def write(self, packet) -> None:
+        with self._ready:
+            if self.failed is not None:
+                self.dropped += 1
+                return
+            if len(self._frames) >= self.maxsize:
+                self.dropped += 1
+                if self.policy != 'drop_oldest':
+                    return
+                self._frames.popleft()
+
+            # silence spans go as their length, the writer thread makes the zeros
+            self._frames.append((packet.ssrc, packet.user_id, packet.decoded_data if packet.decoded_data is not None else packet.samples))
+            if self.policy == 'block' and len(self._frames) >= self.maxsize:
+                self._pause()
+            self._ready.notify()
+
+    def cleanup(self) -> None:
+        super().cleanup()
+        with self._ready:
+            self._closed = True
+            self._ready.notify()
+
+    async def wait_closed(self) -> None:
+        """Waits for the writer thread to write what's left and close the files."""
+        if self._thread.is_alive():
+            await self.client.loop.run_in_executor(None, self._thread.join)
+
+    def _run(self):
+        # writer thread
+        try:
+            while True:
+                with self._ready:
+                    while not self._frames and not self._closed:
+                        self._ready.wait()
+                    if not self._frames:
+                        break
+                    batch = list(self._frames)
+                    self._frames.clear()
+
+                if self._paused:
+                    self.client.loop.call_soon_threadsafe(self._resume)
+
+                for ssrc, user_id, pcm in batch:
+                    self._write_frame(ssrc, user_id, pcm)
+        except Exception as exc:
+            _log.exception('Writing received audio to file failed, the rest of it is dropped.')
+            with self._ready:
+                self.failed = exc
+                self.dropped += len(self._frames)
+                self._frames.clear()
+            # with the 'block' policy the socket could be waiting on us
+            self.client.loop.call_soon_threadsafe(self._resume)
+        finally:
+            for file in self._files.values():
+                file.close()
+            self._files.clear()
+
+    def _write_frame(self, ssrc: int, user_id: Optional[int], pcm):
+        try:
+            file = self._files[ssrc]
+        except KeyError:
+            path = self.path_format.format(ssrc=ssrc, user_id=user_id)
+            if self.wav:
+                file = wave.open(path, 'wb')
+                file.setnchannels(self.channels)
+                file.setsampwidth(2)
+                file.setframerate(self.rate)
+            else:
+                file = open(path, 'wb')
+            self._files[ssrc] = file
+
+        write = file.writeframesraw if self.wav else file.write
+        if isinstance(pcm, int):
+            # samples of silence, counted at 48kHz
+            size = pcm * self.rate // 48000 * self.channels * 2
+            while size > 0:
+                write(_silence[:size])
+                size -= len(_silence)
+        else:
+            write(pcm)
@@ -0,0 +1,72 @@
+import os
+import threading
+
+import pytest
+
+from ..decryption import DECRYPT_ERRORS, PacketDecryptor, has_aesgcm
+from ..encryption import PacketEncryptor
+from ..playback import _rtp_fields
+
+
+MODES = [
+    pytest.param(mode, marks=pytest.mark.skipif(not has_aesgcm, reason='needs cryptography'))
+    if mode == 'aead_aes256_gcm_rtpsize' else mode
+    for mode in PacketEncryptor.supported_modes
+]
+
+
+def _header(sequence):
+    header = bytearray(12)
+    header[0] = 0x80
+    header[1] = 0x78
+    _rtp_fields.pack_into(header, 2, sequence, sequence * 960, 1234)
+    return header
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_round_trip(mode):
+    key = list(os.urandom(32))
+    encryptor = PacketEncryptor(mode, key)
+    decryptor = PacketDecryptor(mode, key)
+    for sequence in range(3):
+        data = os.urandom(40 + sequence)
+        packet = encryptor.encrypt(_header(sequence), data)
+        assert packet[:12] == _header(sequence)
+        assert decryptor.decrypt(packet) == data
+        assert decryptor.decrypt(memoryview(packet)) == data
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_other_key_does_not_decrypt(mode):
+    encryptor = PacketEncryptor(mode, list(os.urandom(32)))
+    decryptor = PacketDecryptor(mode, list(os.urandom(32)))
+    with pytest.raises(DECRYPT_ERRORS):
+        decryptor.decrypt(encryptor.encrypt(_header(0), b'opus'))
+
+
+def test_new_key():
+    first, second = list(os.urandom(32)), list(os.urandom(32))
+    encryptor = PacketEncryptor('xsalsa20_poly1305_lite', first)
+    encryptor.update_key(second)
+    assert PacketDecryptor('xsalsa20_poly1305_lite', second).decrypt(encryptor.encrypt(_header(0), b'opus')) == b'opus'
+
+
+def test_threads_never_share_a_nonce():
+    # the player and a Broadcaster sending with the same voice client
+    encryptor = PacketEncryptor('xsalsa20_poly1305_lite', list(os.urandom(32)), nonce=0xFFFFFFFF - 1000)
+    nonces = [[] for _ in range(4)]
+
+    def send(out):
+        for _ in range(2000):
+            out.append(bytes(encryptor.encrypt(_header(0), b'opus')[-4:]))
+
+    threads = [threading.Thread(target=send, args=(out,)) for out in nonces]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    every = [nonce for out in nonces for nonce in out]
+    assert len(set(every)) == len(every) == 8000
+    # wrapped around
+    assert encryptor.nonce == 8000 - 1001
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+from discord.http import Route
+
+from ..benchmarks.http_server import FakeDiscordAPI
+from ..http_metrics import HTTPMetrics
+from ..user_client import NonBotHTTPClient
+
+
+class _Failed(Exception):
+    pass
+
+
+def _fake_request(metrics, results):
+    """Goes through ``results`` (status of the last attempt, or `None` to raise), like the real one would report them."""
+    results = iter(results)
+
+    async def _request(route, *, files=None, form=None, _trace=None, **kwargs):
+        status = next(results)
+        _trace[1] = 1
+        if status in (429, 500):
+            metrics.retry(route.key, 2, status)
+            if status == 429:
+                metrics.rate_limited(route.key, 'bucket', 0.5)
+            _trace[1] = 2
+            status = 200
+        _trace[0] = status
+        if status is None:
+            raise _Failed
+        if status >= 400:
+            raise _Failed(status)
+        return {}
+
+    return _request
+
+
+def test_counters():
+    async def main():
+        events = []
+        metrics = HTTPMetrics(hook=lambda event, data: events.append((event, data)))
+        http = NonBotHTTPClient(asyncio.get_running_loop())
+        http.metrics = metrics
+        http._request = _fake_request(metrics, [200, 404, 429, 500, None])
+        route = Route('GET', '/channels/{channel_id}', channel_id=1)
+        for _ in range(5):
+            try:
+                await http.request(route)
+            except _Failed:
+                pass
+        await http.close()
+        return metrics, events
+
+    metrics, events = asyncio.run(main())
+    stats = metrics.snapshot()['routes']['GET /channels/{channel_id}']
+    assert stats['requests'] == 5 and metrics.requests == 5
+    assert stats['failures'] == 2
+    assert stats['statuses'] == {200: 3, 404: 1}
+    assert stats['retries'] == 2 == metrics.retries
+    assert stats['ratelimited'] == 1 and metrics.ratelimited['bucket'] == 1
+    assert metrics.recent_429s == 1
+    assert stats['latency']['count'] == 5
+    assert [event for event, _ in events] == ['request', 'request', 'retry', 'ratelimited', 'request', 'retry', 'request', 'request']
+    assert events[-1][1] == {'route': 'GET /channels/{channel_id}', 'status': None, 'seconds': pytest.approx(0, abs=1), 'attempts': 1}
+
+
+def test_against_the_api():
+    async def main():
+        events = []
+        api = FakeDiscordAPI(limit=50)
+        base = Route.BASE
+        Route.BASE = await api.start()
+        http = NonBotHTTPClient(asyncio.get_running_loop())
+        metrics = http.metrics = HTTPMetrics(hook=lambda event, data: events.append((event, data)))
+        try:
+            await http.static_login('token')
+            route = Route('GET', '/channels/{channel_id}', channel_id=1)
+            for _ in range(3):
+                await http.request(route)
+        finally:
+            await http.close()
+            await api.stop()
+            Route.BASE = base
+        return metrics, events
+
+    metrics, events = asyncio.run(main())
+    snapshot = metrics.snapshot()
+    route = snapshot['routes']['GET /channels/{channel_id}']
+    assert route['requests'] == 3 and route['statuses'] == {200: 3}
+    # learned once, the next requests already know it
+    assert route['hashes_found'] == 1
+    assert ('hash_found', {'route': 'GET /channels/{channel_id}'}) in events
+    assert snapshot['hashes_found'] == 2  # and /users/@me, logging in
+    for phase in ('queue', 'network', 'parse'):
+        assert snapshot['phases'][phase]['count'] == 4
+    assert snapshot['phases']['retry_sleep']['count'] == 0
@@ -0,0 +1,73 @@
+import asyncio
+import os
+
+import pytest
+
+from ..benchmarks.client import StubClient
+from ..benchmarks.rtp import encrypt_packet
+from ..metrics import ReceiveMetrics
+from ..recieve_audio import RawReceiveProtocol, VoiceReceiveProtocol
+
+
+MODE = 'xsalsa20_poly1305_lite'
+
+
+def _received(protocol_class, sequences, batch=False, **kwargs):
+    async def main():
+        key = os.urandom(32)
+        client = StubClient(asyncio.get_running_loop(), MODE, key)
+        metrics = ReceiveMetrics(**kwargs)
+        got = []
+        protocol = protocol_class(client, got.append, metrics=metrics)
+        packets = [encrypt_packet(MODE, key, sequence, ssrc=5, timestamp=sequence * 960) for sequence in sequences]
+        # RTCP, too short, and one that doesn't decrypt
+        packets += [b'\x80\xc9' + bytes(30), bytes(5), encrypt_packet(MODE, key, 0, ssrc=6)[:-5] + bytes(5)]
+        if batch:
+            protocol.datagrams_received(packets)
+        else:
+            for data in packets:
+                protocol.datagram_received(data, None)
+        return metrics, got
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize('batch', [False, True])
+def test_counts_across_the_wrap_around(batch):
+    # 65534, 65535, 0 are in order, then 2 is missing and 3 is late
+    metrics, got = _received(VoiceReceiveProtocol, [65534, 65535, 0, 1, 4, 5, 3], batch)
+    stats = metrics.ssrcs[5]
+    assert stats.packets == 7 == len(got)
+    assert (stats.gaps, stats.late, stats.lost) == (1, 1, 1)
+    assert stats.next == 6
+    assert metrics.rtcp == 1
+    assert metrics.ssrcs[6].decrypt_failures == 1 and metrics.ssrcs[6].packets == 0
+
+
+def test_times_only_the_sampled_sequence_numbers():
+    metrics, _ = _received(VoiceReceiveProtocol, range(200), sample_every=64)
+    # 0, 64, 128 and 192
+    assert metrics.decrypt_latency.count == 4
+    assert metrics.handler_latency.count == 4
+    assert metrics.ssrcs[5].packets == 200
+
+
+def test_raw_protocol_counts_what_the_header_says():
+    metrics, got = _received(RawReceiveProtocol, range(10), sample_every=4)
+    # the one that doesn't decrypt is handed on like the rest, no way to know
+    assert len(got) == 11
+    assert metrics.ssrcs[5].packets == 10 and metrics.ssrcs[6].packets == 1
+    assert metrics.handler_latency.count == 4
+    assert metrics.rtcp == 1
+
+
+def test_remove_forgets_the_speaker():
+    metrics, _ = _received(VoiceReceiveProtocol, range(3))
+    metrics.remove(5)
+    assert 5 not in metrics.snapshot()['ssrcs']
+
+
+@pytest.mark.parametrize('sample_every', [0, 3, 512])
+def test_sample_every_has_to_be_a_power_of_two(sample_every):
+    with pytest.raises(ValueError):
+        ReceiveMetrics(sample_every=sample_every)
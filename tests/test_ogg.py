@@ -0,0 +1,109 @@
+import os
+import struct
+
+import pytest
+
+from ..ogg import PAGE_SIZE, PRE_SKIP, SAMPLES_PER_FRAME, OggOpusStream, ogg_crc, opus_samples
+
+
+def _crc(data):
+    # bit by bit, straight from the spec
+    crc = 0
+    for byte in data:
+        crc ^= byte << 24
+        for _ in range(8):
+            crc = (crc << 1) ^ 0x04C11DB7 if crc & 0x80000000 else crc << 1
+            crc &= 0xFFFFFFFF
+    return crc
+
+
+def _pages(data):
+    """(flags, granule, sequence, packets) of every page, after checking its checksum."""
+    pages = []
+    position = 0
+    while position < len(data):
+        magic, _, flags, granule, _, sequence, crc, count = struct.unpack_from('<4sBBqIIIB', data, position)
+        assert magic == b'OggS'
+        segments = data[position + 27:position + 27 + count]
+        size = 27 + count + sum(segments)
+        page = bytearray(data[position:position + size])
+        page[22:26] = bytes(4)
+        assert _crc(page) == crc
+
+        packets, packet, offset = [], b'', position + 27 + count
+        for segment in segments:
+            packet += data[offset:offset + segment]
+            offset += segment
+            if segment < 255:
+                packets.append(packet)
+                packet = b''
+        pages.append((flags, granule, sequence, packets))
+        position += size
+    return pages
+
+
+@pytest.mark.parametrize('size', [0, 1, 4, 27, 300, 4096])
+def test_ogg_crc(size):
+    data = os.urandom(size)
+    assert ogg_crc(data) == _crc(data)
+
+
+@pytest.mark.parametrize('packet, samples', [
+    (b'', 0),
+    (b'\xf8\xff\xfe', 960),  # CELT 20ms, one frame
+    (b'\x78\x00', 960),  # hybrid 20ms
+    (b'\x09\x00', 1920),  # SILK 40ms
+    (b'\xf9\x00', 1920),  # two frames of 20ms
+    (b'\xfb\x06', 5760),  # code 3, six frames
+    (b'\xfb', 0),  # code 3 without its frame count
+])
+def test_opus_samples(packet, samples):
+    assert opus_samples(packet) == samples
+
+
+def test_pages():
+    stream = OggOpusStream(7)
+    frame = b'\x78' + bytes(300)
+    for index in range(30):
+        assert stream.write(frame, 1000 + index * SAMPLES_PER_FRAME)
+    # 100ms gone, then one that came late
+    assert stream.write(frame, 1000 + 35 * SAMPLES_PER_FRAME)
+    assert not stream.write(frame, 1000)
+    pages = _pages(stream.take(end=True))
+
+    flags = [page[0] for page in pages]
+    assert flags[0] == 0x02 and flags[-1] == 0x04 and not any(flags[1:-1])
+    assert [page[2] for page in pages] == list(range(len(pages)))
+    assert pages[0][3][0][:8] == b'OpusHead'
+    assert struct.unpack_from('<H', pages[0][3][0], 10)[0] == PRE_SKIP
+    assert pages[1][3][0][:8] == b'OpusTags'
+
+    audio = [packet for page in pages[2:] for packet in page[3]]
+    assert audio == [frame] * 30 + [b'\xf8\xff\xfe'] * 5 + [frame]
+    # a page ends at its granule, the last one at the end of the stream
+    assert all(sum(len(packet) for packet in page[3]) < PAGE_SIZE + len(frame) for page in pages)
+    assert pages[-1][1] == 36 * SAMPLES_PER_FRAME
+    granules = [page[1] for page in pages[2:]]
+    assert granules == sorted(granules)
+
+
+def test_end_after_everything_was_taken():
+    stream = OggOpusStream(7)
+    for index in range(30):
+        stream.write(b'\x78' + bytes(300), index * SAMPLES_PER_FRAME)
+    taken = stream.take()
+    rest = stream.take(end=True)
+    pages = _pages(taken + rest)
+
+    # the last page with packets marks the end, no empty one after it
+    assert pages[-1][0] == 0x04 and pages[-1][3]
+    assert [page[1] for page in pages].count(30 * SAMPLES_PER_FRAME) == 1
+    assert stream.take(end=True) == b''
+
+
+def test_end_of_a_stream_without_audio():
+    stream = OggOpusStream(7)
+    stream.silence(100)  # under a frame, nothing to fill in
+    pages = _pages(stream.take() + stream.take(end=True))
+    # the tags page ends it
+    assert [(page[0], page[3][0][:8]) for page in pages] == [(0x02, b'OpusHead'), (0x04, b'OpusTags')]
@@ -0,0 +1,61 @@
+import asyncio
+
+from discord.http import Route
+
+from ..benchmarks.http_server import FakeDiscordAPI
+from ..ratelimit import RequestScheduler
+from ..user_client import NonBotHTTPClient
+
+
+def test_routes_finding_the_same_bucket():
+    # both routes are in the "channels" bucket of channel 1, and learn its hash at the same time
+    async def main():
+        api = FakeDiscordAPI(limit=50, latency=0.05)
+        base = Route.BASE
+        Route.BASE = await api.start()
+        http = NonBotHTTPClient(asyncio.get_running_loop())
+        scheduler = http.scheduler = RequestScheduler()
+        try:
+            await http.static_login('token')
+            routes = [Route('GET', '/channels/{channel_id}/messages', channel_id=1), Route('GET', '/channels/{channel_id}', channel_id=1)]
+            await asyncio.gather(*(http.request(route) for route in routes))
+            # and again, now that they know
+            await asyncio.gather(*(http.request(route) for route in routes))
+        finally:
+            await http.close()
+            await api.stop()
+            Route.BASE = base
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    assert scheduler._inflight == 0
+    assert all(bucket.inflight == 0 for bucket in scheduler._buckets.values())
+    # one bucket left for channel 1, whatever key it's looked up with
+    channel = {id(bucket) for key, bucket in scheduler._buckets.items() if key.endswith(':1')}
+    assert len(channel) == 1
+
+
+def test_rename_into_a_known_bucket_moves_the_queue():
+    async def main():
+        scheduler = RequestScheduler()
+        await scheduler.acquire('a')
+        await scheduler.acquire('b')
+        # the buckets aren't known yet, one request at a time
+        queued = asyncio.ensure_future(scheduler.acquire('b'))
+        await asyncio.sleep(0)
+        assert not queued.done()
+
+        scheduler.rename('a', 'shared')
+        scheduler.rename('b', 'shared')
+        bucket = scheduler._buckets['shared']
+        assert scheduler._buckets['a'] is bucket and scheduler._buckets['b'] is bucket
+        assert bucket.inflight == 2
+
+        scheduler.release('a')
+        scheduler.release('shared')
+        await asyncio.wait_for(queued, 1)
+        scheduler.release('b')
+        assert bucket.inflight == 0
+        assert scheduler._inflight == 0
+
+    asyncio.run(main())
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import socket
+
+from ..benchmarks.rtp import encrypt_packet
+from ..recieve_audio import BufferPool, IOVoiceClient, PooledDatagramTransport, RawData, VoiceReceiveProtocol, unpack_packet
+from ..sinks import QueueSink
+
+
+MODE = 'xsalsa20_poly1305_lite'
+
+
+class _VoiceClient:
+    """Just enough of a voice client to listen, with the receive methods of the real one."""
+
+    _receiver = None
+    _receiver_socket = None
+    _decryptor = None
+    _ssrc_users = None
+    _user_ssrcs = None
+
+    _get_decryptor = IOVoiceClient._get_decryptor
+    _ensure_ssrc_index = IOVoiceClient._ensure_ssrc_index
+    _rebind_receiver = IOVoiceClient._rebind_receiver
+    listen = IOVoiceClient.listen
+    stop_listening = IOVoiceClient.stop_listening
+
+    def __init__(self, loop, key):
+        self.loop = loop
+        self.mode = MODE
+        self.secret_key = list(key)
+        self.socket = self.new_socket()
+
+    @staticmethod
+    def new_socket():
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        sock.setblocking(False)
+        return sock
+
+
+def test_packet_outlives_its_receive_buffer():
+    key = os.urandom(32)
+    client = _VoiceClient(None, key)
+    buffer = memoryview(bytearray(4096))
+    data = encrypt_packet(MODE, key, 7, payload=b'opus', ssrc=99, timestamp=960)
+    buffer[:len(data)] = data
+
+    packet = RawData(buffer[:len(data)], client)
+    # the next datagram lands in the same buffer
+    buffer[:len(data)] = bytes(len(data))
+    assert (packet.sequence, packet.timestamp, packet.ssrc, packet.decrypted_data) == (7, 960, 99, b'opus')
+    client.socket.close()
+
+
+def test_unpack_drops_what_is_not_audio():
+    key = os.urandom(32)
+    client = _VoiceClient(None, key)
+    data = encrypt_packet(MODE, key, 1)
+    assert unpack_packet(client, data) is not None
+    # too short for a header, RTCP, and a packet that doesn't decrypt
+    assert unpack_packet(client, data[:11]) is None
+    assert unpack_packet(client, b'\x80\xc8' + bytes(30)) is None
+    assert unpack_packet(client, data[:-5] + bytes(5)) is None
+    client.socket.close()
+
+
+def test_buffer_pool_reuses_its_buffers():
+    pool = BufferPool(count=2, size=64)
+    first, second = pool.acquire(), pool.acquire()
+    # ran out, a new one
+    third = pool.acquire()
+    assert len(third) == 64
+    for buffer in (first, second, third):
+        pool.release(buffer)
+    # only count of them kept
+    assert len(pool._free) == 2
+    assert pool.acquire() is second
+
+
+def test_transport_hands_the_buffers_back():
+    async def main():
+        loop = asyncio.get_running_loop()
+        key = os.urandom(32)
+        client = _VoiceClient(loop, key)
+        pool = BufferPool(count=4)
+        got = []
+        protocol = VoiceReceiveProtocol(client, got.append)
+        transport = PooledDatagramTransport(loop, client.socket.dup(), protocol, pool)
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for sequence in range(10):
+            sender.sendto(encrypt_packet(MODE, key, sequence), client.socket.getsockname())
+        await asyncio.sleep(0.05)
+
+        assert [packet.sequence for packet in got] == list(range(10))
+        assert len(pool._free) == 4
+        transport.close()
+        await protocol.wait_closed()
+        sender.close()
+        client.socket.close()
+
+    asyncio.run(main())
+
+
+async def _receive(sink, count):
+    return [await asyncio.wait_for(sink.get(), 1) for _ in range(count)]
+
+
+def test_listen_follows_a_new_socket():
+    async def main():
+        loop = asyncio.get_running_loop()
+        key = os.urandom(32)
+        client = _VoiceClient(loop, key)
+        sink = QueueSink()
+        listening = asyncio.ensure_future(client.listen(sink))
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            await asyncio.sleep(0.01)
+            sender.sendto(encrypt_packet(MODE, key, 1), client.socket.getsockname())
+            assert [packet.sequence for packet in await _receive(sink, 1)] == [1]
+
+            # what a new voice server does, connect_websocket rebinds once the handshake is done
+            old = client.socket
+            client.socket = client.new_socket()
+            old.close()
+            client._rebind_receiver()
+
+            sender.sendto(encrypt_packet(MODE, key, 2), client.socket.getsockname())
+            assert [packet.sequence for packet in await _receive(sink, 1)] == [2]
+        finally:
+            client.stop_listening()
+            await asyncio.wait_for(listening, 1)
+            sender.close()
+            client.socket.close()
+        assert client._receiver is None and client._receiver_socket is None
+
+    asyncio.run(main())
+
+
+def test_rebind_to_nothing_reads_nothing():
+    async def main():
+        loop = asyncio.get_running_loop()
+        key = os.urandom(32)
+        client = _VoiceClient(loop, key)
+        got = []
+        protocol = VoiceReceiveProtocol(client, got.append)
+        transport = PooledDatagramTransport(loop, client.socket.dup(), protocol)
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        await asyncio.sleep(0)
+
+        transport.rebind(None)
+        sender.sendto(encrypt_packet(MODE, key, 1), client.socket.getsockname())
+        await asyncio.sleep(0.05)
+        assert got == []
+
+        transport.rebind(client.socket.dup())
+        await asyncio.sleep(0.05)
+        # waited in the socket
+        assert [packet.sequence for packet in got] == [1]
+
+        transport.close()
+        await protocol.wait_closed()
+        sender.close()
+        client.socket.close()
+
+    asyncio.run(main())
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import tempfile
+import wave
+
+import pytest
+
+from ..sinks import FileSink, QueueSink, RingBufferSink
+
+
+class _Transport:
+    def __init__(self):
+        self.reading = True
+        self.pauses = 0
+
+    def pause_reading(self):
+        self.reading = False
+        self.pauses += 1
+
+    def resume_reading(self):
+        self.reading = True
+
+
+class _Client:
+    def __init__(self, loop):
+        self.loop = loop
+
+
+class _Packet:
+    def __init__(self, sequence, ssrc=1, decoded_data=None, samples=None):
+        self.sequence = sequence
+        self.ssrc = ssrc
+        self.user_id = None
+        self.decoded_data = decoded_data
+        self.samples = samples
+
+
+def _attached(sink, loop=None):
+    transport = _Transport()
+    sink.attach(_Client(loop), transport)
+    return transport
+
+
+def test_bad_settings():
+    with pytest.raises(ValueError):
+        QueueSink(0)
+    with pytest.raises(ValueError):
+        RingBufferSink(0)
+    with pytest.raises(ValueError):
+        RingBufferSink(4, 'drop_everything')
+
+
+@pytest.mark.parametrize('policy, kept', [('drop_oldest', [2, 3, 4, 5]), ('drop_newest', [0, 1, 2, 3])])
+def test_ring_buffer_drops(policy, kept):
+    sink = RingBufferSink(4, policy)
+    transport = _attached(sink)
+    for sequence in range(6):
+        sink.write(_Packet(sequence))
+    assert [packet.sequence for packet in sink.snapshot()] == kept
+    assert sink.dropped == 2
+    assert transport.reading
+
+
+def test_ring_buffer_blocks_until_half_empty():
+    sink = RingBufferSink(4, 'block')
+    transport = _attached(sink)
+    for sequence in range(4):
+        sink.write(_Packet(sequence))
+    assert not transport.reading
+
+    # already on its way through the pipeline, dropped like drop_newest
+    sink.write(_Packet(4))
+    assert sink.dropped == 1
+
+    sink.read()
+    assert not transport.reading
+    sink.read()
+    assert transport.reading and transport.pauses == 1
+    assert [packet.sequence for packet in sink.snapshot()] == [2, 3]
+
+
+def test_queue_blocks_and_resumes():
+    async def main():
+        sink = QueueSink(4, 'block')
+        transport = _attached(sink, asyncio.get_running_loop())
+        for sequence in range(4):
+            sink.write(_Packet(sequence))
+        assert not transport.reading
+
+        assert (await sink.get()).sequence == 0
+        assert not transport.reading
+        assert (await sink.get()).sequence == 1
+        assert transport.reading
+
+        sink.cleanup()
+        assert [packet.sequence async for packet in sink] == [2, 3]
+
+    asyncio.run(main())
+
+
+def test_queue_drops_oldest():
+    async def main():
+        sink = QueueSink(2)
+        _attached(sink, asyncio.get_running_loop())
+        for sequence in range(5):
+            sink.write(_Packet(sequence))
+        sink.cleanup()
+        assert [packet.sequence async for packet in sink] == [3, 4]
+        assert sink.dropped == 3
+
+    asyncio.run(main())
+
+
+def test_file_sink_keeps_time():
+    async def main():
+        directory = tempfile.mkdtemp()
+        sink = FileSink(os.path.join(directory, '{ssrc}.wav'))
+        _attached(sink, asyncio.get_running_loop())
+        sink.write(_Packet(0, samples=960))
+        sink.write(_Packet(1, decoded_data=b'\1\0' * 1920))
+        sink.cleanup()
+        await sink.wait_closed()
+
+        with wave.open(os.path.join(directory, '1.wav')) as file:
+            assert (file.getnchannels(), file.getframerate(), file.getnframes()) == (2, 48000, 1920)
+            assert file.readframes(960) == bytes(3840)
+
+    asyncio.run(main())
+
+
+def test_file_sink_writer_failing_lets_reading_go_on():
+    async def main():
+        # no such field to format the path with
+        sink = FileSink(os.path.join(tempfile.mkdtemp(), '{speaker}.wav'), maxsize=2, policy='block')
+        transport = _attached(sink, asyncio.get_running_loop())
+        for sequence in range(2):
+            sink.write(_Packet(sequence, decoded_data=bytes(3840)))
+        await asyncio.sleep(0.1)
+
+        assert isinstance(sink.failed, KeyError)
+        assert transport.reading
+        sink.write(_Packet(2, decoded_data=bytes(3840)))
+        assert sink.dropped >= 1 and not sink._frames
+        sink.cleanup()
+        await asyncio.wait_for(sink.wait_closed(), 1)
+
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+import asyncio
+import os
+import socket
+
+from ..benchmarks.rtp import encrypt_packet
+from ..sinks import QueueSink
+from ..voice_call import DMVoiceClient
+from .test_receive import MODE, _receive, _VoiceClient
+
+
+class _DMVoiceClient(_VoiceClient):
+    _reuse_socket = DMVoiceClient._reuse_socket
+
+
+def test_socket_reused_emptied():
+    client = _DMVoiceClient(None, os.urandom(32))
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender.sendto(b'left from the last server', client.socket.getsockname())
+    try:
+        assert client._reuse_socket()
+        assert client.socket.fileno() != -1
+        sender.sendto(b'the next one', client.socket.getsockname())
+        assert client.socket.recv(4096) == b'the next one'
+    finally:
+        sender.close()
+        client.socket.close()
+
+    # closed already, a new one it is
+    assert not client._reuse_socket()
+
+
+def test_new_server_while_listening():
+    async def main():
+        loop = asyncio.get_running_loop()
+        key = os.urandom(32)
+        client = _DMVoiceClient(loop, key)
+        sink = QueueSink()
+        listening = asyncio.ensure_future(client.listen(sink))
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            await asyncio.sleep(0.01)
+            old = client.socket.getsockname()
+
+            # what on_voice_server_update does
+            assert not client._reuse_socket()
+            assert client._receiver.transport._sock is None
+            # the old server's packets go nowhere now
+            sender.sendto(encrypt_packet(MODE, key, 1), old)
+            client.socket = client.new_socket()
+            # and connect_websocket, once the handshake is done
+            client._rebind_receiver()
+
+            sender.sendto(encrypt_packet(MODE, key, 2), client.socket.getsockname())
+            assert [packet.sequence for packet in await _receive(sink, 1)] == [2]
+        finally:
+            client.stop_listening()
+            await asyncio.wait_for(listening, 1)
+            sender.close()
+            client.socket.close()
+
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+import asyncio
+
+from ..voice_events import VoiceEventQueue
+
+
+class _Recorder:
+    """Handlers that log when they start and end, and wait for ``gate`` in between."""
+
+    def __init__(self):
+        self.log = []
+        self.running = 0
+        self.max_running = 0
+        self.gate = asyncio.Event()
+
+    def handler(self, name):
+        async def handle(data):
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            self.log.append(('start', name, data))
+            await self.gate.wait()
+            self.log.append(('end', name, data))
+            self.running -= 1
+
+        return handle
+
+
+async def _settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_one_voice_client_runs_in_order():
+    async def main():
+        queue = VoiceEventQueue()
+        recorder = _Recorder()
+        queue.submit('vc', 'server', recorder.handler('server'), 1, info='server')
+        queue.submit('vc', 'state', recorder.handler('state'), 2, info='state')
+        await _settle()
+        # the state update waits for the server update to finish
+        assert recorder.log == [('start', 'server', 1)]
+        assert queue.depth == 1
+
+        recorder.gate.set()
+        await _settle()
+        assert recorder.log == [('start', 'server', 1), ('end', 'server', 1), ('start', 'state', 2), ('end', 'state', 2)]
+        assert queue.completed == 2 and queue.depth == 0
+
+    asyncio.run(main())
+
+
+def test_newer_update_replaces_the_waiting_one():
+    async def main():
+        queue = VoiceEventQueue()
+        recorder = _Recorder()
+        queue.submit('vc', 'server', recorder.handler('server'), 1, info='server')
+        queue.submit('vc', 'state', recorder.handler('state'), 2, info='state')
+        queue.submit('vc', 'state', recorder.handler('state'), 3, info='state')
+        assert queue.coalesced == 1 and queue.depth == 1
+
+        recorder.gate.set()
+        await _settle()
+        assert [entry for entry in recorder.log if entry[0] == 'start'] == [('start', 'server', 1), ('start', 'state', 3)]
+
+    asyncio.run(main())
+
+
+def test_concurrency_cap():
+    async def main():
+        queue = VoiceEventQueue(concurrency=2)
+        recorder = _Recorder()
+        for index in range(5):
+            queue.submit(index, 'state', recorder.handler(index), index, info='state')
+        await _settle()
+        assert queue.running == 2 and queue.depth == 3
+
+        recorder.gate.set()
+        await _settle()
+        assert recorder.max_running == 2
+        assert queue.completed == 5 and queue.running == 0
+        # the voice clients took turns in the order they came
+        assert [entry[1] for entry in recorder.log if entry[0] == 'start'] == [0, 1, 2, 3, 4]
+
+    asyncio.run(main())
+
+
+def test_discard_drops_what_is_waiting():
+    async def main():
+        queue = VoiceEventQueue()
+        recorder = _Recorder()
+        queue.submit('vc', 'server', recorder.handler('server'), 1, info='server')
+        queue.submit('vc', 'state', recorder.handler('state'), 2, info='state')
+        queue.discard('vc')
+        assert queue.depth == 0
+
+        recorder.gate.set()
+        await _settle()
+        # what was running finished, the rest never ran
+        assert recorder.log == [('start', 'server', 1), ('end', 'server', 1)]
+        assert queue.depths() == {}
+
+    asyncio.run(main())
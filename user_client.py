@@ -5,6 +5,7 @@ use the UserClient class instead of discord.Client class when initializing for a
 """
 
 import logging
+from time import perf_counter_ns
 from typing import *
 
 from urllib.parse import quote as _uriquote
@@ -14,15 +15,27 @@ from discord.http import *
 from discord.user import ClientUser
 from discord.client import _loop
 
+from .cache import FetchCache
+from .http_metrics import HTTPMetrics
+from .prewarm import HTTPSettings, prewarm
+from .ratelimit import RequestScheduler
 
 _log = logging.getLogger(__name__)
 
 
 class NonBotHTTPClient(discord.http.HTTPClient):
-    """Copied the entire method, just to remove the 'bot' string from the token"""
+    """Copied the entire method, just to remove the 'bot' string from the token
+
+    And the requests wait their turn in ``scheduler`` (see the ``ratelimit`` module)
+    instead of going out and finding out about the rate limits from a 429.
+    """
     # learned something new : _className__privateVariable , then can access private variable !
 
-    # 
+    #: Set your own before the first request to change the global cap.
+    scheduler: Optional[RequestScheduler] = None
+    #: Set to an :class:`HTTPMetrics` to time every request, see the ``http_metrics`` module.
+    metrics: Optional[HTTPMetrics] = None
+
     async def request(
         self,
         route,
@@ -30,6 +43,30 @@ class NonBotHTTPClient(discord.http.HTTPClient):
         files: Optional[Sequence[File]] = None,
         form: Optional[Iterable[Dict[str, Any]]] = None,
         **kwargs: Any,
+    ) -> Any:
+        metrics = self.metrics
+        if metrics is None:
+            return await self._request(route, files=files, form=form, **kwargs)
+
+        trace = [None, 0]  # status of the last attempt, attempts
+        start = perf_counter_ns()
+        failed = True
+        try:
+            data = await self._request(route, files=files, form=form, _trace=trace, **kwargs)
+            failed = False
+            return data
+        finally:
+            metrics.request(route.key, trace[0], perf_counter_ns() - start, trace[1], failed)
+
+    # 
+    async def _request(
+        self,
+        route,
+        *,
+        files: Optional[Sequence[File]] = None,
+        form: Optional[Iterable[Dict[str, Any]]] = None,
+        _trace: Optional[list] = None,
+        **kwargs: Any,
     ) -> Any:
         method = route.method
         url = route.url
@@ -43,7 +80,8 @@ class NonBotHTTPClient(discord.http.HTTPClient):
         else:
             key = f'{bucket_hash}:{route.major_parameters}'
 
-        ratelimit = self.get_ratelimit(key)
+        scheduler = self._get_scheduler()
+        metrics = self.metrics
 
         # header creation
         headers: Dict[str, str] = {
@@ -74,171 +112,243 @@ class NonBotHTTPClient(discord.http.HTTPClient):
         if self.proxy_auth is not None:
             kwargs['proxy_auth'] = self.proxy_auth
 
-        if not self._global_over.is_set():
-            # wait until the global lock is complete
-            await self._global_over.wait()
-
         response: Optional[aiohttp.ClientResponse] = None
         data: Optional[Union[Dict[str, Any], str]] = None
-        async with ratelimit:
-            for tries in range(5):
-                if files:
-                    for f in files:
-                        f.reset(seek=tries)
-
-                if form:
-                    # with quote_fields=True '[' and ']' in file field names are escaped, which discord does not support
-                    form_data = aiohttp.FormData(quote_fields=False)
-                    for params in form:
-                        form_data.add_field(**params)
-                    kwargs['data'] = form_data
-
-                try:
-                    async with self._HTTPClient__session.request(method, url, **kwargs) as response: #type: ignore
-
-                        if response is None:
-                            raise RuntimeError("No response impossible wtf ?!!!!")
-                        
-                        _log.debug('%s %s with %s has returned %s', method, url, kwargs.get('data'), response.status)
-
-                        # even errors have text involved in them so this is safe to call
-                        data = await json_or_text(response)
-
-                        # Update and use rate limit information if the bucket header is present
-                        discord_hash = response.headers.get('X-Ratelimit-Bucket')
-                        # I am unsure if X-Ratelimit-Bucket is always available
-                        # However, X-Ratelimit-Remaining has been a consistent cornerstone that worked
-                        has_ratelimit_headers = 'X-Ratelimit-Remaining' in response.headers
-                        if discord_hash is not None:
-                            # If the hash Discord has provided is somehow different from our current hash something changed
-                            if bucket_hash != discord_hash:
-                                if bucket_hash is not None:
-                                    # If the previous hash was an actual Discord hash then this means the
-                                    # hash has changed sporadically.
-                                    # This can be due to two reasons
-                                    # 1. It's a sub-ratelimit which is hard to handle
-                                    # 2. The rate limit information genuinely changed
-                                    # There is no good way to discern these, Discord doesn't provide a way to do so.
-                                    # At best, there will be some form of logging to help catch it.
-                                    # Alternating sub-ratelimits means that the requests oscillate between
-                                    # different underlying rate limits -- this can lead to unexpected 429s
-                                    # It is unavoidable.
-                                    fmt = 'A route (%s) has changed hashes: %s -> %s.'
-                                    _log.debug(fmt, route_key, bucket_hash, discord_hash)
-
-                                    self._bucket_hashes[route_key] = discord_hash
-                                    recalculated_key = discord_hash + route.major_parameters
-                                    self._buckets[recalculated_key] = ratelimit
-                                    self._buckets.pop(key, None)
-                                elif route_key not in self._bucket_hashes:
-                                    fmt = '%s has found its initial rate limit bucket hash (%s).'
-                                    _log.debug(fmt, route_key, discord_hash)
-                                    self._bucket_hashes[route_key] = discord_hash
-                                    self._buckets[discord_hash + route.major_parameters] = ratelimit
-
-                        if has_ratelimit_headers:
-                            if response.status != 429:
-                                ratelimit.update(response, use_clock=self.use_clock)
-                                if ratelimit.remaining == 0:
-                                    _log.debug(
-                                        'A rate limit bucket (%s) has been exhausted. Pre-emptively rate limiting...',
-                                        discord_hash or route_key,
-                                    )
-
-                        # the request was successful so just return the text/json
-                        if 300 > response.status >= 200:
-                            _log.debug('%s %s has received %s', method, url, data)
-                            return data
-
-                        # we are being rate limited
-                        if response.status == 429:
-                            if not response.headers.get('Via') or isinstance(data, str):
-                                # Banned by Cloudflare more than likely.
-                                raise HTTPException(response, data)
-
-                            if ratelimit.remaining > 0:
-                                # According to night
-                                # https://github.com/discord/discord-api-docs/issues/2190#issuecomment-816363129
-                                # Remaining > 0 and 429 means that a sub ratelimit was hit.
-                                # It is unclear what should happen in these cases other than just using the retry_after
-                                # value in the body.
-                                _log.debug(
-                                    '%s %s received a 429 despite having %s remaining requests. This is a sub-ratelimit.',
-                                    method,
-                                    url,
-                                    ratelimit.remaining,
-                                )
-
-                            retry_after: float = data['retry_after']
-                            if self.max_ratelimit_timeout and retry_after > self.max_ratelimit_timeout:
-                                _log.warning(
-                                    'We are being rate limited. %s %s responded with 429. Timeout of %.2f was too long, erroring instead.',
-                                    method,
-                                    url,
-                                    retry_after,
-                                )
-                                raise RateLimited(retry_after)
-
-                            fmt = 'We are being rate limited. %s %s responded with 429. Retrying in %.2f seconds.'
-                            _log.warning(fmt, method, url, retry_after)
+        backoff = 0.0
+        status: Optional[int] = None  # of the last attempt
+        for tries in range(5):
+            if tries and metrics is not None:
+                metrics.retry(route_key, tries, status)
+            if _trace is not None:
+                _trace[1] = tries + 1
+            status = None
+
+            if backoff:
+                # not holding a place in the bucket meanwhile
+                started = perf_counter_ns()
+                await asyncio.sleep(backoff)
+                backoff = 0.0
+                if metrics is not None:
+                    metrics.phase(route_key, 'retry_sleep', perf_counter_ns() - started)
+
+            if files:
+                for f in files:
+                    f.reset(seek=tries)
+
+            if form:
+                # with quote_fields=True '[' and ']' in file field names are escaped, which discord does not support
+                form_data = aiohttp.FormData(quote_fields=False)
+                for params in form:
+                    form_data.add_field(**params)
+                kwargs['data'] = form_data
+
+            # waits for room in the bucket, and under the global cap
+            queued = await scheduler.acquire(key, max_wait=self.max_ratelimit_timeout)
+            if queued:
+                _log.debug('%s %s waited %.2f seconds for its rate limit bucket (%s).', method, url, queued, key)
+            if metrics is not None:
+                metrics.phase(route_key, 'queue', int(queued * 1e9))
+
+            # what the scheduler learns from this attempt
+            response_headers = None
+            retry_after: Optional[float] = None
+            is_global = False
+            try:
+                started = perf_counter_ns()
+                async with self._HTTPClient__session.request(method, url, **kwargs) as response: #type: ignore
+
+                    if response is None:
+                        raise RuntimeError("No response impossible wtf ?!!!!")
+                    
+                    _log.debug('%s %s with %s has returned %s', method, url, kwargs.get('data'), response.status)
+                    status = response.status
+                    if _trace is not None:
+                        _trace[0] = status
+                    if metrics is not None:
+                        now = perf_counter_ns()
+                        metrics.phase(route_key, 'network', now - started)
+                        started = now
+
+                    # even errors have text involved in them so this is safe to call
+                    data = await json_or_text(response)
+                    if metrics is not None:
+                        metrics.phase(route_key, 'parse', perf_counter_ns() - started)
+
+                    # Update and use rate limit information if the bucket header is present
+                    discord_hash = response.headers.get('X-Ratelimit-Bucket')
+                    # I am unsure if X-Ratelimit-Bucket is always available
+                    # However, X-Ratelimit-Remaining has been a consistent cornerstone that worked
+                    has_ratelimit_headers = 'X-Ratelimit-Remaining' in response.headers
+                    if discord_hash is not None:
+                        # If the hash Discord has provided is somehow different from our current hash something changed
+                        if bucket_hash != discord_hash:
+                            if bucket_hash is not None:
+                                # If the previous hash was an actual Discord hash then this means the
+                                # hash has changed sporadically.
+                                # This can be due to two reasons
+                                # 1. It's a sub-ratelimit which is hard to handle
+                                # 2. The rate limit information genuinely changed
+                                # There is no good way to discern these, Discord doesn't provide a way to do so.
+                                # At best, there will be some form of logging to help catch it.
+                                # Alternating sub-ratelimits means that the requests oscillate between
+                                # different underlying rate limits -- this can lead to unexpected 429s
+                                # It is unavoidable.
+                                fmt = 'A route (%s) has changed hashes: %s -> %s.'
+                                _log.debug(fmt, route_key, bucket_hash, discord_hash)
+                                if metrics is not None:
+                                    metrics.hash_changed(route_key, bucket_hash, discord_hash)
+                            elif route_key in self._bucket_hashes:
+                                # another request found it first
+                                discord_hash = bucket_hash = self._bucket_hashes[route_key]
+                            else:
+                                fmt = '%s has found its initial rate limit bucket hash (%s).'
+                                _log.debug(fmt, route_key, discord_hash)
+                                if metrics is not None:
+                                    metrics.hash_found(route_key)
 
+                            if bucket_hash != discord_hash:
+                                self._bucket_hashes[route_key] = bucket_hash = discord_hash
+                                new_key = f'{discord_hash}:{route.major_parameters}'
+                                scheduler.rename(key, new_key)
+                                key = new_key
+
+                    if has_ratelimit_headers and response.status != 429:
+                        response_headers = response.headers
+                        if response.headers['X-Ratelimit-Remaining'] == '0':
                             _log.debug(
-                                'Rate limit is being handled by bucket hash %s with %r major parameters',
-                                bucket_hash,
-                                route.major_parameters,
+                                'A rate limit bucket (%s) has been exhausted. Pre-emptively rate limiting...',
+                                discord_hash or route_key,
                             )
 
-                            # check if it's a global rate limit
-                            is_global = data.get('global', False)
-                            if is_global:
-                                _log.warning('Global rate limit has been hit. Retrying in %.2f seconds.', retry_after)
-                                self._global_over.clear()
-
-                            await asyncio.sleep(retry_after)
-                            _log.debug('Done sleeping for the rate limit. Retrying...')
-
-                            # release the global lock now that the
-                            # global rate limit has passed
-                            if is_global:
-                                self._global_over.set()
-                                _log.debug('Global rate limit is now over.')
-
-                            continue
-
-                        # we've received a 500, 502, 504, or 524, unconditional retry
-                        if response.status in {500, 502, 504, 524}:
-                            await asyncio.sleep(1 + tries * 2)
-                            continue
-
-                        # the usual error cases
-                        if response.status == 403:
-                            raise Forbidden(response, data)
-                        elif response.status == 404:
-                            raise NotFound(response, data)
-                        elif response.status >= 500:
-                            raise DiscordServerError(response, data)
-                        else:
+                    # the request was successful so just return the text/json
+                    if 300 > response.status >= 200:
+                        _log.debug('%s %s has received %s', method, url, data)
+                        return data
+
+                    # we are being rate limited
+                    if response.status == 429:
+                        if not response.headers.get('Via') or isinstance(data, str):
+                            # Banned by Cloudflare more than likely.
+                            if metrics is not None:
+                                metrics.rate_limited(route_key, 'cloudflare')
                             raise HTTPException(response, data)
 
-                # This is handling exceptions from the request
-                except OSError as e:
-                    # Connection reset by peer
-                    if tries < 4 and e.errno in (54, 10054):
-                        await asyncio.sleep(1 + tries * 2)
-                        continue
-                    raise
+                        if has_ratelimit_headers and response.headers['X-Ratelimit-Remaining'] != '0':
+                            # According to night
+                            # https://github.com/discord/discord-api-docs/issues/2190#issuecomment-816363129
+                            # Remaining > 0 and 429 means that a sub ratelimit was hit.
+                            # It is unclear what should happen in these cases other than just using the retry_after
+                            # value in the body.
+                            _log.debug(
+                                '%s %s received a 429 despite having %s remaining requests. This is a sub-ratelimit.',
+                                method,
+                                url,
+                                response.headers['X-Ratelimit-Remaining'],
+                            )
 
-            if response is not None:
-                # We've run out of retries, raise.
-                if response.status >= 500:
-                    raise DiscordServerError(response, data)
+                        retry_after = data['retry_after']
+                        if metrics is not None:
+                            if data.get('global', False):
+                                kind = 'global'
+                            elif has_ratelimit_headers and response.headers['X-Ratelimit-Remaining'] != '0':
+                                kind = 'sub'
+                            else:
+                                kind = 'bucket'
+                            metrics.rate_limited(route_key, kind, retry_after)
+                        if self.max_ratelimit_timeout and retry_after > self.max_ratelimit_timeout:
+                            _log.warning(
+                                'We are being rate limited. %s %s responded with 429. Timeout of %.2f was too long, erroring instead.',
+                                method,
+                                url,
+                                retry_after,
+                            )
+                            raise RateLimited(retry_after)
+
+                        fmt = 'We are being rate limited. %s %s responded with 429. Retrying in %.2f seconds.'
+                        _log.warning(fmt, method, url, retry_after)
 
-                raise HTTPException(response, data)
+                        _log.debug(
+                            'Rate limit is being handled by bucket hash %s with %r major parameters',
+                            bucket_hash,
+                            route.major_parameters,
+                        )
 
-            raise RuntimeError('Unreachable code in HTTP handling')
+                        # check if it's a global rate limit
+                        is_global = data.get('global', False)
+                        if is_global:
+                            _log.warning('Global rate limit has been hit. Retrying in %.2f seconds.', retry_after)
+
+                        # the scheduler holds this bucket (or everything, if global) back until it's over
+                        continue
+
+                    # we've received a 500, 502, 504, or 524, unconditional retry
+                    if response.status in {500, 502, 504, 524}:
+                        backoff = 1 + tries * 2
+                        continue
+
+                    # the usual error cases
+                    if response.status == 403:
+                        raise Forbidden(response, data)
+                    elif response.status == 404:
+                        raise NotFound(response, data)
+                    elif response.status >= 500:
+                        raise DiscordServerError(response, data)
+                    else:
+                        raise HTTPException(response, data)
+
+            # This is handling exceptions from the request
+            except OSError as e:
+                # Connection reset by peer
+                if tries < 4 and e.errno in (54, 10054):
+                    backoff = 1 + tries * 2
+                    continue
+                raise
+            finally:
+                scheduler.release(key, response_headers, retry_after=retry_after, is_global=is_global, use_clock=self.use_clock)
+
+        if response is not None:
+            # We've run out of retries, raise.
+            if response.status >= 500:
+                raise DiscordServerError(response, data)
+
+            raise HTTPException(response, data)
+
+        raise RuntimeError('Unreachable code in HTTP handling')
+
+    def _get_scheduler(self) -> RequestScheduler:
+        if self.scheduler is None:
+            self.scheduler = RequestScheduler()
+        return self.scheduler
 
 class UserClient(discord.Client):
-    """Just gotta remove the getapplication info part and not make it error"""
+    """Just gotta remove the getapplication info part and not make it error
+
+    Also caches what ``fetch_channel`` and ``fetch_user`` get, see the ``cache`` module.
+    Pass ``fetch_cache=FetchCache(...)`` to configure it, ``FetchCache(maxsize=0)`` only shares the requests in flight.
+
+    ``http_settings=HTTPSettings(...)`` tunes the HTTP connector and opens connections at login, see the ``prewarm`` module.
+    (a ``connector`` passed in is kept, it only gets prewarmed)
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        fetch_cache: Optional[FetchCache] = None,
+        http_settings: Optional[HTTPSettings] = None,
+        **options: Any,
+    ) -> None:
+        super().__init__(*args, **options)
+        self.fetch_cache = fetch_cache if fetch_cache is not None else FetchCache()
+        self.fetch_cache.watch(self._connection)
+        self.http_settings = http_settings
+        #: seconds the prewarm (and connections it opened) and the login request took, filled in by login
+        self.login_timings: Dict[str, float] = {}
+
+    async def fetch_channel(self, channel_id: int, /):
+        return await self.fetch_cache.fetch(('channel', channel_id), lambda: super(UserClient, self).fetch_channel(channel_id))
+
+    async def fetch_user(self, user_id: int, /):
+        return await self.fetch_cache.fetch(('user', user_id), lambda: super(UserClient, self).fetch_user(user_id))
 
     async def login(self, token: str, bot = False) -> None:
         
@@ -251,7 +361,26 @@ class UserClient(discord.Client):
             raise TypeError(f'expected token to be a str, received {token.__class__.__name__} instead')
         token = token.strip()
 
+        settings = self.http_settings
+        if settings is not None:
+            if self.http.connector is discord.utils.MISSING:
+                self.http.connector = settings.connector()
+            if settings.prewarm:
+                start = perf_counter_ns()
+                opened = await prewarm(
+                    self.http.connector,
+                    settings.prewarm,
+                    timeout=settings.prewarm_timeout,
+                    proxy=self.http.proxy,
+                    proxy_auth=self.http.proxy_auth,
+                )
+                self.login_timings['prewarm'] = (perf_counter_ns() - start) / 1e9
+                self.login_timings['prewarmed'] = opened
+
+        start = perf_counter_ns()
         data = await self.http.static_login(token)
+        self.login_timings['first_request'] = (perf_counter_ns() - start) / 1e9
+        _log.info('Login request took %.1fms, timings: %s', self.login_timings['first_request'] * 1e3, self.login_timings)
         self._connection.user = ClientUser(state=self._connection, data=data)
 
         if bot: # here
@@ -265,4 +394,8 @@ class UserClient(discord.Client):
         await self.setup_hook()
 
 def apply():
-    discord.http.HTTPClient.request= HTTPClient.request # type: ignore
+    discord.http.HTTPClient.request = NonBotHTTPClient.request # type: ignore
+    discord.http.HTTPClient._request = NonBotHTTPClient._request # type: ignore
+    discord.http.HTTPClient.metrics = None # type: ignore
+    discord.http.HTTPClient.scheduler = None # type: ignore
+    discord.http.HTTPClient._get_scheduler = NonBotHTTPClient._get_scheduler # type: ignore
@@ -1,23 +1,37 @@
 """
 Enable joining of voice call in DMs, only works for non-bot users of course.
+
+Connecting is timed phase by phase, in ``vc.timings`` (seconds since ``connect`` was called) :
+``voice_state_sent``, ``voice_state``, ``server_update``, ``ip_discovery``, ``ws_ready``
+and ``first_packet`` (if listening).
 """
 
-import discord
 import asyncio
+import discord
 import logging
 
 from typing import *
-from discord.state import logging_coroutine
 import discord.utils as utils
 from discord.utils import MISSING
 import socket
+import struct
+from time import perf_counter
+
+from .calls import CallStore
+from .voice_events import VoiceEventQueue
 
 _log = logging.getLogger(__name__)
 
+IP_DISCOVERY_RESPONSE = b'\x00\x02'  # type of the packet, RTP ones start with 0x80 or 0x90
+
 
 if TYPE_CHECKING:
     from discord.types.gateway import VoiceStateUpdateEvent, VoiceServerUpdateEvent
 
+# the originals, the modded ones call them
+_clear = discord.state.ConnectionState.clear
+_remove_voice_client = discord.state.ConnectionState._remove_voice_client
+
 
 def get_vc_id(data : Any) -> int:
     """Helper function for obtaining a unique id for different voice clients, BOTH VOICE CALL AND GUILD VOICE CHANNELS
@@ -26,14 +40,44 @@ def get_vc_id(data : Any) -> int:
 
 
 class ModdedConnectionState(discord.state.ConnectionState):
-    """We wanna also listen to voice call stuff."""
+    """We wanna also listen to voice call stuff.
+
+    And keep track of the calls going on in ``client.calls`` (see the ``calls`` module).
+    The voice clients' handlers go through ``client.voice_events`` (see the ``voice_events`` module).
+    """
+    def _get_calls(self) -> CallStore:
+        calls = getattr(self, '_call_store', None)
+        if calls is None:
+            calls = self._call_store = CallStore()
+        return calls
+
+    def _get_voice_events(self) -> VoiceEventQueue:
+        events = getattr(self, '_voice_event_queue', None)
+        if events is None:
+            events = self._voice_event_queue = VoiceEventQueue()
+        return events
+
+    def _remove_voice_client(self, guild_id: int) -> None:
+        # its cleanup, handlers still waiting would run on a voice client that's gone
+        vc = self._voice_clients.get(guild_id)
+        _remove_voice_client(self, guild_id)
+        events = getattr(self, '_voice_event_queue', None)
+        if vc is not None and events is not None:
+            events.discard(vc)
+
+    def clear(self, *, views: bool = True) -> None:
+        _clear(self, views=views)
+        # on READY the calls get sent again, as CALL_CREATEs
+        calls = getattr(self, '_call_store', None)
+        if calls is not None:
+            calls.clear()
+
     def parse_voice_server_update(self, data: 'VoiceServerUpdateEvent') -> None:
         key_id = get_vc_id(data)
 
         vc = self._get_voice_client(key_id)
         if vc is not None:
-            coro = vc.on_voice_server_update(data)
-            asyncio.create_task(logging_coroutine(coro, info='Voice Protocol voice server update handler'))
+            self._get_voice_events().submit(vc, 'server', vc.on_voice_server_update, data, info='Voice Protocol voice server update handler')
 
     def parse_voice_state_update(self, data: 'VoiceStateUpdateEvent') -> None:
         guild = self._get_guild(utils._get_as_snowflake(data, 'guild_id'))
@@ -46,8 +90,7 @@ class ModdedConnectionState(discord.state.ConnectionState):
             if int(data['user_id']) == self_id:
                 voice = self._get_voice_client(guild.id)
                 if voice is not None:
-                    coro = voice.on_voice_state_update(data)
-                    asyncio.create_task(logging_coroutine(coro, info='Voice Protocol voice state update handler'))
+                    self._get_voice_events().submit(voice, 'state', voice.on_voice_state_update, data, info='Voice Protocol voice state update handler')
 
             member, before, after = guild._update_voice_state(data, channel_id)  # type: ignore
             if member is not None:
@@ -66,20 +109,23 @@ class ModdedConnectionState(discord.state.ConnectionState):
             if int(data['user_id']) == self_id:
                 voice = self._get_voice_client(channel_id)
                 if voice is not None:
-                    coro = voice.on_voice_state_update(data)
-                    asyncio.create_task(logging_coroutine(coro, info='Voice Protocol voice state update handler'))
-            
+                    self._get_voice_events().submit(voice, 'state', voice.on_voice_state_update, data, info='Voice Protocol voice state update handler')
+
+            self._get_calls().voice_state_update(data)
             # trigger our event ( with a different name )
             self.dispatch('voice_call_state_update', data)
 
     # Calling !!!!!!
     def parse_call_create(self, data) -> None:
+        self._get_calls().call_create(data)
         self.dispatch('call_create', data)
 
     def parse_call_update(self, data) -> None:
+        self._get_calls().call_update(data)
         self.dispatch('call_update', data)
 
     def parse_call_delete(self, data) -> None:
+        self._get_calls().call_delete(data)
         self.dispatch('call_delete', data)
 
 
@@ -92,6 +138,59 @@ class DMVoiceClient(discord.VoiceClient):
     """
     channel : 'DMVoiceChannel'
 
+    #: seconds from ``connect`` to every phase of it, see the module docstring
+    timings: Optional[Dict[str, float]] = None
+    _connect_started = 0.0
+
+    def _connect_phase(self, phase: str) -> None:
+        if self.timings is not None and phase not in self.timings:
+            self.timings[phase] = perf_counter() - self._connect_started
+
+    async def connect(self, *, reconnect: bool, timeout: float, self_deaf: bool = False, self_mute: bool = False) -> None:
+        self.timings = {}
+        self._connect_started = perf_counter()
+        await super().connect(reconnect=reconnect, timeout=timeout, self_deaf=self_deaf, self_mute=self_mute)
+        _log.info('Connected to the call in %.1fms : %s', self.timings.get('ws_ready', 0.0) * 1e3, self.timings)
+
+    async def potential_reconnect(self) -> bool:
+        # timed from the server update on, that's when it starts over
+        self.timings = {}
+        self._connect_started = perf_counter()
+        return await super().potential_reconnect()
+
+    async def connect_websocket(self) -> discord.gateway.DiscordVoiceWebSocket:
+        ws = await super().connect_websocket()
+        self._connect_phase('ws_ready')
+        return ws
+
+    async def on_voice_state_update(self, data: dict) -> None:
+        if self._handshaking:
+            self._connect_phase('voice_state')
+        await super().on_voice_state_update(data)
+
+    def _reuse_socket(self) -> bool:
+        """Keeps the socket of the last server if it's open and nothing's listening on it, emptied of what it still had."""
+        sock = getattr(self, 'socket', MISSING)
+        if not sock or sock.fileno() == -1:
+            return False
+        receiver = getattr(self, '_receiver', None)
+        if receiver is not None:
+            # the listener reads it, IP discovery would fight it for the reply. Its dup of it goes too,
+            # it reads nothing until connect_websocket hands it the new one (see _rebind_receiver)
+            if receiver.transport is not None:
+                receiver.transport.rebind(None)
+            sock.close()
+            return False
+        try:
+            while sock.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            sock.close()
+            return False
+        return True
+
     async def on_voice_server_update(self, data: dict) -> None:
         """Whole thing just to set the server id correctly"""
         # await super().on_voice_server_update(data)
@@ -124,11 +223,14 @@ class DMVoiceClient(discord.VoiceClient):
             # Just in case, strip it off since we're going to add it later
             self.endpoint: str = self.endpoint[6:]
 
+        self._connect_phase('server_update')
+
         # This gets set later
         self.endpoint_ip = MISSING
 
-        self.socket: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.socket.setblocking(False)
+        if not self._reuse_socket():
+            self.socket: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socket.setblocking(False)
 
         if not self._handshaking:
             # If we're not handshaking then we need to terminate our previous connection in the websocket
@@ -158,6 +260,7 @@ class DMVoiceClient(discord.VoiceClient):
     
     async def voice_connect(self, self_deaf: bool = False, self_mute: bool = False) -> None:
         await self.change_voice_state(channel=self.channel, self_deaf=self_deaf, self_mute=self_mute)
+        self._connect_phase('voice_state_sent')
 
     async def voice_disconnect(self) -> None:
         await self.change_voice_state(channel=None)
@@ -204,7 +307,63 @@ class GroupChatVoiceChannel(discord.channel.GroupChannel, discord.abc.Connectabl
         return vc
     
 
+async def initial_connection(self: discord.gateway.DiscordVoiceWebSocket, data: Dict[str, Any]) -> None:
+    """Same as the original, except what the socket still gets from the last server (when it's reused) is skipped,
+    the discovery reply is the one 74 byte packet of its type. And it's timed."""
+    state = self._connection
+    state.ssrc = data['ssrc']
+    state.voice_port = data['port']
+    state.endpoint_ip = data['ip']
+
+    packet = bytearray(74)
+    struct.pack_into('>H', packet, 0, 1)  # 1 = Send
+    struct.pack_into('>H', packet, 2, 70)  # 70 = Length
+    struct.pack_into('>I', packet, 4, state.ssrc)
+    state.socket.sendto(packet, (state.endpoint_ip, state.voice_port))
+    while True:
+        recv = await self.loop.sock_recv(state.socket, 4096)
+        if len(recv) == 74 and recv[:2] == IP_DISCOVERY_RESPONSE:
+            break
+        _log.debug('Skipping a %d byte packet waiting for the IP discovery reply.', len(recv))
+    _log.debug('received packet in initial_connection: %s', recv)
+
+    # the ip is ascii starting at the 8th byte and ending at the first null
+    ip_start = 8
+    ip_end = recv.index(0, ip_start)
+    state.ip = recv[ip_start:ip_end].decode('ascii')
+
+    state.port = struct.unpack_from('>H', recv, len(recv) - 2)[0]
+    _log.debug('detected ip: %s port: %s', state.ip, state.port)
+    if getattr(state, 'timings', None) is not None:
+        state._connect_phase('ip_discovery')
+
+    # there *should* always be at least one supported mode (xsalsa20_poly1305)
+    modes = [mode for mode in data['modes'] if mode in self._connection.supported_modes]
+    _log.debug('received supported encryption modes: %s', ", ".join(modes))
+
+    mode = modes[0]
+    await self.select_protocol(state.ip, state.port, mode)
+    _log.debug('selected the voice protocol for use (%s)', mode)
+
+
+def _calls(client: discord.Client) -> CallStore:
+    """The calls going on, see the ``calls`` module."""
+    return client._connection._get_calls()
+
+
+def _voice_events(client: discord.Client) -> VoiceEventQueue:
+    """The voice clients' event handler queues, see the ``voice_events`` module."""
+    return client._connection._get_voice_events()
+
+
 def apply():
+    discord.gateway.DiscordVoiceWebSocket.initial_connection = initial_connection  # type: ignore
+    discord.Client.calls = property(_calls)  # type: ignore
+    discord.Client.voice_events = property(_voice_events)  # type: ignore
+    discord.state.ConnectionState._get_calls = ModdedConnectionState._get_calls  # type: ignore
+    discord.state.ConnectionState._get_voice_events = ModdedConnectionState._get_voice_events  # type: ignore
+    discord.state.ConnectionState._remove_voice_client = ModdedConnectionState._remove_voice_client  # type: ignore
+    discord.state.ConnectionState.clear = ModdedConnectionState.clear  # type: ignore
     discord.channel.DMChannel = DMVoiceChannel
     discord.channel.GroupChannel = GroupChatVoiceChannel
 
@@ -0,0 +1,132 @@
+"""
+Running the voice clients' gateway event handlers in order, a few at a time.
+
+Every voice server / voice state update used to get a task of its own, so a reconnect storm over
+many calls piled up tasks and two updates of the same call could run out of order. Now
+every voice client has a queue, its handlers run one after the other, and a newer update
+of the same kind replaces the one still waiting (only the latest voice state matters). On
+top of that only ``concurrency`` handlers run at once, the voice clients take turns.
+"""
+
+import asyncio
+import collections
+import logging
+from time import perf_counter_ns
+from typing import Any, Callable, Coroutine, Deque, Dict, Hashable, Set, Tuple
+
+from discord.state import logging_coroutine
+
+from .metrics import Histogram
+
+
+_log = logging.getLogger(__name__)
+
+Handler = Callable[[Any], Coroutine[Any, Any, Any]]
+
+
+class VoiceEventQueue:
+    """Per voice client queues of event handlers, serialized, coalesced and capped.
+
+    Parameters
+    ----------
+    concurrency: :class:`int`
+        Handlers running at once at most, over all the voice clients. Can be changed on the fly.
+    """
+
+    def __init__(self, *, concurrency: int = 16):
+        self.concurrency = concurrency
+
+        # key -> kind -> (handler, data, info, when it was submitted), in the order they came
+        self._pending: Dict[Hashable, 'collections.OrderedDict[str, Tuple[Handler, Any, str, int]]'] = {}
+        self._ready: Deque[Hashable] = collections.deque()  # keys with something pending and nothing running, waiting for a slot
+        self._scheduled: Set[Hashable] = set()  # keys either ready or running
+        self._tasks: Set[asyncio.Task] = set()
+        self._depth = 0
+
+        self.submitted = 0
+        self.coalesced = 0  # updates replaced by a newer one before they ran
+        self.completed = 0
+        self.max_depth = 0
+        self.wait = Histogram()  # submitted to started, nanoseconds
+
+    def __repr__(self):
+        return f'<VoiceEventQueue depth={self._depth} running={len(self._tasks)} concurrency={self.concurrency}>'
+
+    @property
+    def depth(self) -> int:
+        """Handlers waiting, over all the voice clients."""
+        return self._depth
+
+    @property
+    def running(self) -> int:
+        return len(self._tasks)
+
+    def depths(self) -> Dict[Hashable, int]:
+        """Handlers waiting per voice client key."""
+        return {key: len(pending) for key, pending in self._pending.items()}
+
+    def submit(self, key: Hashable, kind: str, handler: Handler, data: Any, *, info: str) -> None:
+        """Queues ``handler(data)`` for the voice client ``key``, replacing its ``kind`` update that hasn't run yet."""
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = collections.OrderedDict()
+        if pending.pop(kind, None) is not None:
+            self.coalesced += 1
+            self._depth -= 1
+        # runs where the newest one came, after what came before it
+        pending[kind] = (handler, data, info, perf_counter_ns())
+        self.submitted += 1
+        self._depth += 1
+        if self._depth > self.max_depth:
+            self.max_depth = self._depth
+
+        if key not in self._scheduled:
+            self._scheduled.add(key)
+            self._ready.append(key)
+        self._pump()
+
+    def discard(self, key: Hashable) -> None:
+        """Drops what's waiting for ``key``, what's running finishes."""
+        pending = self._pending.pop(key, None)
+        if pending is not None:
+            self._depth -= len(pending)
+
+    def _pump(self) -> None:
+        ready = self._ready
+        while ready and len(self._tasks) < self.concurrency:
+            key = ready.popleft()
+            pending = self._pending.get(key)
+            if not pending:
+                # discarded while it waited
+                self._scheduled.discard(key)
+                continue
+            _, (handler, data, info, submitted) = pending.popitem(last=False)
+            if not pending:
+                del self._pending[key]
+            self._depth -= 1
+            self.wait.record(perf_counter_ns() - submitted)
+
+            task = asyncio.create_task(logging_coroutine(handler(data), info=info))
+            self._tasks.add(task)
+            task.add_done_callback(lambda task, key=key: self._done(task, key))
+
+    def _done(self, task: asyncio.Task, key: Hashable) -> None:
+        self._tasks.discard(task)
+        self.completed += 1
+        if key in self._pending:
+            # its turn again, after the others waiting
+            self._ready.append(key)
+        else:
+            self._scheduled.discard(key)
+        self._pump()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'depth': self._depth,
+            'max_depth': self.max_depth,
+            'running': len(self._tasks),
+            'submitted': self.submitted,
+            'coalesced': self.coalesced,
+            'completed': self.completed,
+            'wait': self.wait.snapshot(),
+        }